@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+"""
+_command_startup_
+
+Start up latency benchmark for the cirrus commands.
+
+Reads the [commands] section of cirrus.conf and, for each command,
+runs its entry point in a fresh interpreter against a throwaway git
+repo fixture, measuring:
+
+ - cold wall clock time, with an empty bytecode cache
+ - warm wall clock time, median of repeated runs
+ - import time, from python -X importtime
+ - peak RSS of the command process
+
+for both -h and a representative no-op invocation of the command.
+Everything runs offline with a temporary HOME, gitconfig and cirrus
+runtime dir, using the cirrus source in this checkout.
+
+Usage:
+
+python benchmarks/command_startup.py run -o results.json
+python benchmarks/command_startup.py compare base.json results.json
+
+compare exits with status 1 if any measurement regressed by more than
+the threshold.
+
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import configparser
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_DIR, 'src')
+
+#
+# args for a representative offline no-op run of each command,
+# None for commands that have no offline no-op path, which are
+# only measured with -h
+#
+NOOP_ARGS = {
+    'cirrus': [],
+    'hello': [],
+    'release': [],
+    'feature': [],
+    'review': [],
+    'docs': [],
+    'package': [],
+    'qc': ['--only-changes'],
+    'deploy': [],
+    'docker-image': ['test'],
+    'server': ['status'],
+    'build': None,
+    'test': None,
+    'prestage': None,
+    'plusone': None,
+    'selfupdate': None,
+    'selfsetup': None,
+}
+
+#
+# run the entry point the same way the console script would,
+# with the entry point standing in for the script as argv[0]
+#
+LAUNCHER = (
+    "import sys, importlib\n"
+    "module, attr = sys.argv[1].split(':')\n"
+    "func = importlib.import_module(module)\n"
+    "for name in attr.split('.'):\n"
+    "    func = getattr(func, name)\n"
+    "sys.argv = [sys.argv[1]] + sys.argv[2:]\n"
+    "sys.exit(func())\n"
+)
+
+FIXTURE_CONFIG = """
+[package]
+name = benchmark
+version = 0.0.1
+description = cirrus benchmark fixture
+organization = cirrus
+version_file = src/benchmark/__init__.py
+
+[gitflow]
+develop_branch = develop
+release_branch_prefix = release/
+feature_branch_prefix = feature/
+
+[github]
+api_base = http://localhost:9
+
+[commands]
+""".lstrip()
+
+FIXTURE_GITCONFIG = """
+[user]
+    name = Cirrus Benchmark
+    email = benchmark@example.com
+[cirrus]
+    credential-plugin = default
+    github-user = benchmark
+    github-token = not-a-token
+""".lstrip()
+
+
+def command_entry_points():
+    """read the [commands] section of cirrus.conf"""
+    parser = configparser.RawConfigParser()
+    parser.read(os.path.join(REPO_DIR, 'cirrus.conf'))
+    return dict(
+        (name, value.strip()) for name, value in parser.items('commands')
+    )
+
+
+class Fixture(object):
+    """
+    _Fixture_
+
+    Throwaway HOME and git repo with a cirrus.conf for the
+    commands to run against, removed on exit
+
+    """
+    def __init__(self):
+        self.dir = None
+        self.home = None
+        self.repo = None
+        self.env = None
+
+    def __enter__(self):
+        self.dir = tempfile.mkdtemp(prefix='cirrus-bench-')
+        self.home = os.path.join(self.dir, 'home')
+        self.repo = os.path.join(self.dir, 'repo')
+        runtime = os.path.join(self.dir, 'runtime')
+        os.makedirs(self.home)
+        os.makedirs(os.path.join(self.repo, 'src', 'benchmark'))
+        os.makedirs(runtime, 0o700)
+        with open(os.path.join(self.home, '.gitconfig'), 'w') as handle:
+            handle.write(FIXTURE_GITCONFIG)
+        with open(os.path.join(self.repo, 'cirrus.conf'), 'w') as handle:
+            handle.write(FIXTURE_CONFIG)
+        version_file = os.path.join(
+            self.repo, 'src', 'benchmark', '__init__.py'
+        )
+        with open(version_file, 'w') as handle:
+            handle.write('__version__ = "0.0.1"\n')
+
+        self.env = {
+            'PATH': os.environ.get('PATH', '/usr/bin:/bin'),
+            'HOME': self.home,
+            'USER': 'benchmark',
+            'LANG': os.environ.get('LANG', 'C.UTF-8'),
+            'GIT_CONFIG_NOSYSTEM': '1',
+            'PYTHONPATH': SRC_DIR,
+            'CIRRUS_HOME': self.dir,
+            'VIRTUALENV_HOME': sys.prefix,
+            'CIRRUS_RUNTIME_DIR': runtime,
+            'CIRRUS_SERVER_SOCK': os.path.join(runtime, 'no-server.sock'),
+        }
+        for args in (
+                ['init', '-q'],
+                ['add', '-A'],
+                ['commit', '-q', '-m', 'initial'],
+                ['branch', '-M', 'master'],
+                ['branch', 'develop']):
+            subprocess.check_call(
+                ['git'] + args,
+                cwd=self.repo,
+                env=self.env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        return self
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def run_once(fixture, entry_point, args, pycache, importtime=False):
+    """
+    run the entry point once in a new interpreter
+
+    :returns: dict with wall clock time, exit code, max rss and
+      the -X importtime output if requested
+    """
+    command = [sys.executable]
+    if importtime:
+        command.extend(['-X', 'importtime'])
+    command.extend(['-c', LAUNCHER, entry_point])
+    command.extend(args)
+    env = dict(fixture.env, PYTHONPYCACHEPREFIX=pycache)
+    stderr = tempfile.TemporaryFile()
+    with open(os.devnull, 'r+') as devnull, stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            cwd=fixture.repo,
+            env=env,
+            stdin=devnull,
+            stdout=devnull,
+            stderr=stderr
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+        stderr.seek(0)
+        errors = stderr.read().decode('utf-8', 'replace')
+    return {
+        'seconds': elapsed,
+        'exit_code': process.returncode,
+        'max_rss_kb': usage.ru_maxrss,
+        'stderr': errors
+    }
+
+
+def parse_importtime(output, top=10):
+    """
+    parse -X importtime output
+
+    :returns: total import time in us and the slowest top level
+      imports as (name, cumulative us) pairs
+    """
+    toplevel = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        if name.startswith('  '):
+            # nested import, counted in its parents cumulative time
+            continue
+        toplevel.append((name.strip(), int(cumulative)))
+    total = sum(us for _, us in toplevel)
+    slowest = sorted(toplevel, key=lambda item: item[1], reverse=True)
+    return total, slowest[:top]
+
+
+def measure(fixture, command, entry_point, args, repeat):
+    """measure cold, warm, import time and rss for one invocation"""
+    cold_cache = tempfile.mkdtemp(dir=fixture.dir)
+    cold = run_once(fixture, entry_point, args, cold_cache)
+    shutil.rmtree(cold_cache)
+
+    warm_cache = os.path.join(fixture.dir, 'pycache')
+    run_once(fixture, entry_point, args, warm_cache)
+    warm = [
+        run_once(fixture, entry_point, args, warm_cache)
+        for _ in range(repeat)
+    ]
+    imports = run_once(
+        fixture, entry_point, args, warm_cache, importtime=True
+    )
+    total, slowest = parse_importtime(imports['stderr'])
+    timings = [run['seconds'] for run in warm]
+    return {
+        'command': command,
+        'args': args,
+        'exit_code': warm[-1]['exit_code'],
+        'cold_seconds': cold['seconds'],
+        'warm_seconds': statistics.median(timings),
+        'warm_min_seconds': min(timings),
+        'warm_runs': timings,
+        'import_us': total,
+        'slowest_imports': slowest,
+        'max_rss_kb': max(run['max_rss_kb'] for run in warm),
+    }
+
+
+def run_benchmarks(opts):
+    """run the benchmarks and write the results as JSON"""
+    commands = command_entry_points()
+    if opts.commands:
+        commands = dict(
+            (name, commands[name]) for name in opts.commands.split(',')
+        )
+    results = {}
+    with Fixture() as fixture:
+        for command in sorted(commands):
+            invocations = [['-h']]
+            if NOOP_ARGS.get(command) is not None:
+                invocations.append(NOOP_ARGS[command])
+            for args in invocations:
+                key = ' '.join([command] + args)
+                result = measure(
+                    fixture, command, commands[command], args, opts.repeat
+                )
+                results[key] = result
+                print(
+                    "{0:<28} cold {1:7.3f}s warm {2:7.3f}s "
+                    "imports {3:7.3f}s rss {4:7d}KB exit {5}".format(
+                        key,
+                        result['cold_seconds'],
+                        result['warm_seconds'],
+                        result['import_us'] / 1e6,
+                        result['max_rss_kb'],
+                        result['exit_code']
+                    )
+                )
+    report = {
+        'meta': {
+            'python': sys.version,
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+            'repeat': opts.repeat,
+            'revision': git_revision(),
+        },
+        'results': results
+    }
+    with open(opts.output, 'w') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+    print("results written to {0}".format(opts.output))
+    return 0
+
+
+def git_revision():
+    """current revision of this checkout, if available"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=REPO_DIR,
+            stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+#
+# measurements compared between runs and the smallest absolute
+# change in each that counts as a regression, to ignore noise
+#
+COMPARED = (
+    ('warm_seconds', 0.005),
+    ('cold_seconds', 0.02),
+    ('import_us', 5000),
+    ('max_rss_kb', 1024),
+)
+
+
+def compare_results(base, new, threshold):
+    """
+    compare two benchmark reports
+
+    :returns: list of (key, measurement, base value, new value, ratio)
+      for every measurement that regressed by more than threshold
+    """
+    regressions = []
+    for key in sorted(set(base['results']) & set(new['results'])):
+        before = base['results'][key]
+        after = new['results'][key]
+        for measurement, min_delta in COMPARED:
+            old_value = before[measurement]
+            new_value = after[measurement]
+            if not old_value:
+                continue
+            ratio = float(new_value) / old_value
+            if ratio > 1 + threshold and new_value - old_value > min_delta:
+                regressions.append(
+                    (key, measurement, old_value, new_value, ratio)
+                )
+    return regressions
+
+
+def compare_benchmarks(opts):
+    """diff two result files, exit code 1 if anything regressed"""
+    with open(opts.base) as handle:
+        base = json.load(handle)
+    with open(opts.new) as handle:
+        new = json.load(handle)
+    for key in sorted(set(base['results']) ^ set(new['results'])):
+        print("{0}: only in one of the results".format(key))
+    for key in sorted(set(base['results']) & set(new['results'])):
+        print(
+            "{0:<28} warm {1:7.3f}s -> {2:7.3f}s".format(
+                key,
+                base['results'][key]['warm_seconds'],
+                new['results'][key]['warm_seconds']
+            )
+        )
+    regressions = compare_results(base, new, opts.threshold)
+    for key, measurement, old_value, new_value, ratio in regressions:
+        print(
+            "REGRESSION {0} {1}: {2} -> {3} ({4:+.0%})".format(
+                key, measurement, old_value, new_value, ratio - 1
+            )
+        )
+    return 1 if regressions else 0
+
+
+def build_parser(argslist):
+    """
+    _build_parser_
+
+    Set up command line parser for the benchmark script
+
+    """
+    parser = argparse.ArgumentParser(
+        description='cirrus command start up benchmarks'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    run_command = subparsers.add_parser('run')
+    run_command.add_argument(
+        '-o', '--output',
+        help='JSON file to write results to',
+        default='command_startup.json'
+    )
+    run_command.add_argument(
+        '-n', '--repeat',
+        help='number of warm runs per invocation',
+        type=int,
+        default=5
+    )
+    run_command.add_argument(
+        '--commands',
+        help='comma separated list of commands to run, default all',
+        default=None
+    )
+    compare_command = subparsers.add_parser('compare')
+    compare_command.add_argument('base', help='baseline results JSON')
+    compare_command.add_argument('new', help='new results JSON')
+    compare_command.add_argument(
+        '-t', '--threshold',
+        help='fractional slow down treated as a regression',
+        type=float,
+        default=0.1
+    )
+    opts = parser.parse_args(argslist)
+    return opts
+
+
+def main():
+    """
+    _main_
+
+    run or compare benchmarks
+    """
+    opts = build_parser(sys.argv[1:])
+    if opts.command == 'run':
+        return run_benchmarks(opts)
+    if opts.command == 'compare':
+        return compare_benchmarks(opts)
+    print("usage: command_startup.py run|compare")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+_branch_classifier_
+
+Merged status, ahead/behind counts and last commit age of branches.
+
+Branches are read from the session RefIndex, so all refs are listed
+once, then each base branch (eg develop and master) gets a single
+for-each-ref --merged call to find the branches merged into it.
+Base branches are compared using the remote tracking branch when
+there is one, since that is what other branches are merged into
+by pull requests, falling back to the local branch.
+
+Ahead/behind counts are relative to the first base branch and
+are optional, see RepositorySession.ahead_behind.
+
+The age of a branch is the age of the last commit on it, not the
+time it was pushed, so a branch pushed without any commits of its
+own has the age of the commit it was branched from, and is merged
+into that base. base_commits gives the base tips to check for this.
+
+"""
+import time
+import collections
+
+from cirrus.logger import get_logger
+
+LOGGER = get_logger()
+
+BranchInfo = collections.namedtuple(
+    'BranchInfo',
+    [
+        'name',
+        'ref',
+        'remote',
+        'branch',
+        'sha',
+        'committed_date',
+        'age',
+        'merged_into',
+        'ahead',
+        'behind'
+    ]
+)
+
+
+class BranchClassifier(object):
+    """
+    _BranchClassifier_
+
+    Classify the local branches and branches of remote in the
+    repo of a RepositorySession against the bases branches.
+    BranchInfo names are as listed by git branch -a.
+
+    """
+    def __init__(self, session, bases, remote='origin', clock=time.time):
+        self.session = session
+        self.remote = remote
+        self.clock = clock
+        self.base_names = list(bases)
+
+    def base_refs(self):
+        """
+        OrderedDict of base branch name: full ref name to compare
+        against, bases that dont exist are skipped
+        """
+        refs = self.session.refs
+        result = collections.OrderedDict()
+        for name in self.base_names:
+            if refs.has_remote_branch(name, self.remote):
+                result[name] = 'refs/remotes/{0}/{1}'.format(self.remote, name)
+            elif refs.has_branch(name):
+                result[name] = 'refs/heads/{0}'.format(name)
+            else:
+                LOGGER.warning(
+                    "Branch {0} not found, skipping it".format(name)
+                )
+        return result
+
+    def base_commits(self):
+        """OrderedDict of base branch name: the commit sha it points to"""
+        refs = self.session.refs
+        return collections.OrderedDict(
+            (name, refs.refs[ref].commit)
+            for name, ref in self.base_refs().items()
+        )
+
+    def branches(self, prefixes=None, local=True):
+        """
+        (remote, branch name, RefEntry) for the branches to classify,
+        optionally only branches starting with one of prefixes and
+        only remote branches if local is False. The base branches
+        and symbolic refs such as origin/HEAD are left out.
+        """
+        refs = self.session.refs
+        candidates = []
+        if local:
+            candidates.extend(
+                (None, name, entry) for name, entry in refs.heads.items()
+            )
+        remote_prefix = '{0}/'.format(self.remote)
+        candidates.extend(
+            (self.remote, name[len(remote_prefix):], entry)
+            for name, entry in refs.remotes.items()
+            if name.startswith(remote_prefix)
+        )
+        for remote, name, entry in candidates:
+            if entry.symref or name in self.base_names:
+                continue
+            if prefixes and not name.startswith(tuple(prefixes)):
+                continue
+            yield remote, name, entry
+
+    def classify(self, prefixes=None, local=True, counts=True):
+        """
+        _classify_
+
+        List BranchInfo for the branches, sorted by name
+
+        :param prefixes: optional branch name prefixes, eg feature/
+        :param local: include local branches as well as remote ones
+        :param counts: include ahead and behind counts against the
+          first base, otherwise they are None
+
+        """
+        bases = self.base_refs()
+        merged = collections.OrderedDict(
+            (name, self.session.merged_refs(ref, 'refs/heads', 'refs/remotes'))
+            for name, ref in bases.items()
+        )
+        selected = list(self.branches(prefixes, local))
+        if not self.session.has_commit_graph():
+            LOGGER.debug(
+                "No commit-graph in {0}, git commit-graph write --reachable "
+                "will speed up branch classification".format(
+                    self.session.repo_dir
+                )
+            )
+
+        ahead_behind = {}
+        if counts and bases:
+            primary = list(bases)[0]
+            ahead_behind = self.session.ahead_behind(
+                bases[primary],
+                [entry.name for _, _, entry in selected],
+                merged=merged[primary]
+            )
+
+        now = self.clock()
+        result = []
+        for remote, name, entry in selected:
+            ahead, behind = ahead_behind.get(entry.name, (None, None))
+            age = None
+            if entry.committed_date:
+                age = int(now - entry.committed_date)
+            if remote is None:
+                display = name
+            else:
+                display = 'remotes/{0}/{1}'.format(remote, name)
+            result.append(BranchInfo(
+                name=display,
+                ref=entry.name,
+                remote=remote,
+                branch=name,
+                sha=entry.commit,
+                committed_date=entry.committed_date,
+                age=age,
+                merged_into=[
+                    base for base, refs in merged.items()
+                    if entry.name in refs
+                ],
+                ahead=ahead,
+                behind=behind
+            ))
+        result.sort(key=lambda x: x.name)
+        return result
+
+
+def classify_branches(session, bases, prefixes=None, local=True,
+                      counts=True, remote='origin'):
+    """
+    _classify_branches_
+
+    List BranchInfo for the branches in the session repo,
+    see BranchClassifier.classify
+
+    """
+    classifier = BranchClassifier(session, bases, remote=remote)
+    return classifier.classify(prefixes, local=local, counts=counts)
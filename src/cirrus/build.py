@@ -17,8 +17,10 @@ from cirrus.documentation_utils import build_docs
 from cirrus.environment import cirrus_home
 from cirrus.configuration import load_configuration, get_pypi_auth
 from cirrus.pypirc import PypircFile
+from cirrus.lazy_import import lazy_callable
 from cirrus.logger import get_logger
-from invoke import run
+
+run = lazy_callable('invoke', 'run')
 
 LOGGER = get_logger()
 
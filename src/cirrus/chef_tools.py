@@ -6,13 +6,16 @@ Helpers/utils for modifying chef objects on the server and in a local repo
 
 """
 import os
-import git
 import json
-import chef
 import uuid
 
 from contextlib import contextmanager
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
+from cirrus.worktrees import check_branches_free, worktree, worktree_path
+
+git = lazy_import('git')
+chef = lazy_import('chef')
 
 LOGGER = get_logger()
 
@@ -160,7 +163,8 @@ def update_chef_environment(server_url, cert, username, environment, attributes,
     """
     _update_chef_environment_
 
-    Update chef environment on server and also in chef repo if provided
+    Update chef environment on server and also in chef repo if provided,
+    pass worktree=True to edit the chef repo in a worktree
 
     """
     #
@@ -188,8 +192,13 @@ def update_chef_environment(server_url, cert, username, environment, attributes,
             ).format(environment, chef_repo, r.environments())
             LOGGER.error(msg)
             raise RuntimeError(msg)
-        with r.feature_branch(feature_name, push=kwargs.get('push', False)):
-            with r.edit_environment(environment, branch=r.current_branch_name) as env:
+        feature = r.feature_branch(
+            feature_name,
+            push=kwargs.get('push', False),
+            worktree=kwargs.get('worktree', False)
+        )
+        with feature as repo:
+            with repo.edit_environment(environment, branch=repo.current_branch_name) as env:
                 LOGGER.info("Updating Chef Environment: {}".format(environment))
                 for x, y in attributes.items():
                     LOGGER.info(" => Setting {}={}".format(x, y))
@@ -226,6 +235,24 @@ class ChefRepo(object):
         self.envs = options.get('environments_dir', 'environments')
         self.roles_dir = options.get('roles_dir', 'roles')
 
+    @contextmanager
+    def worktree(self, branch_name='master', name='chef-repo'):
+        """
+        _worktree_
+
+        Context providing a ChefRepo for a worktree of this repo
+        with branch_name checked out and pulled
+
+        """
+        path = worktree_path(self.repo_dir, name)
+        check_branches_free(self.repo_dir, [branch_name], path=path)
+        with worktree(self.repo_dir, name, branch_name) as path:
+            repo = ChefRepo(
+                path, environments_dir=self.envs, roles_dir=self.roles_dir
+            )
+            repo.checkout_and_pull(branch_name)
+            yield repo
+
     @property
     def current_branch_name(self):
         return str(self.repo.active_branch)
@@ -455,7 +482,9 @@ class ChefRepo(object):
                 self.repo.remotes.origin.push(self.repo.head)
 
     @contextmanager
-    def feature_branch(self, feature_name, base_branch='master', push=True):
+    def feature_branch(
+            self, feature_name, base_branch='master', push=True,
+            worktree=False):
         """
         _feature_branch_
 
@@ -465,7 +494,16 @@ class ChefRepo(object):
         and then merges that branch back into the base branch and optionally
         push the changes to the remote
 
+        Yields the ChefRepo to make the changes in, which with
+        worktree=True is a ChefRepo for the chef-repo worktree of
+        this repo, leaving its checkout as is
+
         """
+        if worktree:
+            with self.worktree(base_branch) as repo:
+                with repo.feature_branch(feature_name, base_branch, push) as r:
+                    yield r
+            return
         branch_name = "feature/{}".format(feature_name)
         self._start_feature_branch(branch_name, base_branch)
         yield self
@@ -6,14 +6,17 @@ import os
 import sys
 import json
 import getpass
-import requests
 from urllib.parse import urljoin
 
 from argparse import ArgumentParser
 
+from cirrus.command_index import build_command_index
 from cirrus.configuration import load_setup_configuration, get_github_api_base
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
 
+requests = lazy_import('requests')
+
 LOGGER = get_logger()
 
 
@@ -361,24 +364,29 @@ def main():
     opts = build_parser(sys.argv[1:])
     config = load_setup_configuration()
 
-    # make sure gitconfig has a cirrus section
-    if 'cirrus' not in config.gitconfig.sections:
-        config.gitconfig.add_section('cirrus')
-    config.gitconfig.set_param(
-        'alias',
-        'cirrus',
-        '! {0}/bin/cirrus'.format(os.environ['VIRTUALENV_HOME'])
-    )
+    with config.gitconfig.batch():
+        # make sure gitconfig has a cirrus section
+        if 'cirrus' not in config.gitconfig.sections:
+            config.gitconfig.add_section('cirrus')
+        config.gitconfig.set_param(
+            'alias',
+            'cirrus',
+            '! {0}/bin/cirrus'.format(os.environ['VIRTUALENV_HOME'])
+        )
 
-    # make sure the creds plugin value is set
-    if opts.cred_plugin is not None:
-        config._set_creds_plugin(opts.cred_plugin)
+        # make sure the creds plugin value is set
+        if opts.cred_plugin is not None:
+            config._set_creds_plugin(opts.cred_plugin)
 
-    if not opts.robot_mode:
-        interactive_setup(opts, config)
-    else:
-        robot_setup(opts, config)
+    # store all the credentials in one update
+    with config.credentials.batch():
+        if not opts.robot_mode:
+            interactive_setup(opts, config)
+        else:
+            robot_setup(opts, config)
 
+    # index the installed commands for the delegate
+    build_command_index()
 
 
 if __name__ == '__main__':
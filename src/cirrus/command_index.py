@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+_command_index_
+
+Persisted index of the installed cirrus_commands entry points.
+
+Scanning every installed distribution for entry points is slow in
+large virtualenvs, so the delegate reads a small json index kept
+under CIRRUS_HOME instead. The index records the mtime of the
+site-packages directory it was built from and is rebuilt whenever
+a package install or removal changes that directory.
+
+The index is (re)built at install and selfupdate time, and lazily
+by the delegate if it is missing or stale.
+
+"""
+import os
+import json
+import sysconfig
+
+import cirrus.environment as env
+
+
+ENTRY_POINT_GROUP = 'cirrus_commands'
+INDEX_FILENAME = '.cirrus_commands.json'
+
+
+def site_packages_dir():
+    """
+    path to the site-packages dir of the running interpreter,
+    which for cirrus is the cirrus virtualenv
+    """
+    return sysconfig.get_paths()['purelib']
+
+
+def site_packages_mtime():
+    """
+    mtime of the site-packages dir, changes whenever a distribution
+    is installed, upgraded or removed
+    """
+    try:
+        return os.stat(site_packages_dir()).st_mtime
+    except OSError:
+        return None
+
+
+def index_path():
+    """
+    location of the command index file, None if the cirrus
+    install location cannot be determined
+    """
+    try:
+        home = env.cirrus_home()
+    except RuntimeError:
+        return None
+    return os.path.join(home, INDEX_FILENAME)
+
+
+def scan_entry_points():
+    """
+    _scan_entry_points_
+
+    Read the cirrus_commands entry points from the installed
+    distribution metadata.
+
+    :returns: dict of command name: entry point value
+      eg {'hello': 'cirrus.hello:main'}
+
+    """
+    try:
+        import importlib.metadata as importlib_metadata
+    except ImportError:
+        # python < 3.8, fall back to the slow path
+        import pkg_resources
+        result = {}
+        for script in pkg_resources.iter_entry_points(group=ENTRY_POINT_GROUP):
+            name, value = str(script).split(" = ", 1)
+            result.setdefault(name, value)
+        return result
+
+    entry_points = importlib_metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, [])
+    result = {}
+    for entry_point in entry_points:
+        result.setdefault(entry_point.name, entry_point.value)
+    return result
+
+
+def build_command_index(path=None):
+    """
+    _build_command_index_
+
+    Scan the entry points and write the command index.
+    Failing to write the index (eg a read only install) is not
+    an error, the scanned commands are still returned.
+
+    :param path: index file location, defaults to index_path()
+    :returns: dict of command name: entry point value
+
+    """
+    if path is None:
+        path = index_path()
+    commands = scan_entry_points()
+    if path is None:
+        return commands
+    data = {
+        'site_packages': site_packages_dir(),
+        'site_packages_mtime': site_packages_mtime(),
+        'commands': commands
+    }
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as handle:
+            json.dump(data, handle, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return commands
+
+
+def load_command_index(path=None):
+    """
+    _load_command_index_
+
+    Read the command index if it exists and is still valid
+    for the current site-packages.
+
+    :param path: index file location, defaults to index_path()
+    :returns: dict of command name: entry point value or None
+      if the index is missing, unreadable or stale
+
+    """
+    if path is None:
+        path = index_path()
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if data.get('site_packages') != site_packages_dir():
+        return None
+    if data.get('site_packages_mtime') != site_packages_mtime():
+        return None
+    return data.get('commands')
+
+
+def installed_commands(path=None):
+    """
+    _installed_commands_
+
+    Get the installed cirrus commands, using the persisted
+    index when it is valid and rebuilding it when it isnt.
+
+    :returns: dict of command name: entry point value
+
+    """
+    commands = load_command_index(path)
+    if commands is None:
+        commands = build_command_index(path)
+    return commands
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+_commit_cache_
+
+On disk store of commit metadata used to build release notes.
+
+Commits are stored by sha in a SQLite database in the .cirrus/cache
+dir at the top of the repo, so packages sharing a repo share the
+cache. Building release notes lists the commit shas in the range
+and only reads commits from git that arent in the cache yet.
+
+Entries record when they were last used, and the least recently
+used entries are evicted once the cache holds more than
+max_entries commits.
+
+"""
+import os
+import time
+import sqlite3
+
+from cirrus.config_snapshot import SNAPSHOT_DIR, ensure_cache_dir
+from cirrus.environment import repo_directory
+from cirrus.git_session import CommitRecord
+from cirrus.logger import get_logger
+
+
+LOGGER = get_logger()
+
+CACHE_FILE = 'commits.sqlite'
+
+#
+# commits kept in the cache before the least recently used are evicted
+#
+MAX_ENTRIES = 100000
+
+#
+# sqlite limits the number of parameters in a query
+#
+QUERY_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    sha TEXT PRIMARY KEY,
+    author TEXT,
+    committer TEXT,
+    committed_date INTEGER,
+    message TEXT,
+    last_used REAL
+)
+"""
+
+
+def cache_path(repo_dir=None):
+    """path to the commit cache for the repo containing repo_dir"""
+    top = repo_directory(repo_dir) or os.path.abspath(repo_dir or os.getcwd())
+    return os.path.join(top, SNAPSHOT_DIR, CACHE_FILE)
+
+
+class CommitCache(object):
+    """
+    _CommitCache_
+
+    CommitRecords stored by sha in a SQLite database
+
+    """
+    def __init__(self, path, max_entries=MAX_ENTRIES, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.clock = clock
+        ensure_cache_dir(path)
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(SCHEMA)
+
+    def get_many(self, shas):
+        """
+        dict of sha: CommitRecord for the shas that are in the
+        cache, marking them as used
+        """
+        shas = list(shas)
+        result = {}
+        for start in range(0, len(shas), QUERY_BATCH):
+            batch = shas[start:start + QUERY_BATCH]
+            params = ','.join('?' * len(batch))
+            rows = self.conn.execute(
+                'SELECT sha, author, committer, committed_date, message '
+                'FROM commits WHERE sha IN ({0})'.format(params),
+                batch
+            )
+            for row in rows:
+                result[row[0]] = CommitRecord(*row)
+        if result:
+            now = self.clock()
+            with self.conn:
+                self.conn.executemany(
+                    'UPDATE commits SET last_used = ? WHERE sha = ?',
+                    ((now, sha) for sha in result)
+                )
+        return result
+
+    def put_many(self, records):
+        """store CommitRecords and evict old entries if needed"""
+        now = self.clock()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO commits VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    (r.sha, r.author, r.committer, r.committed_date,
+                     r.message, now)
+                    for r in records
+                )
+            )
+        self.evict()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM commits').fetchone()[0]
+
+    def evict(self):
+        """
+        drop the least recently used commits beyond max_entries,
+        returns the number of commits removed
+        """
+        excess = len(self) - self.max_entries
+        if excess <= 0:
+            return 0
+        with self.conn:
+            self.conn.execute(
+                'DELETE FROM commits WHERE sha IN ('
+                'SELECT sha FROM commits ORDER BY last_used LIMIT ?)',
+                (excess,)
+            )
+        LOGGER.debug(
+            "Evicted {0} commits from {1}".format(excess, self.path)
+        )
+        return excess
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_cache(repo_dir=None):
+    """
+    open the commit cache for repo_dir, returns None if it
+    cant be used, eg in a read only checkout
+    """
+    path = cache_path(repo_dir)
+    try:
+        return CommitCache(path)
+    except (IOError, OSError, sqlite3.Error) as ex:
+        LOGGER.debug(
+            "Unable to open commit cache {0}: {1}".format(path, ex)
+        )
+        return None
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+_config_command_
+
+Implement git cirrus config command
+
+git cirrus config explain
+
+shows the effective configuration for the package, where each
+value comes from and whether it was loaded from the snapshot
+"""
+import sys
+from argparse import ArgumentParser
+
+from cirrus.config_snapshot import snapshot_path
+from cirrus.configuration import (
+    DERIVED_VALUES,
+    RELEASE_DEFAULTS,
+    load_configuration
+)
+
+
+def build_parser(argslist):
+    """
+    _build_parser_
+
+    Set up command line parser for the config command
+    """
+    parser = ArgumentParser(description='git cirrus config command')
+    parser.add_argument('command', nargs='?')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser(
+        'explain',
+        help='show the effective configuration values and their sources'
+    )
+    opts = parser.parse_args(argslist)
+    return opts
+
+
+def setting_source(config, section, option):
+    """describe where a setting the configuration uses comes from"""
+    if section == 'gitconfig':
+        git_section, param = option.split('.', 1)
+        if config.gitconfig.get_param(git_section, param) is None:
+            return 'default'
+        return '{0} [{1}] {2}'.format(config.gitconfig_file, git_section, param)
+    if option in config.get(section, {}):
+        return 'cirrus.conf [{0}] {1}'.format(section, option)
+    return 'default'
+
+
+def explain(config):
+    """
+    _explain_
+
+    Build the lines describing the effective configuration
+
+    """
+    snapshot = {
+        'loaded': 'loaded from {0}',
+        'written': 'written to {0}'
+    }.get(config.snapshot, 'not used ({0})')
+    lines = [
+        'cirrus.conf: {0}'.format(config.config_file),
+        'gitconfig: {0}'.format(config.gitconfig_file),
+        'snapshot: {0}'.format(
+            snapshot.format(snapshot_path(config.config_file))
+        ),
+        ''
+    ]
+    for section in sorted(config.keys()):
+        lines.append('[{0}]'.format(section))
+        for option, value in sorted(config[section].items()):
+            lines.append('    {0} = {1}'.format(option, value))
+        lines.append('')
+
+    lines.append('derived values:')
+    for name in sorted(DERIVED_VALUES):
+        try:
+            value = config.derived_value(name)
+        except (KeyError, ValueError, TypeError, AttributeError) as ex:
+            lines.append('    {0}: error: {1}'.format(name, ex))
+            continue
+        if name == 'release_settings':
+            lines.append('    {0}:'.format(name))
+            for key in sorted(RELEASE_DEFAULTS):
+                lines.append('        {0} = {1}    ({2})'.format(
+                    key, value[key], setting_source(config, 'release', key)
+                ))
+            continue
+        sources = ', '.join(
+            setting_source(config, section, option)
+            for section, option in DERIVED_VALUES[name]
+        )
+        lines.append('    {0} = {1}    ({2})'.format(name, value, sources))
+    return lines
+
+
+def main():
+    """
+    _main_
+
+    Execute config command
+    """
+    opts = build_parser(sys.argv)
+    if opts.command == 'explain':
+        config = load_configuration()
+        for line in explain(config):
+            print(line)
+        return 0
+    print("usage: git cirrus config explain")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+_config_snapshot_
+
+Compiled snapshots of the effective package configuration.
+
+Loading a Configuration parses cirrus.conf and derives values such
+as the python tag, the package name and the validated release
+settings. The sections and derived values are written to
+.cirrus/cache/config.json in the package dir, keyed by a hash of
+cirrus.conf and the gitconfig settings the configuration uses, so
+that later commands load them in a single read. A snapshot with a
+different key is ignored and replaced.
+
+"""
+import os
+import json
+import hashlib
+import tempfile
+
+from cirrus.logger import get_logger
+
+
+LOGGER = get_logger()
+
+#
+# bump when the snapshot contents change
+#
+SNAPSHOT_VERSION = 1
+
+SNAPSHOT_DIR = os.path.join('.cirrus', 'cache')
+SNAPSHOT_FILE = 'config.json'
+
+#
+# gitconfig settings that are part of the configuration,
+# credentials themselves are never stored in the snapshot
+#
+GITCONFIG_PARAMS = [('cirrus', 'credential-plugin')]
+
+
+def snapshot_path(config_file):
+    """path to the snapshot for the package containing config_file"""
+    package_dir = os.path.dirname(os.path.abspath(config_file))
+    return os.path.join(package_dir, SNAPSHOT_DIR, SNAPSHOT_FILE)
+
+
+def snapshot_key(config_content, gitconfig):
+    """
+    hash identifying the inputs to a snapshot: the cirrus.conf
+    content and the gitconfig params used by the configuration
+    """
+    digest = hashlib.sha256()
+    digest.update('{0}\n'.format(SNAPSHOT_VERSION).encode('utf-8'))
+    digest.update(config_content)
+    for section, param in GITCONFIG_PARAMS:
+        value = gitconfig.get_param(section, param)
+        digest.update(
+            '\n{0}.{1}={2}'.format(section, param, value).encode('utf-8')
+        )
+    return digest.hexdigest()
+
+
+def read_snapshot(config_file, key):
+    """
+    get the snapshot for config_file if it matches key,
+    otherwise None
+    """
+    try:
+        with open(snapshot_path(config_file), 'r') as handle:
+            snapshot = json.load(handle)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('key') != key:
+        return None
+    return snapshot
+
+
+def ensure_cache_dir(path):
+    """
+    create the cache dir, with a .gitignore so that it never
+    shows up as untracked files in the package repo
+    """
+    cache_dir = os.path.dirname(path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    gitignore = os.path.join(os.path.dirname(cache_dir), '.gitignore')
+    if not os.path.exists(gitignore):
+        with open(gitignore, 'w') as handle:
+            handle.write('*\n')
+
+
+def write_snapshot(config_file, key, sections, derived):
+    """
+    _write_snapshot_
+
+    Store the sections and derived values for config_file.
+    The snapshot is only a cache, so failing to write it, eg
+    in a read only checkout, is logged and ignored.
+
+    :returns: path to the snapshot or None if it wasnt written
+
+    """
+    path = snapshot_path(config_file)
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'key': key,
+        'config_file': os.path.abspath(config_file),
+        'sections': sections,
+        'derived': derived
+    }
+    try:
+        ensure_cache_dir(path)
+        handle, temp = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix='.config.', suffix='.tmp'
+        )
+        try:
+            with os.fdopen(handle, 'w') as writer:
+                json.dump(snapshot, writer, sort_keys=True)
+            os.replace(temp, path)
+        except Exception:
+            os.unlink(temp)
+            raise
+    except (IOError, OSError, TypeError, ValueError) as ex:
+        LOGGER.debug(
+            "Unable to write configuration snapshot {0}: {1}".format(path, ex)
+        )
+        return None
+    return path
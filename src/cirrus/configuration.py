@@ -10,17 +10,92 @@ Commands should access this by doing
 from cirrus.configuration import load_configuration
 conf = load_configuration()
 
+Loaded configurations are cached per process, keyed by the
+cirrus.conf and gitconfig paths, and reloaded when either file
+changes on disk. Across processes the parsed sections and derived
+values are reused from a snapshot, see cirrus.config_snapshot.
+
 """
 import os
+from cirrus.config_snapshot import read_snapshot, snapshot_key, write_snapshot
 from cirrus.gitconfig import load_gitconfig
 from cirrus.environment import repo_directory
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
 import configparser
-import pluggage.registry
 import subprocess
 
+pluggage_registry = lazy_import('pluggage.registry')
+
 LOGGER = get_logger()
 
+#
+# process wide cache of loaded configurations
+# (config path, gitconfig path): (file stamps, Configuration)
+#
+_CONFIG_CACHE = {}
+
+#
+# cirrus.conf path found for a package dir
+#
+_CONFIG_PATHS = {}
+
+#
+# release settings and their defaults
+#
+RELEASE_DEFAULTS = {
+    'wait_on_ci': False,
+    'wait_on_ci_develop': False,
+    'wait_on_ci_master': False,
+    'wait_on_ci_timeout': 600,
+    'wait_on_ci_interval': 2,
+    'push_retry_attempts': 1,
+    'push_retry_cooloff': 0,
+    'atomic_push': False,
+    'github_context_string': None,
+    'update_github_context': False,
+    'develop_github_context_string': None,
+    'master_github_context_string': None,
+    'update_develop_github_context': False,
+    'update_master_github_context': False
+}
+RELEASE_BOOL_SETTINGS = [
+    'wait_on_ci',
+    'wait_on_ci_develop',
+    'wait_on_ci_master',
+    'update_github_context',
+    'atomic_push'
+]
+RELEASE_INT_SETTINGS = [
+    'wait_on_ci_timeout',
+    'wait_on_ci_interval',
+    'push_retry_attempts',
+    'push_retry_cooloff'
+]
+
+#
+# values derived from the configuration and stored in the
+# snapshot, with the settings each is derived from
+#
+DERIVED_VALUES = {
+    'package_name': [('package', 'name')],
+    'python_versions': [('package', 'python_versions')],
+    'quality_threshold': [('quality', 'threshold')],
+    'release_settings': [('release', x) for x in sorted(RELEASE_DEFAULTS)],
+    'credential_plugin': [('gitconfig', 'cirrus.credential-plugin')],
+}
+
+
+def convert_bool(value):
+    """helper to make sure bools are bools"""
+    if value in (True, False):
+        return value
+    if value is None:
+        return False
+    if str(value).lower() in ('true', '1'):
+        return True
+    return False
+
 
 def get_creds_plugin(plugin_name):
     """
@@ -28,7 +103,7 @@ def get_creds_plugin(plugin_name):
 
     Get the credential access plugin requested from the factory
     """
-    factory = pluggage.registry.get_factory(
+    factory = pluggage_registry.get_factory(
         'credentials',
         load_modules=['cirrus.plugins.creds']
     )
@@ -47,28 +122,85 @@ class Configuration(dict):
         self.parser = None
         self.credentials = None
         self.gitconfig = None
+        self.derived = {}
+        self.snapshot = None
 
     def load(self):
         """
         _load_from_file_
 
-        Reread the cirrus config file
+        Reread the cirrus config file, using the snapshot of it
+        if there is a current one
 
         """
-        self.parser = configparser.RawConfigParser()
-        self.parser.read(self.config_file)
-        for section in self.parser.sections():
-            self.setdefault(section, {})
-            for option in self.parser.options(section):
-                self[section].setdefault(
-                    option,
-                    self.parser.get(section, option)
-                )
         if self.gitconfig_file is None:
             self.gitconfig_file = os.path.join(os.environ['HOME'], '.gitconfig')
         self.gitconfig = load_gitconfig(self.gitconfig_file)
+        try:
+            with open(self.config_file, 'rb') as handle:
+                content = handle.read()
+        except (IOError, OSError):
+            content = None
+
+        snapshot = None
+        if content is not None:
+            key = snapshot_key(content, self.gitconfig)
+            snapshot = read_snapshot(self.config_file, key)
+        if snapshot is not None:
+            sections = snapshot['sections']
+            self.derived = dict(snapshot['derived'])
+            self.snapshot = 'loaded'
+        else:
+            self._read_parser(content)
+            sections = dict(
+                (section, dict(self.parser.items(section)))
+                for section in self.parser.sections()
+            )
+
+        for section, options in sections.items():
+            self.setdefault(section, {})
+            for option, value in options.items():
+                self[section].setdefault(option, value)
+
+        if snapshot is None and content is not None:
+            path = write_snapshot(
+                self.config_file, key, sections, self.derive_all()
+            )
+            self.snapshot = 'written' if path else None
         self._load_creds_plugin()
 
+    def _read_parser(self, content=None):
+        """parse cirrus.conf into self.parser"""
+        self.parser = configparser.RawConfigParser()
+        if content is None:
+            self.parser.read(self.config_file)
+        else:
+            self.parser.read_string(
+                content.decode('utf-8'), source=self.config_file
+            )
+
+    def derived_value(self, name):
+        """
+        get a value derived from the configuration, computing it
+        if it isnt already known
+        """
+        if name not in self.derived:
+            self.derived[name] = getattr(self, '_{0}'.format(name))()
+        return self.derived[name]
+
+    def derive_all(self):
+        """
+        compute all the derived values that can be computed for
+        this configuration, values that raise are left out so that
+        accessing them raises as usual
+        """
+        for name in sorted(DERIVED_VALUES):
+            try:
+                self.derived_value(name)
+            except (KeyError, ValueError, TypeError, AttributeError):
+                continue
+        return dict(self.derived)
+
     def setup_load(self):
         if self.gitconfig_file is None:
             self.gitconfig_file = os.path.join(os.environ['HOME'], '.gitconfig')
@@ -76,12 +208,17 @@ class Configuration(dict):
         self.gitconfig.add_section('cirrus')
         self._load_creds_plugin()
 
-    def _load_creds_plugin(self):
-        """look up plugin pref fron gitconfig and load cred plugin"""
+    def _credential_plugin(self):
         plugin_name = self.gitconfig.get_param('cirrus', 'credential-plugin')
         if not plugin_name:
             plugin_name = 'default'
-        self.credentials = get_creds_plugin(plugin_name)
+        return plugin_name
+
+    def _load_creds_plugin(self):
+        """look up plugin pref fron gitconfig and load cred plugin"""
+        self.credentials = get_creds_plugin(
+            self.derived_value('credential_plugin')
+        )
 
     def _set_creds_plugin(self, plugin):
         self.set_gitconfig_param('credential-plugin', plugin)
@@ -92,6 +229,9 @@ class Configuration(dict):
         helper to set params in users .gitconfig
         """
         self.gitconfig.set_param(section, param, value)
+        if (section, param) == ('cirrus', 'credential-plugin'):
+            self.derived.pop('credential_plugin', None)
+        _configuration_updated(self, self.gitconfig_file)
 
     def get_gitconfig_param(self, param, section='cirrus'):
         """helper to read values from users .gitconfig"""
@@ -126,6 +266,9 @@ class Configuration(dict):
         return self.get('package', {}).get('version')
 
     def python_versions(self):
+        return self.derived_value('python_versions')
+
+    def _python_versions(self):
         """
         Returns a formatted string of python versions based on the versions
         provided in the config. For example if compatible with python2 and
@@ -140,6 +283,9 @@ class Configuration(dict):
         return '.'.join(['py{}'.format(version) for version in versions])
 
     def package_name(self):
+        return self.derived_value('package_name')
+
+    def _package_name(self):
         """
         Returns package name. Replaces '-' with '_' as this is the convention
         used for wheels
@@ -192,8 +338,42 @@ class Configuration(dict):
         return self.get('quality', {}).get('rcfile')
 
     def quality_threshold(self):
+        return self.derived_value('quality_threshold')
+
+    def _quality_threshold(self):
         return float(self.get('quality', {}).get('threshold'))
 
+    def release_settings(self):
+        """
+        the release section with defaults filled in and bools
+        and ints converted
+        """
+        return dict(self.derived_value('release_settings'))
+
+    def _release_settings(self):
+        settings = {}
+        release = self.get('release', {})
+        for key, val in RELEASE_DEFAULTS.items():
+            settings[key] = release.get(key, val)
+        for key in RELEASE_BOOL_SETTINGS:
+            settings[key] = convert_bool(settings[key])
+        for key in RELEASE_INT_SETTINGS:
+            settings[key] = int(settings[key])
+        return settings
+
+    def release_notes_log_options(self):
+        """
+        returns the git log filters to use when building
+        release notes from the config
+        """
+        package = self.get('package', {})
+        return {
+            'first_parent': convert_bool(
+                package.get('release_notes_first_parent')
+            ),
+            'no_merges': convert_bool(package.get('release_notes_no_merges'))
+        }
+
     def release_notes(self):
         """
         returns the release notes file and release
@@ -220,9 +400,12 @@ class Configuration(dict):
         Update the version in the configuration field
         """
         self['package']['version'] = new_version
+        if self.parser is None:
+            self._read_parser()
         self.parser.set('package', 'version', new_version)
         with open(self.config_file, 'w') as handle:
             self.parser.write(handle)
+        _configuration_updated(self, self.config_file)
 
     def configuration_map(self):
         result = {
@@ -234,6 +417,82 @@ class Configuration(dict):
         return result
 
 
+def _file_stamp(filename):
+    """
+    identify the current contents of a file by its
+    mtime, size and inode, None if it doesnt exist
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _config_stamps(config_path, gitconfig_path):
+    return (_file_stamp(config_path), _file_stamp(gitconfig_path))
+
+
+def clear_configuration_cache(filename=None):
+    """
+    _clear_configuration_cache_
+
+    Drop cached configurations so that the next load_configuration
+    call rereads them.
+
+    :param filename: if provided, only drop the configurations
+       that read this cirrus.conf or gitconfig file
+
+    """
+    if filename is None:
+        _CONFIG_CACHE.clear()
+        _CONFIG_PATHS.clear()
+        return
+    filename = os.path.abspath(filename)
+    for key in list(_CONFIG_CACHE.keys()):
+        if filename in key:
+            del _CONFIG_CACHE[key]
+
+
+def _configuration_updated(config, filename):
+    """
+    a configuration has written to filename: drop any other cached
+    configurations using that file and recache this one with the
+    new file stamps, since it is up to date
+    """
+    clear_configuration_cache(filename)
+    if config.config_file is None or config.gitconfig_file is None:
+        return
+    key = (
+        os.path.abspath(config.config_file),
+        os.path.abspath(config.gitconfig_file)
+    )
+    _CONFIG_CACHE[key] = (_config_stamps(*key), config)
+
+
+def _find_config_path(dirname):
+    """
+    find the cirrus.conf for the package dir, or the top of the
+    repo containing it if there isnt one there
+    """
+    dirname = os.path.abspath(dirname)
+    config_path = _CONFIG_PATHS.get(dirname)
+    if config_path is not None and os.path.exists(config_path):
+        return config_path
+
+    config_path = os.path.join(dirname, 'cirrus.conf')
+    if not os.path.exists(config_path):
+        repo_dir = repo_directory()
+        if repo_dir is not None:
+            config_path = os.path.join(repo_dir, 'cirrus.conf')
+
+    if not os.path.exists(config_path):
+        msg = "Couldnt find ./cirrus.conf, are you in a package directory?"
+        raise RuntimeError(msg)
+    _CONFIG_PATHS[dirname] = config_path
+    return config_path
+
+
 def load_configuration(package_dir=None, gitconfig_file=None):
     """
     _load_configuration_
@@ -241,6 +500,9 @@ def load_configuration(package_dir=None, gitconfig_file=None):
     Load the cirrus.conf file and parse it into a nested dictionary
     like Configuration instance.
 
+    The instance is cached and shared with later calls for the same
+    files until cirrus.conf or the gitconfig changes on disk.
+
     :param package_dir: Location of cirrus managed package if not pwd
     :param gitconfig_file: Path to gitconfig if not ~/.gitconfig
     :returns: Configuration instance
@@ -250,18 +512,19 @@ def load_configuration(package_dir=None, gitconfig_file=None):
     if package_dir is not None:
         dirname = package_dir
 
-    config_path = os.path.join(dirname, 'cirrus.conf')
-    if not os.path.exists(config_path):
-        repo_dir = repo_directory()
-        if repo_dir is not None:
-            config_path = os.path.join(repo_dir, 'cirrus.conf')
+    config_path = _find_config_path(dirname)
+    if gitconfig_file is None:
+        gitconfig_file = os.path.join(os.environ['HOME'], '.gitconfig')
 
-    if not os.path.exists(config_path):
-        msg = "Couldnt find ./cirrus.conf, are you in a package directory?"
-        raise RuntimeError(msg)
+    key = (os.path.abspath(config_path), os.path.abspath(gitconfig_file))
+    stamps = _config_stamps(*key)
+    cached = _CONFIG_CACHE.get(key)
+    if cached is not None and cached[0] == stamps:
+        return cached[1]
 
     config_instance = Configuration(config_path, gitconfig_file=gitconfig_file)
     config_instance.load()
+    _CONFIG_CACHE[key] = (stamps, config_instance)
     return config_instance
 
 
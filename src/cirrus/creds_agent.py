@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+"""
+_creds_agent_
+
+ssh-agent style cache for credentials shared between cirrus
+commands, so that a session of commands only goes to the keyring
+once.
+
+git cirrus creds-agent start
+
+The agent holds credentials in memory and listens on a unix socket
+only accessible to the current user. Entries expire a fixed time
+after they are stored (--ttl) and when they have not been used for
+a while (--idle), so the cached credentials do not outlive the
+session they were fetched for.
+
+Credential plugins consult the agent with CredsPlugin.agent_lookup
+and agent_store, which do nothing if the agent is not running.
+Setting CIRRUS_CREDS_AGENT_SOCK to an empty string disables the agent.
+
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import socketserver
+
+from cirrus.daemon import (
+    MessageReader,
+    daemonize,
+    peer_uid,
+    read_pidfile,
+    remove_file,
+    runtime_dir,
+    send_message,
+    write_pidfile
+)
+from cirrus.logger import get_logger
+
+
+LOGGER = get_logger()
+
+#
+# seconds an entry is kept after it is stored
+#
+DEFAULT_TTL = 3600
+
+#
+# seconds an entry is kept after it was last used
+#
+DEFAULT_IDLE = 900
+
+#
+# seconds a client waits for the agent before giving up on it
+#
+CLIENT_TIMEOUT = 2
+
+
+def socket_path():
+    """
+    path to the agent socket, CIRRUS_CREDS_AGENT_SOCK overrides,
+    returns None if the agent is disabled
+    """
+    path = os.environ.get('CIRRUS_CREDS_AGENT_SOCK')
+    if path is None:
+        path = os.path.join(runtime_dir(), 'creds-agent.sock')
+    return path or None
+
+
+def pid_path():
+    """path to the agent pid file"""
+    return '{0}.pid'.format(socket_path())
+
+
+def log_path():
+    """path to the agent log file"""
+    return '{0}.log'.format(socket_path())
+
+
+def request(message, path=None):
+    """
+    _request_
+
+    Send a message to the agent and return the response,
+    or None if the agent is not running or disabled
+
+    """
+    try:
+        path = path or socket_path()
+    except RuntimeError:
+        return None
+    if path is None or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CLIENT_TIMEOUT)
+    with sock:
+        try:
+            sock.connect(path)
+            send_message(sock, message)
+            return MessageReader(sock).read()
+        except (OSError, socket.error, ValueError):
+            return None
+
+
+def agent_get(key, path=None):
+    """get the value stored for key or None"""
+    response = request({'action': 'get', 'key': key}, path)
+    if response is None or response.get('status') != 'ok':
+        return None
+    return response['value']
+
+
+def agent_put(key, value, path=None):
+    """store value for key, returns True if the agent stored it"""
+    response = request({'action': 'put', 'key': key, 'value': value}, path)
+    return response is not None and response.get('status') == 'ok'
+
+
+def agent_clear(path=None):
+    """drop all the stored entries"""
+    response = request({'action': 'clear'}, path)
+    return response is not None and response.get('status') == 'ok'
+
+
+def agent_status(path=None):
+    """get the status message from the agent or None"""
+    return request({'action': 'status'}, path)
+
+
+class CredentialStore(object):
+    """
+    _CredentialStore_
+
+    In memory credentials with ttl and idle expiry
+
+    """
+    def __init__(self, ttl=DEFAULT_TTL, idle=DEFAULT_IDLE, clock=time.time):
+        self.ttl = ttl
+        self.idle = idle
+        self.clock = clock
+        self.entries = {}
+
+    def expire(self):
+        """drop the expired entries"""
+        now = self.clock()
+        for key, (_, stored, used) in list(self.entries.items()):
+            if now - stored > self.ttl or now - used > self.idle:
+                del self.entries[key]
+
+    def get(self, key):
+        """get the value for key or None, refreshing its idle time"""
+        self.expire()
+        if key not in self.entries:
+            return None
+        value, stored, _ = self.entries[key]
+        self.entries[key] = (value, stored, self.clock())
+        return value
+
+    def put(self, key, value):
+        """store value for key"""
+        now = self.clock()
+        self.entries[key] = (value, now, now)
+
+    def clear(self):
+        """drop all entries"""
+        self.entries.clear()
+
+    def __len__(self):
+        self.expire()
+        return len(self.entries)
+
+
+class AgentRequestHandler(socketserver.BaseRequestHandler):
+    """
+    _AgentRequestHandler_
+
+    Handle a single request to the agent. Requests are handled one
+    at a time, so a client that stalls is dropped after the
+    client timeout rather than blocking the agent.
+
+    """
+    def handle(self):
+        uid = peer_uid(self.request)
+        if uid is not None and uid != os.getuid():
+            return
+        self.request.settimeout(self.server.client_timeout)
+        try:
+            message = MessageReader(self.request).read()
+            if message is None:
+                return
+            send_message(self.request, self.server.respond(message))
+        except socket.timeout:
+            LOGGER.debug("cirrus creds agent client timed out")
+
+
+class CredsAgent(socketserver.UnixStreamServer):
+    """
+    _CredsAgent_
+
+    Unix socket server holding the credential store. Requests are
+    handled one at a time in the agent process, since the
+    credentials live in its memory. Clients that send nothing for
+    client_timeout seconds are dropped.
+
+    """
+    def __init__(self, path, ttl=DEFAULT_TTL, idle=DEFAULT_IDLE,
+                 client_timeout=CLIENT_TIMEOUT):
+        remove_file(path)
+        socketserver.UnixStreamServer.__init__(
+            self, path, AgentRequestHandler
+        )
+        os.chmod(path, 0o600)
+        self.path = path
+        self.pid = os.getpid()
+        self.store = CredentialStore(ttl, idle)
+        self.started = time.time()
+        self.running = False
+        self.timeout = 1
+        self.client_timeout = client_timeout
+
+    def respond(self, message):
+        """build the response for a request message"""
+        action = message.get('action')
+        if action == 'get':
+            value = self.store.get(message.get('key'))
+            if value is None:
+                return {'status': 'missing'}
+            return {'status': 'ok', 'value': value}
+        if action == 'put':
+            self.store.put(message.get('key'), message.get('value'))
+            return {'status': 'ok'}
+        if action == 'clear':
+            self.store.clear()
+            return {'status': 'ok'}
+        if action == 'status':
+            return self.status()
+        return {'status': 'error'}
+
+    def status(self):
+        """status message for this agent"""
+        return {
+            'status': 'ok',
+            'pid': self.pid,
+            'started': self.started,
+            'entries': len(self.store),
+            'ttl': self.store.ttl,
+            'idle': self.store.idle
+        }
+
+    def handle_timeout(self):
+        self.store.expire()
+
+    def stop(self, signum=None, frame=None):
+        """stop serving, used as the SIGTERM handler"""
+        self.running = False
+
+    def run(self):
+        """serve requests until stopped"""
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            while self.running:
+                self.handle_request()
+        finally:
+            self.store.clear()
+            self.server_close()
+            remove_file(self.path)
+
+
+def start_agent(opts):
+    """
+    start the agent, daemonizing unless running in the foreground
+    """
+    path = socket_path()
+    if path is None:
+        LOGGER.error("cirrus creds agent disabled by CIRRUS_CREDS_AGENT_SOCK")
+        return 1
+    if agent_status() is not None:
+        LOGGER.info("cirrus creds agent already running")
+        return 0
+    pidfile = pid_path()
+    if not opts.foreground:
+        daemonize(log_path())
+    write_pidfile(pidfile)
+    try:
+        agent = CredsAgent(path, ttl=opts.ttl, idle=opts.idle)
+        LOGGER.info(
+            "cirrus creds agent {0} listening on {1}".format(os.getpid(), path)
+        )
+        agent.run()
+    finally:
+        if read_pidfile(pidfile) == os.getpid():
+            remove_file(pidfile)
+    return 0
+
+
+def stop_agent(opts):
+    """stop the running agent"""
+    status = agent_status()
+    pid = status['pid'] if status else None
+    if pid is None and socket_path() is not None:
+        pid = read_pidfile(pid_path())
+    if pid is None:
+        LOGGER.info("cirrus creds agent not running")
+        return 0
+    os.kill(pid, signal.SIGTERM)
+    LOGGER.info("cirrus creds agent {0} stopped".format(pid))
+    return 0
+
+
+def clear_agent(opts):
+    """drop the credentials held by the agent"""
+    if not agent_clear():
+        print("cirrus creds agent not running")
+        return 1
+    return 0
+
+
+def show_status(opts):
+    """print the agent status, exit code 1 if not running"""
+    status = agent_status()
+    if status is None:
+        print("cirrus creds agent not running")
+        return 1
+    print(
+        (
+            "cirrus creds agent {0} running on {1} since {2}, "
+            "{3} entries (ttl {4}s, idle {5}s)"
+        ).format(
+            status['pid'],
+            socket_path(),
+            time.ctime(status['started']),
+            status['entries'],
+            status['ttl'],
+            status['idle']
+        )
+    )
+    return 0
+
+
+def build_parser(argslist):
+    """
+    _build_parser_
+
+    Set up command line parser for the creds-agent command
+
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            'git cirrus creds-agent command, '
+            'caches credentials between cirrus commands'
+        )
+    )
+    parser.add_argument('command', nargs='?')
+    subparsers = parser.add_subparsers(dest='command')
+    start_command = subparsers.add_parser('start')
+    start_command.add_argument(
+        '--foreground',
+        help='run the agent in the foreground',
+        action='store_true',
+        default=False
+    )
+    start_command.add_argument(
+        '--ttl',
+        help='seconds credentials are kept after they are stored',
+        type=int,
+        default=DEFAULT_TTL
+    )
+    start_command.add_argument(
+        '--idle',
+        help='seconds credentials are kept after they were last used',
+        type=int,
+        default=DEFAULT_IDLE
+    )
+    subparsers.add_parser('stop')
+    subparsers.add_parser('status')
+    subparsers.add_parser('clear')
+    opts = parser.parse_args(argslist)
+    return opts
+
+
+def main():
+    """
+    _main_
+
+    Execute creds-agent command
+    """
+    opts = build_parser(sys.argv)
+    if opts.command == 'start':
+        return start_agent(opts)
+    if opts.command == 'stop':
+        return stop_agent(opts)
+    if opts.command == 'status':
+        return show_status(opts)
+    if opts.command == 'clear':
+        return clear_agent(opts)
+    print("usage: git cirrus creds-agent start|stop|status|clear")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,8 +4,79 @@ creds_plugin
 
 """
 import inspect
+import contextlib
 from pluggage.factory_plugin import PluggagePlugin
 
+from cirrus.creds_agent import agent_get, agent_put
+
+
+class _Unresolved(object):
+    """placeholder for a credential group that hasnt been looked up"""
+    def __repr__(self):
+        return '<unresolved>'
+
+
+_UNRESOLVED = _Unresolved()
+
+
+class CredentialMap(dict):
+    """
+    _CredentialMap_
+
+    dict of credential groups, keyed by *_credentials method name,
+    that calls the method for a group the first time it is
+    accessed. Rendering a template that uses one group doesnt
+    look up all the others in the backend.
+    Works as a dict for pystache and dockerstache/chevron lookups.
+
+    """
+    def __init__(self, methods):
+        methods = dict(methods)
+        super(CredentialMap, self).__init__(
+            (name, _UNRESOLVED) for name in methods
+        )
+        self._methods = methods
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if value is _UNRESOLVED:
+            value = self._methods[key]()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __iter__(self):
+        return iter(list(dict.keys(self)))
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def copy(self):
+        result = CredentialMap(self._methods)
+        for key, value in dict.items(self):
+            dict.__setitem__(result, key, value)
+        return result
+
+    def resolved(self):
+        """names of the groups that have been looked up"""
+        return [
+            key for key, value in dict.items(self)
+            if value is not _UNRESOLVED
+        ]
+
 
 class CredsPlugin(PluggagePlugin):
     """
@@ -25,6 +96,29 @@ class CredsPlugin(PluggagePlugin):
         """override to do any loading steps needed"""
         pass
 
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        context manager for making several set_*_credentials calls,
+        override to store them all in one write
+        """
+        yield self
+
+    def agent_key(self, name):
+        """key for name in the creds agent, namespaced by plugin"""
+        return '{0}:{1}'.format(self.PLUGGAGE_OBJECT_NAME, name)
+
+    def agent_lookup(self, name):
+        """
+        get a value cached in the creds agent by this plugin,
+        None if it isnt cached or the agent isnt running
+        """
+        return agent_get(self.agent_key(name))
+
+    def agent_store(self, name, value):
+        """cache a value in the creds agent if it is running"""
+        return agent_put(self.agent_key(name), value)
+
     def github_credentials(self):
         return {
             'github_user': None,
@@ -123,13 +217,11 @@ class CredsPlugin(PluggagePlugin):
         """
         produces a nested credential dictionary that can be used
         to render templates with a standard format for looking
-        up a credential
+        up a credential. Each group of credentials is looked up
+        when it is first accessed.
 
         """
-        result = {}
-        for m_name, m_func in self.credential_methods():
-            result[m_name] = m_func()
-        return result
+        return CredentialMap(self.credential_methods())
 
 if __name__ == '__main__':
     p = CredsPlugin()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+_daemon_
+
+Helpers shared by the cirrus background processes that listen
+on a per user unix socket: the runtime directory holding the
+sockets and pid files, daemonizing, pid files, peer credential
+checks and the newline delimited JSON messages used on the
+sockets.
+
+File descriptors are passed with SCM_RIGHTS ancillary data using
+socket.sendmsg and recvmsg, socket.send_fds and recv_fds are only
+available from python 3.9.
+
+"""
+import os
+import sys
+import json
+import array
+import errno
+import socket
+import struct
+
+from cirrus.environment import runtime_dir_path
+
+
+#
+# largest chunk read from a socket at a time
+#
+RECV_SIZE = 65536
+
+
+def runtime_dir():
+    """
+    _runtime_dir_
+
+    Get the per user directory for cirrus sockets and pid files,
+    creating it if needed. Uses CIRRUS_RUNTIME_DIR if set, otherwise
+    a cirrus dir in XDG_RUNTIME_DIR or the temp dir.
+    The directory must be owned by and only accessible to the
+    current user.
+
+    """
+    path = runtime_dir_path()
+    try:
+        os.makedirs(path, 0o700)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+    stat = os.stat(path)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        msg = "Runtime dir {0} must be owned by and private to {1}".format(
+            path, os.getuid()
+        )
+        raise RuntimeError(msg)
+    return path
+
+
+def read_pidfile(path):
+    """
+    get the pid from the pid file if it names a running process,
+    otherwise None
+    """
+    try:
+        with open(path, 'r') as handle:
+            pid = int(handle.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        if ex.errno != errno.EPERM:
+            return None
+    return pid
+
+
+def write_pidfile(path):
+    """write the current pid to the pid file"""
+    with open(path, 'w') as handle:
+        handle.write('{0}\n'.format(os.getpid()))
+
+
+def remove_file(path):
+    """remove a socket or pid file if it exists"""
+    try:
+        os.unlink(path)
+    except OSError as ex:
+        if ex.errno != errno.ENOENT:
+            raise
+
+
+def daemonize(log_file=os.devnull):
+    """
+    _daemonize_
+
+    Double fork to detach from the controlling terminal.
+    Returns in the daemon process, the calling process exits.
+    stdin is redirected from /dev/null and stdout/stderr to
+    the log file.
+
+    """
+    if os.fork():
+        os._exit(0)
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    os.chdir('/')
+    os.umask(0o077)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(os.devnull, 'r') as devnull:
+        os.dup2(devnull.fileno(), 0)
+    with open(log_file, 'a') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+
+
+def peer_uid(sock):
+    """
+    get the uid of the process on the other end of a unix
+    socket, or None if the platform doesnt support SO_PEERCRED
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')
+    )
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid
+
+
+def encode_message(message):
+    """encode a dict as a newline terminated JSON message"""
+    return json.dumps(message).encode('utf-8') + b'\n'
+
+
+def send_fds(sock, data, fds):
+    """
+    send data with the file descriptors fds,
+    returns the number of bytes of data sent
+    """
+    return sock.sendmsg(
+        [data],
+        [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))]
+    )
+
+
+def recv_fds(sock, bufsize, max_fds):
+    """
+    receive up to bufsize bytes and up to max_fds file
+    descriptors, returns (data, list of fds)
+    """
+    fds = array.array('i')
+    data, ancdata, _, _ = sock.recvmsg(
+        bufsize, socket.CMSG_LEN(max_fds * fds.itemsize)
+    )
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            usable = len(cmsg_data) - (len(cmsg_data) % fds.itemsize)
+            fds.frombytes(cmsg_data[:usable])
+    return data, list(fds)
+
+
+def send_message(sock, message, fds=None):
+    """
+    send a message dict on the socket, optionally passing the
+    file descriptors fds along with it
+    """
+    data = encode_message(message)
+    if fds:
+        sent = send_fds(sock, data, list(fds))
+        data = data[sent:]
+    sock.sendall(data)
+
+
+class MessageReader(object):
+    """
+    _MessageReader_
+
+    Read newline delimited JSON messages from a socket,
+    collecting any file descriptors passed with them.
+
+    """
+    def __init__(self, sock, max_fds=0):
+        self.sock = sock
+        self.max_fds = max_fds
+        self.fds = []
+        self.buffer = b''
+
+    def read(self):
+        """
+        read the next message, returns None if the socket is
+        closed before a complete message arrives
+        """
+        while b'\n' not in self.buffer:
+            if self.max_fds and not self.fds:
+                data, fds = recv_fds(self.sock, RECV_SIZE, self.max_fds)
+                self.fds.extend(fds)
+            else:
+                data = self.sock.recv(RECV_SIZE)
+            if not data:
+                return None
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line.decode('utf-8'))
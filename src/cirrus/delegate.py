@@ -8,15 +8,48 @@ the sub command verb enabling
 git cirrus do_a_thing  to be routed to the appropriate
 command call for do_a_thing
 
+By default each command is run as a subprocess via its
+console script in the cirrus virtualenv. Setting
+CIRRUS_DISPATCH=inprocess in the environment runs the command
+entry point in the delegate process instead, saving an
+interpreter start up and re-import of cirrus per call.
+
+If the cirrus server is running (git cirrus server start) commands
+are forwarded to it instead, falling back to the dispatch mode above
+if it is not. The server client is only imported when the server
+socket exists, keeping it off the start up path otherwise.
+
 """
 import os
 import os.path
-import pkg_resources
+import importlib
 import sys
 import signal
 import subprocess
 
 import cirrus.environment as env
+from cirrus.command_index import installed_commands
+from cirrus.lazy_import import lazy_import
+
+server = lazy_import('cirrus.server')
+
+
+DISPATCH_SUBPROCESS = 'subprocess'
+DISPATCH_INPROCESS = 'inprocess'
+
+
+def forward(command, command_path, entry_point, args):
+    """
+    run the command in the cirrus server if its socket exists,
+    returns the exit code or None if the server didnt run it,
+    see server.forward
+    """
+    path = env.server_socket_path()
+    if not os.path.exists(path):
+        return None
+    return server.forward(
+        command, command_path, entry_point, args, path=path
+    )
 
 
 def install_signal_handlers():
@@ -38,6 +71,71 @@ def run_command(cmd):
     return subprocess.call(cmd, shell=False)
 
 
+def dispatch_mode():
+    """
+    get the dispatch mode from the CIRRUS_DISPATCH env var,
+    defaults to subprocess
+    """
+    mode = os.environ.get('CIRRUS_DISPATCH', DISPATCH_SUBPROCESS)
+    return mode.strip().lower()
+
+
+def load_entry_point(value):
+    """
+    _load_entry_point_
+
+    import the callable named by an entry point value
+    of the form package.module:attr
+    """
+    module_name, _, attrs = value.partition(':')
+    result = importlib.import_module(module_name.strip())
+    for attr in attrs.strip().split('.'):
+        if attr:
+            result = getattr(result, attr)
+    return result
+
+
+def exit_code(result):
+    """
+    convert the return value of a command main or the code of a
+    SystemExit raised by it to a process exit code, in the same
+    way the interpreter would
+    """
+    if result is None:
+        return 0
+    if isinstance(result, int):
+        return result
+    print(result, file=sys.stderr)
+    return 1
+
+
+def run_in_process(command_path, entry_point, args):
+    """
+    _run_in_process_
+
+    run the delegated command entry point in this process with
+    the CTRL-C signal handler in place, with sys.argv set up as
+    it would be for the console script
+
+    :param command_path: path of the console script for the command
+    :param entry_point: entry point value, eg cirrus.hello:main
+    :param args: command line args for the command
+    :returns: exit code of the command
+
+    """
+    install_signal_handlers()
+    func = load_entry_point(entry_point)
+    old_argv = sys.argv
+    sys.argv = [command_path, ] + list(args)
+    try:
+        result = func()
+    except SystemExit as ex:
+        result = ex.code
+    finally:
+        sys.argv = old_argv
+    return exit_code(result)
+
+
 HELP = \
 """
 Cirrus commands available are:
@@ -62,15 +160,12 @@ def main():
 
     response to the cirrus <verb> command
     Extracts the available verbs that are installed as
-    entry points by setup.py as cirrus_commands
+    entry points by setup.py as cirrus_commands, using the
+    persisted command index where possible
 
     """
     home = env.virtualenv_home()
-    commands = []
-    for script in pkg_resources.iter_entry_points(group="cirrus_commands"):
-        comm = str(script).split(" = ", 1)[0]
-        commands.append(comm)
-    commands.sort()
+    commands = installed_commands()
 
     # switch to the current GIT_PREFIX working dir
     old_dir = os.getcwd()
@@ -80,21 +175,34 @@ def main():
         args = sys.argv[1:]
         if len(args) == 0 or args[0] == '-h':
             # missing command or help
-            print(format_help(commands))
-            exit_code = 0
+            print(format_help(sorted(commands)))
+            result = 0
         else:
             command_path = "{0}/bin/{1}".format(home, args[0])
-            if not os.path.exists(command_path):
+            in_process = dispatch_mode() == DISPATCH_INPROCESS
+            result = None
+            if args[0] in commands:
+                result = forward(
+                    args[0], command_path, commands[args[0]], args[1:]
+                )
+            if result is not None:
+                # command was run by the cirrus server
+                pass
+            elif in_process and args[0] in commands:
+                result = run_in_process(
+                    command_path, commands[args[0]], args[1:]
+                )
+            elif not os.path.exists(command_path):
                 msg = "Unknown command: {}".format(args[0])
                 print(msg)
-                print(format_help(commands))
-                exit_code = 127
+                print(format_help(sorted(commands)))
+                result = 127
             else:
-                exit_code = run_command([command_path, ] + args[1:])
+                result = run_command([command_path, ] + args[1:])
     finally:
         # always return to previous dir
         os.chdir(old_dir)
-    return exit_code
+    return result
 
 if __name__ == "__main__":
     sys.exit(main())
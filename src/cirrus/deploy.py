@@ -8,11 +8,13 @@ Essentially a thin wrapper for the deploy_plugins
 module and its constituent bits
 
 """
-import pluggage.registry
 from argparse import ArgumentParser
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
 from cirrus.configuration import load_configuration
 
+pluggage_registry = lazy_import('pluggage.registry')
+
 
 LOGGER = get_logger()
 
@@ -23,7 +25,7 @@ def get_plugin(plugin_name):
 
     Get the deploy plugin requested from the factory
     """
-    factory = pluggage.registry.get_factory(
+    factory = pluggage_registry.get_factory(
         'deploy',
         load_modules=['cirrus.plugins.deployers']
     )
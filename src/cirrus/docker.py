@@ -8,9 +8,11 @@ import sys
 import subprocess
 
 from argparse import ArgumentParser
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
 from cirrus.configuration import load_configuration
-import dockerstache.dockerstache as ds
+
+ds = lazy_import('dockerstache.dockerstache')
 
 LOGGER = get_logger()
 
@@ -9,12 +9,13 @@ import os
 import sys
 import tarfile
 
-from invoke import run
-import pluggage.registry
-
 from cirrus.configuration import load_configuration
+from cirrus.lazy_import import lazy_import, lazy_callable
 from cirrus.logger import get_logger
 
+run = lazy_callable('invoke', 'run')
+pluggage_registry = lazy_import('pluggage.registry')
+
 LOGGER = get_logger()
 
 
@@ -24,7 +25,7 @@ def get_publisher_plugin(plugin_name):
 
     Get the publisher plugin requested from the factory
     """
-    factory = pluggage.registry.get_factory(
+    factory = pluggage_registry.get_factory(
         'publish',
         load_modules=['cirrus.plugins.publishers']
     )
@@ -8,9 +8,8 @@ Utils to get the cirrus environment settings
 
 import os
 import cirrus
-import inspect
 import posixpath
-import subprocess
+import collections
 
 
 #
@@ -18,20 +17,165 @@ import subprocess
 # when installed in a venv under CIRRUS_HOME location
 NUMBER_OF_SUBDIRS = 6
 
+#
+# where a git repo lives: the git dir, the common dir shared by
+# its worktrees and the top of the work tree (None for bare repos)
+#
+RepoLocation = collections.namedtuple(
+    'RepoLocation', ['git_dir', 'common_dir', 'work_tree']
+)
+
+#
+# discovered repos, keyed by the directory searched from and
+# the git environment variables that affect discovery
+#
+_REPO_CACHE = {}
+
+
+def clear_repo_cache():
+    """forget the discovered repos"""
+    _REPO_CACHE.clear()
+
+
+def _read_gitdir_file(path):
+    """
+    get the git dir named by a .git file, as used by worktrees
+    and submodules, or None if it isnt a gitdir file
+    """
+    try:
+        with open(path, 'r') as handle:
+            content = handle.read().strip()
+    except (IOError, OSError):
+        return None
+    if not content.startswith('gitdir:'):
+        return None
+    gitdir = content[len('gitdir:'):].strip()
+    return os.path.normpath(os.path.join(os.path.dirname(path), gitdir))
+
+
+def _common_dir(git_dir):
+    """the common dir for a worktree git dir, or the git dir itself"""
+    try:
+        with open(os.path.join(git_dir, 'commondir'), 'r') as handle:
+            common = handle.read().strip()
+    except (IOError, OSError):
+        return git_dir
+    return os.path.normpath(os.path.join(git_dir, common))
+
+
+def _is_git_dir(path):
+    """
+    check for the files git requires in a git dir, with objects
+    and refs in the common dir for worktrees
+    """
+    if not os.path.isfile(os.path.join(path, 'HEAD')):
+        return False
+    common = _common_dir(path)
+    return (
+        os.path.isdir(os.path.join(common, 'objects')) and
+        os.path.isdir(os.path.join(common, 'refs'))
+    )
+
+
+def _ceiling_dirs():
+    """directories discovery stops at, from GIT_CEILING_DIRECTORIES"""
+    value = os.environ.get('GIT_CEILING_DIRECTORIES', '')
+    return set(
+        os.path.abspath(x) for x in value.split(os.pathsep) if x
+    )
+
+
+def _discover(path):
+    """walk up from path to find the repo, without the cache"""
+    work_tree = os.environ.get('GIT_WORK_TREE')
+    if work_tree:
+        work_tree = os.path.realpath(work_tree)
+    if os.environ.get('GIT_DIR'):
+        git_dir = os.path.abspath(os.environ['GIT_DIR'])
+        if os.path.isfile(git_dir):
+            git_dir = _read_gitdir_file(git_dir)
+        if git_dir is None or not _is_git_dir(git_dir):
+            return None
+        # git treats the cwd as the top of the work tree here
+        return RepoLocation(
+            git_dir, _common_dir(git_dir), work_tree or os.path.realpath(path)
+        )
+
+    ceilings = _ceiling_dirs()
+    while True:
+        dotgit = os.path.join(path, '.git')
+        git_dir = None
+        if os.path.isdir(dotgit):
+            git_dir = dotgit
+        elif os.path.isfile(dotgit):
+            git_dir = _read_gitdir_file(dotgit)
+        if git_dir is not None and _is_git_dir(git_dir):
+            return RepoLocation(
+                git_dir,
+                _common_dir(git_dir),
+                work_tree or os.path.realpath(path)
+            )
+        if _is_git_dir(path):
+            # a bare repo, or inside the .git dir of a repo
+            return RepoLocation(path, _common_dir(path), work_tree)
+        parent = os.path.dirname(path)
+        if parent == path or parent in ceilings:
+            return None
+        path = parent
+
 
-def repo_directory():
+def discover_repo(path=None):
     """
-    helper method that extracts the current git repo directory
-    using a callout to git rev-parse.
+    _discover_repo_
+
+    Find the git repo containing path (default cwd) without calling
+    git, following .git files used by worktrees and submodules and
+    honouring GIT_DIR, GIT_WORK_TREE and GIT_CEILING_DIRECTORIES.
+    Repos found are memoized per directory.
+
+    :returns: RepoLocation or None if not in a repo
+
+    """
+    path = os.path.abspath(path or os.getcwd())
+    key = (
+        path,
+        os.environ.get('GIT_DIR'),
+        os.environ.get('GIT_WORK_TREE'),
+        os.environ.get('GIT_CEILING_DIRECTORIES')
+    )
+    location = _REPO_CACHE.get(key)
+    if location is not None and os.path.isdir(location.git_dir):
+        return location
+    location = _discover(path)
+    if location is None:
+        _REPO_CACHE.pop(key, None)
+    else:
+        _REPO_CACHE[key] = location
+    return location
+
+
+def find_git_dir(path=None):
+    """
+    find the git dir for the repo containing path (default cwd),
+    None if not in a repo
+    """
+    location = discover_repo(path)
+    if location is None:
+        return None
+    return location.git_dir
+
+
+def repo_directory(path=None):
+    """
+    helper method that finds the top level directory of the
+    git repo containing path, default cwd.
     If in a repo, this returns the path to the top level dir,
     if not, it returns None
     """
-    command = ['git', 'rev-parse', '--show-toplevel']
-    process = subprocess.Popen(command, stdout=subprocess.PIPE)
-    outp, err = process.communicate()
-    if process.returncode:
+    location = discover_repo(path)
+    if location is None:
         return None
-    return outp.strip().decode('utf-8')
+    return location.work_tree
 
 
 def cirrus_home():
@@ -44,7 +188,7 @@ def cirrus_home():
     """
     if os.environ.get('CIRRUS_HOME') is not None:
         return os.environ['CIRRUS_HOME']
-    home = inspect.getsourcefile(cirrus)
+    home = os.path.abspath(cirrus.__file__)
     if ('lib' in home) and ('site-packages' in home):
         # we are in a pip installed virtualenv site-packages
         # from the cirrus init py in the venv, we need to
@@ -54,7 +198,7 @@ def cirrus_home():
     else:
         # we are in a local git repo
         #
-        home = repo_directory()
+        home = repo_directory(os.path.dirname(home))
         if home is None:
             msg = "Unable to determine cirrus install location"
             raise RuntimeError(msg)
@@ -75,3 +219,38 @@ def virtualenv_home():
     home = cirrus_home()
     venv = posixpath.join(home, 'venv')
     return venv
+
+
+#
+# name of the cirrus server socket in the runtime dir
+#
+SERVER_SOCKET = 'server.sock'
+
+
+def runtime_dir_path():
+    """
+    path to the per user dir for cirrus sockets and pid files,
+    CIRRUS_RUNTIME_DIR if set, otherwise a cirrus dir in
+    XDG_RUNTIME_DIR or the temp dir. See daemon.runtime_dir,
+    which creates and checks it.
+    """
+    path = os.environ.get('CIRRUS_RUNTIME_DIR')
+    if path is not None:
+        return path
+    base = os.environ.get('XDG_RUNTIME_DIR')
+    if base and os.path.isdir(base):
+        return os.path.join(base, 'cirrus')
+    return os.path.join(
+        os.environ.get('TMPDIR', '/tmp'), 'cirrus-{0}'.format(os.getuid())
+    )
+
+
+def server_socket_path():
+    """
+    path to the cirrus server socket, CIRRUS_SERVER_SOCK overrides,
+    without creating the runtime dir
+    """
+    path = os.environ.get('CIRRUS_SERVER_SOCK')
+    if path is None:
+        path = os.path.join(runtime_dir_path(), SERVER_SOCKET)
+    return path
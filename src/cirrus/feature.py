@@ -1,16 +1,18 @@
 '''
 _feature_
 
-Command to create a new feature branch off of the develop branch
+Command to create a new feature branch off of the develop branch,
+list feature branches and prune old merged branches from the remote
 '''
 import os
 import sys
+import json
 from argparse import ArgumentParser
 
 from cirrus.configuration import load_configuration
 from cirrus.git_tools import checkout_and_pull, branch, push
 from cirrus.github_tools import create_pull_request
-from cirrus.github_tools import GitHubContext
+from cirrus.github_tools import GitHubContext, DELETE_BATCH_SIZE
 from cirrus.logger import get_logger
 
 LOGGER = get_logger()
@@ -55,6 +57,49 @@ def build_parser(argslist):
         required=False)
 
     list_command = subparsers.add_parser('list')
+    list_command.add_argument(
+        '--merged',
+        help='include feature branches merged into develop',
+        action='store_true')
+    list_command.add_argument(
+        '--no-counts',
+        help='dont count commits ahead of and behind develop',
+        dest='counts',
+        action='store_false')
+
+    prune_command = subparsers.add_parser('prune')
+    prune_command.add_argument(
+        '--older-than',
+        help='only prune branches whose last commit is this many days old',
+        dest='older_than',
+        type=int,
+        default=30)
+    prune_command.add_argument(
+        '--prefix',
+        help=(
+            'prefix of the branches to prune, can be repeated, '
+            'defaults to the feature and release branch prefixes'
+        ),
+        action='append')
+    prune_command.add_argument(
+        '--batch-size',
+        help='number of branches to delete with each push',
+        dest='batch_size',
+        type=int,
+        default=DELETE_BATCH_SIZE)
+    prune_command.add_argument(
+        '--dry-run',
+        help='report the branches that would be deleted',
+        dest='dry_run',
+        action='store_true')
+    prune_command.add_argument(
+        '--no-fetch',
+        help='dont fetch from the remote first',
+        dest='fetch',
+        action='store_false')
+    prune_command.add_argument(
+        '--report',
+        help='write the JSON report to this file instead of stdout')
 
     opts = parser.parse_args(argslist)
     return opts
@@ -108,15 +153,143 @@ def new_pr(opts):
     LOGGER.info("Created PR {0}".format(pr_url))
 
 
+def format_branch_info(info, develop):
+    """one line summary of a BranchInfo"""
+    details = []
+    if info.ahead is not None:
+        details.append(
+            '{0} ahead, {1} behind {2}'.format(info.ahead, info.behind, develop)
+        )
+    if info.age is not None:
+        details.append('last commit {0} days ago'.format(info.age // 86400))
+    if info.merged_into:
+        details.append('merged into {0}'.format(', '.join(info.merged_into)))
+    if not details:
+        return info.name
+    return '{0} ({1})'.format(info.name, '; '.join(details))
+
+
 def list_feature_branches(opts):
     """
-    list unmerged feature branches
+    list remote feature branches that arent merged into develop,
+    or all of them with --merged
+    """
+    repo_dir = os.getcwd()
+    config = load_configuration()
+    develop = config.gitflow_branch_name()
+    if opts.merged:
+        print("feature branches:")
+    else:
+        print("unmerged feature branches:")
+    with GitHubContext(repo_dir) as ghc:
+        branches = ghc.classify_branches(
+            prefixes=[config.gitflow_feature_prefix()],
+            local=False,
+            counts=opts.counts
+        )
+        for info in branches:
+            if opts.merged or develop not in info.merged_into:
+                print(format_branch_info(info, develop))
+
+
+def prune_report(opts, stale, deleted, failed):
+    """
+    _prune_report_
+
+    Build the JSON report for prune_branches, listing each
+    stale branch with its status: deleted, failed or, for
+    a dry run, would-delete
+
+    """
+    deleted = set(deleted)
+    branches = []
+    for info in stale:
+        row = {
+            'branch': info.branch,
+            'sha': info.sha,
+            'committed_date': info.committed_date,
+            'age_days': info.age // 86400,
+            'merged_into': info.merged_into,
+        }
+        if opts.dry_run:
+            row['status'] = 'would-delete'
+        elif info.branch in deleted:
+            row['status'] = 'deleted'
+        else:
+            row['status'] = 'failed'
+            row['error'] = failed.get(info.branch)
+        branches.append(row)
+    return {
+        'remote': 'origin',
+        'dry_run': opts.dry_run,
+        'older_than_days': opts.older_than,
+        'prefixes': opts.prefix,
+        'stale': len(stale),
+        'deleted': len(deleted),
+        'failed': len(failed),
+        'branches': branches,
+    }
+
+
+def prune_branches(opts):
+    """
+    _prune_branches_
+
+    Delete remote branches with one of the prefixes that are
+    merged into develop or master and whose last commit is older
+    than opts.older_than days, and write a JSON report.
+
+    Branches pointing at the tip of develop or master are kept,
+    they are merged only because they have no commits of their
+    own yet, eg a new feature branch, and their last commit age
+    is that of the base branch.
+
+    :returns: the report
+
     """
     repo_dir = os.getcwd()
-    print("unmerged feature branches:")
+    config = load_configuration()
+    if not opts.prefix:
+        opts.prefix = [
+            config.gitflow_feature_prefix(),
+            config.gitflow_release_prefix()
+        ]
+    cutoff = opts.older_than * 86400
+    deleted, failed = [], {}
     with GitHubContext(repo_dir) as ghc:
-        for x in ghc.iter_git_feature_branches(merged=False):
-            print(x)
+        if opts.fetch:
+            LOGGER.info("fetching remote branches...")
+            ghc.repo.remotes['origin'].fetch(prune=True)
+            ghc.git_session.refresh_refs()
+        classifier = ghc.branch_classifier()
+        branches = classifier.classify(
+            opts.prefix, local=False, counts=False
+        )
+        base_tips = set(classifier.base_commits().values())
+        stale = [
+            info for info in branches
+            if info.merged_into and info.sha not in base_tips and
+            info.age is not None and info.age >= cutoff
+        ]
+        LOGGER.info(
+            "{0} of {1} branches are merged and older than {2} days".format(
+                len(stale), len(branches), opts.older_than
+            )
+        )
+        if stale and not opts.dry_run:
+            deleted, failed = ghc.delete_remote_branches(
+                [info.branch for info in stale], batch_size=opts.batch_size
+            )
+
+    report = prune_report(opts, stale, deleted, failed)
+    if opts.report:
+        with open(opts.report, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    for name, error in failed.items():
+        LOGGER.error("Unable to delete {0}: {1}".format(name, error))
+    return report
 
 
 def main():
@@ -128,10 +301,14 @@ def main():
     opts = build_parser(sys.argv)
     if opts.command == 'new':
         new_feature_branch(opts)
-    if opts.command == 'list':
+    elif opts.command == 'list':
         list_feature_branches(opts)
-    if opts.command in ('pull-request', 'pr'):
+    elif opts.command in ('pull-request', 'pr'):
         new_pr(opts)
+    elif opts.command == 'prune':
+        report = prune_branches(opts)
+        if report['failed']:
+            exit(1)
     else:
         exit(1)
 
@@ -0,0 +1,729 @@
+#!/usr/bin/env python
+"""
+_git_session_
+
+Long lived access to a git repository for the duration of a command.
+
+A RepositorySession holds one GitPython Repo for the repo dir, shared
+by all the git_tools and GitHubContext calls, and persistent
+git cat-file --batch and --batch-check processes for object lookups,
+so that reading many tags or commits doesnt start a git process per
+object. Sessions are shared per repo dir via get_session and closed
+by close_sessions, which also runs at exit.
+
+Tags and branches are listed by a RefIndex built from a single
+git for-each-ref call, kept until refresh_refs is called after
+the refs are changed by a fetch, push, commit etc.
+
+Commit history is streamed from a single git log -z call as
+CommitRecords, see RepositorySession.iter_log.
+
+Merged status and ahead/behind counts of branches are read with
+for-each-ref, which uses the commit-graph file when the repo has
+one, and %(ahead-behind) on git 2.41 and later. Older git falls back
+to a rev-list --count per branch, using reachability bitmaps where
+they can answer the query.
+
+"""
+import os
+import atexit
+import tempfile
+import subprocess
+import collections
+
+from cirrus.environment import discover_repo
+from cirrus.lazy_import import lazy_import
+from cirrus.logger import get_logger
+
+git = lazy_import('git')
+arrow = lazy_import('arrow')
+
+LOGGER = get_logger()
+
+#
+# seconds to wait for a cat-file process to exit when closing
+#
+CLOSE_TIMEOUT = 5
+
+#
+# bytes read from git log at a time when streaming commits
+#
+LOG_CHUNK_SIZE = 65536
+
+#
+# git log format for CommitRecord, fields are separated by the
+# unit separator and commits by NUL using git log -z
+#
+LOG_FORMAT = '%H%x1f%an%x1f%cn%x1f%ct%x1f%B'
+
+CommitInfo = collections.namedtuple(
+    'CommitInfo',
+    [
+        'sha',
+        'tree',
+        'parents',
+        'author_name',
+        'author_email',
+        'authored_date',
+        'committer_name',
+        'committer_email',
+        'committed_date',
+        'message'
+    ]
+)
+
+RefEntry = collections.namedtuple(
+    'RefEntry',
+    ['name', 'sha', 'type', 'commit', 'committed_date', 'symref']
+)
+
+#
+# for-each-ref fields for RefEntry, the * fields are for the
+# object an annotated tag points to
+#
+REF_FIELDS = [
+    'refname',
+    'objecttype',
+    'objectname',
+    '*objecttype',
+    '*objectname',
+    'committerdate:unix',
+    '*committerdate:unix',
+    'symref'
+]
+REF_FORMAT = '%00'.join('%({0})'.format(x) for x in REF_FIELDS)
+
+#
+# first git version with the for-each-ref %(ahead-behind) atom
+#
+AHEAD_BEHIND_VERSION = (2, 41)
+
+#
+# refs passed to a single for-each-ref call
+#
+REF_BATCH = 500
+
+_GIT_VERSION = None
+
+#
+# open sessions by repo dir
+#
+_SESSIONS = {}
+
+
+def git_version():
+    """the installed git version as a tuple of ints, eg (2, 39, 5)"""
+    global _GIT_VERSION
+    if _GIT_VERSION is None:
+        output = subprocess.check_output(
+            ['git', 'version'], universal_newlines=True
+        )
+        version = []
+        for part in output.split()[2].split('.'):
+            if not part.isdigit():
+                break
+            version.append(int(part))
+        _GIT_VERSION = tuple(version)
+    return _GIT_VERSION
+
+
+class GitSessionError(RuntimeError):
+    """error talking to the git processes of a session"""
+
+
+class CatFile(object):
+    """
+    _CatFile_
+
+    A persistent git cat-file process in batch or batch-check mode,
+    objects are requested one line at a time on its stdin.
+
+    """
+    def __init__(self, repo_dir, mode='--batch'):
+        self.mode = mode
+        self.process = subprocess.Popen(
+            ['git', 'cat-file', mode],
+            cwd=repo_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def request(self, rev):
+        """
+        look up rev, returns (sha, type, size, data) with data None
+        in batch-check mode, or None if the object doesnt exist
+        """
+        if '\n' in rev:
+            raise ValueError("Invalid revision: {0!r}".format(rev))
+        if self.process.poll() is not None:
+            raise GitSessionError(
+                "git cat-file {0} has exited".format(self.mode)
+            )
+        try:
+            self.process.stdin.write(rev.encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+            header = self.process.stdout.readline()
+        except (IOError, OSError) as ex:
+            raise GitSessionError(
+                "git cat-file {0} failed: {1}".format(self.mode, ex)
+            )
+        if not header:
+            raise GitSessionError(
+                "git cat-file {0} has exited".format(self.mode)
+            )
+        fields = header.decode('utf-8').split()
+        if len(fields) != 3:
+            # missing or ambiguous
+            return None
+        sha, kind, size = fields[0], fields[1], int(fields[2])
+        data = None
+        if self.mode == '--batch':
+            data = self.process.stdout.read(size)
+            self.process.stdout.read(1)
+        return sha, kind, size, data
+
+    def close(self):
+        """stop the process"""
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(CLOSE_TIMEOUT)
+            except (IOError, OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process.stdout.close()
+
+
+def _parse_person(value):
+    """split 'name <email> timestamp tz' into name, email, timestamp"""
+    rest, timestamp, _ = value.rsplit(' ', 2)
+    name, _, email = rest.partition(' <')
+    return name, email.rstrip('>'), int(timestamp)
+
+
+def parse_commit(sha, data):
+    """
+    _parse_commit_
+
+    Parse a raw commit object as output by cat-file into a CommitInfo
+
+    """
+    text = data.decode('utf-8', 'replace')
+    headers, _, message = text.partition('\n\n')
+    tree = None
+    parents = []
+    author = committer = ('', '', 0)
+    for line in headers.split('\n'):
+        if line.startswith(' '):
+            # continuation of a multi line header such as gpgsig
+            continue
+        key, _, value = line.partition(' ')
+        if key == 'tree':
+            tree = value
+        elif key == 'parent':
+            parents.append(value)
+        elif key == 'author':
+            author = _parse_person(value)
+        elif key == 'committer':
+            committer = _parse_person(value)
+    return CommitInfo(
+        sha, tree, tuple(parents),
+        author[0], author[1], author[2],
+        committer[0], committer[1], committer[2],
+        message
+    )
+
+
+def parse_ref_line(line):
+    """
+    parse a line of for-each-ref output in REF_FORMAT into a
+    RefEntry, commit and committed_date are None for tags
+    that dont point directly at a commit
+    """
+    (name, kind, sha, peeled_kind, peeled_sha,
+     date, peeled_date, symref) = line.split('\0')
+    commit = None
+    committed_date = None
+    if kind == 'commit':
+        commit, committed_date = sha, date
+    elif peeled_kind == 'commit':
+        commit, committed_date = peeled_sha, peeled_date
+    return RefEntry(
+        name,
+        sha,
+        kind,
+        commit,
+        int(committed_date) if committed_date else None,
+        symref or None
+    )
+
+
+class CommitRecord(object):
+    """
+    _CommitRecord_
+
+    A commit read from git log, also usable as the
+    committer, message and date dict rows used by
+    the release notes formatters. The date is only
+    formatted when it is first asked for.
+
+    """
+    __slots__ = (
+        'sha', 'author', 'committer', 'committed_date', 'message', '_date'
+    )
+    FIELDS = ('sha', 'author', 'committer', 'committed_date', 'message')
+
+    def __init__(self, sha, author, committer, committed_date, message):
+        self.sha = sha
+        self.author = author
+        self.committer = committer
+        self.committed_date = committed_date
+        self.message = message
+        self._date = None
+
+    @property
+    def date(self):
+        """the commit date formatted for output"""
+        if self._date is None:
+            self._date = str(arrow.get(self.committed_date))
+        return self._date
+
+    @classmethod
+    def from_commit(cls, commit):
+        """build a CommitRecord from a CommitInfo"""
+        return cls(
+            commit.sha,
+            commit.author_name,
+            commit.committer_name,
+            commit.committed_date,
+            commit.message
+        )
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key == 'date' or key in self.FIELDS
+
+    def __repr__(self):
+        return 'CommitRecord({0!r}, {1!r}, {2!r})'.format(
+            self.sha, self.committer, self.committed_date
+        )
+
+
+def parse_log_record(record):
+    """
+    parse one NUL separated git log entry in LOG_FORMAT
+    into a CommitRecord
+    """
+    sha, author, committer, date, message = record.split('\x1f', 4)
+    return CommitRecord(sha, author, committer, int(date), message)
+
+
+def _history_filters(options):
+    """git log/rev-list args for the first_parent and no_merges options"""
+    args = []
+    if options.get('first_parent'):
+        args.append('--first-parent')
+    if options.get('no_merges'):
+        args.append('--no-merges')
+    return args
+
+
+class RefIndex(object):
+    """
+    _RefIndex_
+
+    Refs in a repo by name with the commit and committer date
+    they point to, and lookups for tags, local branches and
+    remote branches
+
+    """
+    def __init__(self, entries):
+        self.refs = collections.OrderedDict()
+        self.tags = collections.OrderedDict()
+        self.heads = collections.OrderedDict()
+        self.remotes = collections.OrderedDict()
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        """add a ref to the index"""
+        self.refs[entry.name] = entry
+        for prefix, refs in (
+                ('refs/tags/', self.tags),
+                ('refs/heads/', self.heads),
+                ('refs/remotes/', self.remotes)):
+            if entry.name.startswith(prefix):
+                refs[entry.name[len(prefix):]] = entry
+
+    def __contains__(self, name):
+        return name in self.refs
+
+    def has_tag(self, name):
+        return name in self.tags
+
+    def has_branch(self, name):
+        return name in self.heads
+
+    def has_remote_branch(self, name, remote='origin'):
+        """
+        check for a remote tracking branch, name can include the
+        remote as in origin/develop
+        """
+        if not name.startswith('{0}/'.format(remote)):
+            name = '{0}/{1}'.format(remote, name)
+        return name in self.remotes
+
+    def tag_commits(self):
+        """map of tag name: commit sha"""
+        return dict(
+            (name, entry.commit) for name, entry in self.tags.items()
+        )
+
+    def tags_by_date(self, reverse=True):
+        """tag names sorted by the commit date, newest first"""
+        return sorted(
+            self.tags,
+            key=lambda x: self.tags[x].committed_date or 0,
+            reverse=reverse
+        )
+
+    def branch_names(self, only=None):
+        """
+        local branch names followed by remote branches prefixed
+        with remotes/, as listed by git branch -a
+
+        :param only: optional set of full ref names to include
+
+        """
+        result = []
+        for prefix, refs in (('', self.heads), ('remotes/', self.remotes)):
+            for name, entry in refs.items():
+                if entry.symref or (only is not None and
+                                    entry.name not in only):
+                    continue
+                result.append('{0}{1}'.format(prefix, name))
+        return result
+
+
+class RepositorySession(object):
+    """
+    _RepositorySession_
+
+    Shared GitPython Repo and persistent cat-file processes
+    for a repo dir
+
+    """
+    def __init__(self, repo_dir=None):
+        self.repo_dir = repo_dir or os.getcwd()
+        self._repo = None
+        self._batch = None
+        self._batch_check = None
+        self._commits = {}
+        self._refs = None
+
+    @property
+    def repo(self):
+        """the GitPython Repo for the session"""
+        if self._repo is None:
+            self._repo = git.Repo(self.repo_dir)
+        return self._repo
+
+    @property
+    def batch(self):
+        if self._batch is None:
+            self._batch = CatFile(self.repo_dir, '--batch')
+        return self._batch
+
+    @property
+    def batch_check(self):
+        if self._batch_check is None:
+            self._batch_check = CatFile(self.repo_dir, '--batch-check')
+        return self._batch_check
+
+    def object_info(self, rev):
+        """(sha, type, size) for rev or None if it doesnt exist"""
+        result = self.batch_check.request(rev)
+        if result is None:
+            return None
+        return result[:3]
+
+    def resolve(self, rev):
+        """sha for rev or None if it doesnt exist"""
+        result = self.object_info(rev)
+        if result is None:
+            return None
+        return result[0]
+
+    def read_object(self, rev):
+        """(sha, type, data) for rev or None if it doesnt exist"""
+        result = self.batch.request(rev)
+        if result is None:
+            return None
+        return result[0], result[1], result[3]
+
+    def commit(self, rev):
+        """
+        CommitInfo for the commit rev points to, peeling tags,
+        or None if it doesnt exist
+        """
+        if rev in self._commits:
+            return self._commits[rev]
+        result = self.read_object('{0}^{{commit}}'.format(rev))
+        if result is None:
+            return None
+        sha, _, data = result
+        commit = self._commits.get(sha)
+        if commit is None:
+            commit = parse_commit(sha, data)
+            self._commits[sha] = commit
+        return commit
+
+    def iter_log(self, *revs, **options):
+        """
+        _iter_log_
+
+        Stream CommitRecords for revs from a single git log call,
+        newest first, reading the output in chunks as it is consumed
+
+        :param first_parent: follow only the first parent of merges
+        :param no_merges: skip merge commits
+
+        """
+        command = ['git', 'log', '-z', '--format={0}'.format(LOG_FORMAT)]
+        command.extend(_history_filters(options))
+        command.extend(revs)
+        command.append('--')
+        # stderr goes to a file so that git cant block writing
+        # warnings while we are only reading stdout
+        errors = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            command,
+            cwd=self.repo_dir,
+            stdout=subprocess.PIPE,
+            stderr=errors
+        )
+        try:
+            pending = b''
+            while True:
+                chunk = process.stdout.read(LOG_CHUNK_SIZE)
+                if not chunk:
+                    break
+                records = (pending + chunk).split(b'\0')
+                pending = records.pop()
+                for record in records:
+                    yield parse_log_record(record.decode('utf-8', 'replace'))
+            if pending:
+                yield parse_log_record(pending.decode('utf-8', 'replace'))
+            if process.wait() != 0:
+                errors.seek(0)
+                error = errors.read()
+                raise GitSessionError(
+                    "git log {0} failed: {1}".format(
+                        ' '.join(revs), error.decode('utf-8', 'replace').strip()
+                    )
+                )
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            errors.close()
+
+    def rev_list(self, *revs, **options):
+        """
+        shas of the commits in revs, newest first, with the
+        same first_parent and no_merges options as iter_log
+        """
+        command = ['git', 'rev-list']
+        command.extend(_history_filters(options))
+        command.extend(revs)
+        command.append('--')
+        try:
+            output = subprocess.check_output(
+                command, cwd=self.repo_dir, stderr=subprocess.PIPE
+            )
+        except subprocess.CalledProcessError as ex:
+            raise GitSessionError(
+                "git rev-list {0} failed: {1}".format(
+                    ' '.join(revs), ex.stderr.decode('utf-8', 'replace').strip()
+                )
+            )
+        return output.decode('utf-8').split()
+
+    def for_each_ref(self, *args):
+        """RefEntry for each ref listed by git for-each-ref args"""
+        output = subprocess.check_output(
+            ['git', 'for-each-ref', '--format={0}'.format(REF_FORMAT)] +
+            list(args),
+            cwd=self.repo_dir
+        )
+        for line in output.decode('utf-8').splitlines():
+            if line:
+                yield parse_ref_line(line)
+
+    @property
+    def refs(self):
+        """
+        RefIndex for the repo, built on first use and kept
+        until refresh_refs is called
+        """
+        if self._refs is None:
+            index = RefIndex([])
+            for entry in self.for_each_ref():
+                if entry.commit is None and entry.type == 'tag':
+                    # a tag of a tag, peel it all the way
+                    commit = self.commit(entry.name)
+                    if commit is not None:
+                        entry = entry._replace(
+                            commit=commit.sha,
+                            committed_date=commit.committed_date
+                        )
+                index.add(entry)
+            self._refs = index
+        return self._refs
+
+    def refresh_refs(self):
+        """
+        drop the ref index so that it is rebuilt when next used,
+        call after fetching, pushing or changing refs
+        """
+        self._refs = None
+
+    def unmerged_refs(self, rev='HEAD'):
+        """names of the refs with commits that arent merged into rev"""
+        return set(
+            entry.name for entry in self.for_each_ref('--no-merged', rev)
+        )
+
+    def merged_refs(self, rev='HEAD', *patterns):
+        """
+        names of the refs matching patterns (default all refs)
+        that are merged into rev
+        """
+        return set(
+            entry.name
+            for entry in self.for_each_ref('--merged', rev, *patterns)
+        )
+
+    def has_commit_graph(self):
+        """check whether the repo has a commit-graph file"""
+        location = discover_repo(self.repo_dir)
+        if location is None:
+            return False
+        info = os.path.join(location.common_dir, 'objects', 'info')
+        return (
+            os.path.exists(os.path.join(info, 'commit-graph')) or
+            os.path.isdir(os.path.join(info, 'commit-graphs'))
+        )
+
+    def _count(self, *args):
+        """git rev-list --count args"""
+        output = subprocess.check_output(
+            ['git', 'rev-list', '--count'] + list(args) + ['--'],
+            cwd=self.repo_dir,
+            universal_newlines=True
+        )
+        return [int(x) for x in output.split()]
+
+    def ahead_behind(self, base, refs, merged=()):
+        """
+        _ahead_behind_
+
+        Count the commits each of refs has that base doesnt (ahead)
+        and the commits base has that the ref doesnt (behind).
+
+        :param base: the rev to compare against
+        :param refs: full ref names to count
+        :param merged: optional set of refs known to be merged into
+           base, which are counted without walking the ref history
+        :returns: dict of ref name: (ahead, behind)
+
+        """
+        refs = list(refs)
+        result = {}
+        if git_version() >= AHEAD_BEHIND_VERSION:
+            ref_format = '%(refname)%00%(ahead-behind:{0})'.format(base)
+            for start in range(0, len(refs), REF_BATCH):
+                output = subprocess.check_output(
+                    ['git', 'for-each-ref', '--format={0}'.format(ref_format)] +
+                    refs[start:start + REF_BATCH],
+                    cwd=self.repo_dir,
+                    universal_newlines=True
+                )
+                for line in output.splitlines():
+                    name, _, counts = line.partition('\0')
+                    ahead, behind = counts.split()
+                    result[name] = (int(ahead), int(behind))
+            return result
+
+        for ref in refs:
+            if ref in merged:
+                # only the base side needs counting, which
+                # a bitmap index can answer without a walk
+                behind = self._count(
+                    '--use-bitmap-index', '{0}..{1}'.format(ref, base)
+                )[0]
+                result[ref] = (0, behind)
+            else:
+                behind, ahead = self._count(
+                    '--left-right', '{0}...{1}'.format(base, ref)
+                )
+                result[ref] = (ahead, behind)
+        return result
+
+    def close(self):
+        """stop the cat-file processes and release the Repo"""
+        for process in (self._batch, self._batch_check):
+            if process is not None:
+                process.close()
+        self._batch = None
+        self._batch_check = None
+        if self._repo is not None:
+            self._repo.close()
+            self._repo = None
+        self._commits.clear()
+        self._refs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_session(repo_dir=None):
+    """
+    _get_session_
+
+    Get the shared session for repo_dir (default cwd), opening
+    one if needed
+
+    """
+    key = os.path.realpath(repo_dir or os.getcwd())
+    session = _SESSIONS.get(key)
+    if session is None:
+        session = RepositorySession(repo_dir)
+        _SESSIONS[key] = session
+    return session
+
+
+def close_sessions():
+    """close all the shared sessions"""
+    while _SESSIONS:
+        _, session = _SESSIONS.popitem()
+        try:
+            session.close()
+        except Exception as ex:
+            LOGGER.debug("Error closing git session: {0}".format(ex))
+
+
+atexit.register(close_sessions)
@@ -4,14 +4,24 @@ _git_tools_
 
 Utils for doing git and github related business
 
+Repos are accessed through the shared session for the repo dir,
+see cirrus.git_session.
+
 """
 import os
-import itertools
-
-import git
-import arrow
 
+from cirrus.commit_cache import open_cache
+from cirrus.git_session import CommitRecord, get_session
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
+from cirrus.release_notes import (
+    FORMATTERS,
+    MarkdownFormatter,
+    PlaintextFormatter,
+    get_formatter
+)
+
+git = lazy_import('git')
 
 
 LOGGER = get_logger()
@@ -26,7 +36,7 @@ def checkout_and_pull(repo_dir, branch_from, pull=True):
 
     returns a reference to the pulled branch
     """
-    repo = git.Repo(repo_dir)
+    repo = get_session(repo_dir).repo
 
     if str(repo.active_branch) != branch_from:
         git.Git().checkout(branch_from)
@@ -34,7 +44,9 @@ def checkout_and_pull(repo_dir, branch_from, pull=True):
     # pull branch_from from remote
     if pull:
         ref = "refs/heads/{0}:refs/remotes/origin/{0}".format(branch_from)
-        return repo.remotes.origin.pull(ref)
+        result = repo.remotes.origin.pull(ref)
+        get_session(repo_dir).refresh_refs()
+        return result
 
 
 def branch(repo_dir, branchname, branch_from):
@@ -44,7 +56,7 @@ def branch(repo_dir, branchname, branch_from):
     Create a new branch off of branch_from, from repo, named
     branchname
     """
-    repo = git.Repo(repo_dir)
+    repo = get_session(repo_dir).repo
 
     if branchname in repo.heads:
         msg = "Branch: {0} already exists.".format(branchname)
@@ -54,6 +66,7 @@ def branch(repo_dir, branchname, branch_from):
     else:
         g = git.Git(repo_dir)
         g.checkout(branch_from, b=branchname)
+        get_session(repo_dir).refresh_refs()
 
     if not str(repo.active_branch) == branchname:
         msg = (
@@ -73,13 +86,7 @@ def remote_branch_exists(repo_dir, branchname):
     origin remote. returns True/False
 
     """
-    match = branchname
-    if not match.startswith('origin/'):
-        match = "origin/{}".format(branchname)
-    repo = git.Repo(repo_dir)
-    resp = repo.git.branch('-r')
-    remote_branches = [y for y in resp.split() if y.startswith('origin/')]
-    return match in remote_branches
+    return get_session(repo_dir).refs.has_remote_branch(branchname)
 
 
 def has_unstaged_changes(repo_dir):
@@ -89,7 +96,7 @@ def has_unstaged_changes(repo_dir):
     Are there changes to tracked files in the repo?
     Return True if so, False if it is clean
     """
-    repo = git.Repo(repo_dir)
+    repo = get_session(repo_dir).repo
     output = repo.git.status(
         '--untracked-files=no',  '--porcelain'
     ).split()
@@ -98,6 +105,20 @@ def has_unstaged_changes(repo_dir):
     return False
 
 
+def fetch_branch(repo_dir, branch_name, origin='origin'):
+    """
+    _fetch_branch_
+
+    Fetch branch_name from the remote, updating only the
+    remote tracking branch and not the local branch
+
+    """
+    session = get_session(repo_dir)
+    ref = "refs/heads/{0}:refs/remotes/{1}/{0}".format(branch_name, origin)
+    session.repo.remotes[origin].fetch(ref)
+    session.refresh_refs()
+
+
 def update_to_branch(branch, config, origin='origin'):
     """
     checkout specified branch, updating to pull in latest remotes
@@ -111,8 +132,10 @@ def update_to_branch(branch, config, origin='origin'):
     repo_dir = os.getcwd()
 
     LOGGER.info("fetching remotes...")
-    r = git.Repo(repo_dir)
+    session = get_session(repo_dir)
+    r = session.repo
     r.remotes[origin].fetch()
+    session.refresh_refs()
 
     g = git.Git()
     LOGGER.info("checking out {0}...".format(branch))
@@ -135,8 +158,10 @@ def update_to_tag(tag, config, origin='origin'):
     repo_dir = os.getcwd()
 
     LOGGER.info("fetching remote tags...")
-    r = git.Repo(repo_dir)
+    session = get_session(repo_dir)
+    r = session.repo
     r.remotes[origin].fetch(tags=True)
+    session.refresh_refs()
 
     ref = r.tags[tag]
     LOGGER.info("checking out {0}...".format(tag))
@@ -150,14 +175,18 @@ def commit_files_optional_push(repo_dir, commit_msg, push=True, *filenames):
     commit files to the repo, push remote if required.
 
     """
-    repo = git.Repo(repo_dir)
+    session = get_session(repo_dir)
+    repo = session.repo
     repo.index.add(filenames)
 
     # commits with message
     new_commit = repo.index.commit(commit_msg)
+    session.refresh_refs()
     # push branch to origin
     if push:
-        return repo.remotes.origin.push(repo.head)
+        result = repo.remotes.origin.push(repo.head)
+        session.refresh_refs()
+        return result
 
 
 def commit_files(repo_dir, commit_msg, *filenames):
@@ -180,8 +209,10 @@ def push(repo_dir):
 
     Push local branch to remote
     """
-    repo = git.Repo(repo_dir)
+    session = get_session(repo_dir)
+    repo = session.repo
     ret = repo.remotes.origin.push(repo.head)
+    session.refresh_refs()
     # Check to make sure that we haven't errored out.
     for r in ret:
         if r.flags >= r.ERROR:
@@ -199,9 +230,9 @@ def tag_release(repo_dir, tag, master='master', push=True):
 
     """
     checkout_and_pull(repo_dir, master, pull=push)
-    repo = git.Repo(repo_dir)
-    exists = any(existing_tag.name == tag for existing_tag in repo.tags)
-    if exists:
+    session = get_session(repo_dir)
+    repo = session.repo
+    if session.refs.has_tag(tag):
         # tag already exists
         msg = (
             "Attempting to create tag {0} on "
@@ -209,8 +240,10 @@ def tag_release(repo_dir, tag, master='master', push=True):
         ).format(tag, master)
         raise RuntimeError(msg)
     repo.create_tag(tag)
+    session.refresh_refs()
     if push:
         repo.remotes.origin.push(repo.head, tags=True)
+        session.refresh_refs()
 
 
 def get_active_branch(repo_dir):
@@ -219,7 +252,7 @@ def get_active_branch(repo_dir):
 
     Returns active branch for a give directory
     """
-    repo = git.Repo(repo_dir)
+    repo = get_session(repo_dir).repo
     return repo.active_branch
 
 
@@ -227,8 +260,7 @@ def get_active_commit_sha(repo_dir):
     """
     Return short commit sha of HEAD for the active branch.
     """
-    head = get_active_branch(repo_dir)
-    return head.commit.hexsha[:7]
+    return get_session(repo_dir).resolve('HEAD')[:7]
 
 
 def merge(repo_dir, source, destination):
@@ -240,12 +272,14 @@ def merge(repo_dir, source, destination):
     :returns: sha of the last commit from the merged branch
 
     """
-    repo = git.Repo(repo_dir)
+    session = get_session(repo_dir)
+    repo = session.repo
     repo.git.checkout(source)
 
     ref = "refs/heads/{0}:refs/remotes/origin/{0}".format(source)
     repo.remotes.origin.pull(ref)
     repo.git.merge(destination)
+    session.refresh_refs()
     latest = repo.head.ref.commit.hexsha
     return latest
 
@@ -257,7 +291,7 @@ def get_diff_files(repo_dir):
     Returns a list of paths to files that have been changed on
     the working directory
     """
-    repo = git.Repo(repo_dir)
+    repo = get_session(repo_dir).repo
     changes = repo.index.diff(None)
     diffs = []
     for diff in changes:
@@ -274,8 +308,7 @@ def get_tags_with_sha(repo_dir):
     tag:sha
 
     """
-    repo = git.Repo(repo_dir)
-    return {tag.name: tag.commit.hexsha for tag in repo.tags}
+    return get_session(repo_dir).refs.tag_commits()
 
 
 def get_tags(repo_dir):
@@ -286,33 +319,55 @@ def get_tags(repo_dir):
     newest first
 
     """
-    repo = git.Repo(repo_dir)
-    tags_with_date = {
-        tag.name: tag.commit.committed_date
-        for tag in repo.tags
-    }
-    return sorted(tags_with_date, key=tags_with_date.get, reverse=True)
+    return get_session(repo_dir).refs.tags_by_date()
 
 
-def get_commit_msgs(repo_dir, since_sha):
+def get_commit_msgs(
+        repo_dir, since_sha, first_parent=False, no_merges=False, cache=None):
     """
     _get_commit_msgs_
 
     Get commit message data for the repo provided since the
     since_sha value of a commit or tag.
 
+    Yields CommitRecords with committer, message and date
+    values, streamed from git log, or if a CommitCache is
+    provided, read from the cache with only the commits missing
+    from it read from git
+
     """
-    repo = git.Repo(repo_dir)
-    rev_range = '..'.join([since_sha,repo.head.commit.hexsha])
-    result = []
-    for commit in repo.iter_commits(rev_range):
-        row = {
-            'committer': commit.committer.name,
-            'message': commit.message,
-            'date': str(arrow.get(commit.committed_date))
-        }
-        result.append(row)
-    return result
+    rev_range = '{0}..HEAD'.format(since_sha)
+    if cache is not None:
+        return _cached_commit_msgs(
+            get_session(repo_dir), cache, rev_range,
+            first_parent=first_parent, no_merges=no_merges
+        )
+    return get_session(repo_dir).iter_log(
+        rev_range, first_parent=first_parent, no_merges=no_merges
+    )
+
+
+def _cached_commit_msgs(session, cache, rev_range, **options):
+    """
+    yield CommitRecords for rev_range from cache, adding the
+    commits that arent in it yet
+    """
+    shas = session.rev_list(rev_range, **options)
+    records = cache.get_many(shas)
+    missing = [
+        CommitRecord.from_commit(session.commit(sha))
+        for sha in shas if sha not in records
+    ]
+    if missing:
+        LOGGER.debug(
+            "Reading {0} of {1} commits from git".format(
+                len(missing), len(shas)
+            )
+        )
+        cache.put_many(missing)
+        records.update((record.sha, record) for record in missing)
+    for sha in shas:
+        yield records[sha]
 
 
 def format_commit_messages(rows):
@@ -329,21 +384,7 @@ def format_commit_messages(rows):
     --- DATETIME: COMMIT MESSAGE
 
     """
-    result = [" - Commit History:"]
-
-    for author, commits in itertools.groupby(rows, lambda x: x['committer']):
-        result.append(" -- Author: {0}".format(author))
-        sorted_commits = sorted(
-            [ c for c in commits ],
-            key=lambda x: x['date'],
-            reverse=True
-        )
-        result.extend(
-            ' --- {0}: {1}'.format(commit['date'],commit['message'])
-            for commit in sorted_commits
-        )
-
-    return '\n'.join(result)
+    return PlaintextFormatter.format(rows)
 
 
 def markdown_format(rows):
@@ -364,45 +405,67 @@ def markdown_format(rows):
     DATETIME: COMMIT MESSAGE
 
     """
-    result = ['Commit History\n==============']
-
-    for author, commits in itertools.groupby(rows, lambda x: x['committer']):
-        result.append(
-            '\nAuthor: {0}\n--------'.format(author) + '-' * len(author))
-        sorted_commits = sorted(
-            [c for c in commits],
-            key=lambda x: x['date'],
-            reverse=True)
-        result.extend('\n{0}: {1}'.format(
-            commit['date'],
-            commit['message']) for commit in sorted_commits)
-
-    return '\n'.join(result)
-
-FORMATTERS = {
-    'plaintext': format_commit_messages,
-    'markdown': markdown_format,
-    }
+    return MarkdownFormatter.format(rows)
 
 
-def build_release_notes(repo_dir, since_tag, formatter):
+def iter_release_notes(
+        repo_dir, since_tag, formatter, first_parent=False, no_merges=False,
+        use_cache=True):
     """
     Given a repo_dir and tag, generate release notes for all
-    commits since that tag
+    commits since that tag, optionally following only the first
+    parent of merges or leaving out merge commits.
+
+    Returns an iterator over chunks of the notes as they are
+    formatted. Commit data is kept in the commit cache unless
+    use_cache is False.
 
     """
+    try:
+        formatter_class = get_formatter(formatter)
+    except ValueError as ex:
+        LOGGER.error(str(ex))
+        raise RuntimeError(str(ex))
+
     tags = get_tags_with_sha(repo_dir)
     if since_tag not in tags:
         msg = "Could not find tag {0} in {1}".format(since_tag, repo_dir)
         raise RuntimeError(msg)
 
-    sha = tags[since_tag]
-    msgs = get_commit_msgs(repo_dir, sha)
+    return _iter_release_notes(
+        repo_dir, tags[since_tag], formatter_class,
+        first_parent, no_merges, use_cache
+    )
+
+
+def _iter_release_notes(
+        repo_dir, sha, formatter_class, first_parent, no_merges, use_cache):
+    """format the commits since sha, closing the cache when done"""
+    cache = open_cache(repo_dir) if use_cache else None
     try:
-        rel_notes = FORMATTERS[formatter](msgs)
-    except Exception as ex:
-        LOGGER.exception(ex)
-        raise RuntimeError(
-            ('Invalid release notes formatting: {0} Update cirrus.conf'
-             ' entry to use either: plaintext, markdown'.format(formatter)))
-    return rel_notes
+        msgs = get_commit_msgs(
+            repo_dir, sha, first_parent=first_parent, no_merges=no_merges,
+            cache=cache
+        )
+        for chunk in formatter_class.iterate(msgs):
+            yield chunk
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def build_release_notes(
+        repo_dir, since_tag, formatter, stream=None, **options):
+    """
+    Given a repo_dir and tag, generate release notes for all
+    commits since that tag, see iter_release_notes for options.
+
+    The notes are written to stream if provided, otherwise
+    they are returned as a string
+
+    """
+    chunks = iter_release_notes(repo_dir, since_tag, formatter, **options)
+    if stream is None:
+        return ''.join(chunks)
+    for chunk in chunks:
+        stream.write(chunk)
@@ -4,12 +4,39 @@ gitconfig
 
 local gitconfig parser/updater since the lib on pypi seems to be busted
 
+gitconfig files are read in process following git's config syntax:
+sections and subsections, quoting, escapes, line continuations,
+multi valued keys and include/includeIf. If a file cant be parsed
+this falls back to reading it with git config -l.
+
+Changes are written by rewriting the file in place of git config,
+GitConfig.batch() groups several changes into a single write.
+
 """
 import os
+import re
+import string
 import operator
 import subprocess
 import contextlib
 
+from cirrus.environment import find_git_dir
+
+
+#
+# git gives up on include chains deeper than this
+#
+MAX_INCLUDE_DEPTH = 10
+
+SECTION_CHARS = frozenset(string.ascii_letters + string.digits + '-.')
+KEY_CHARS = frozenset(string.ascii_letters + string.digits + '-')
+VALUE_ESCAPES = {'n': '\n', 't': '\t', 'b': '\b', '"': '"', '\\': '\\'}
+
+
+class GitConfigParseError(ValueError):
+    """error raised for invalid gitconfig syntax"""
+    pass
+
 
 @contextlib.contextmanager
 def gitconfig(filename="~/.gitconfig"):
@@ -39,6 +66,461 @@ def shell_command(command):
         return "\n".join(stdout.decode('utf-8').splitlines())
 
 
+def git_config_list(filename):
+    """
+    list the entries in a gitconfig file with git config, as
+    (name, value) tuples, value is None for keys without a value
+    """
+    process = subprocess.Popen(
+        ['git', 'config', '--file', filename, '--includes', '-l', '-z'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(stderr)
+    result = []
+    for record in stdout.decode('utf-8').split('\0')[:-1]:
+        if '\n' in record:
+            name, value = record.split('\n', 1)
+        else:
+            name, value = record, None
+        result.append((name, value))
+    return result
+
+
+def wildmatch_regex(pattern, ignore_case=False):
+    """
+    convert a git wildmatch pattern, as used by includeIf, to a
+    compiled regex, with * and ? not matching / and ** matching
+    across directories
+    """
+    result = []
+    i = 0
+    length = len(pattern)
+    while i < length:
+        char = pattern[i]
+        if pattern.startswith('**', i):
+            at_start = i == 0 or pattern[i - 1] == '/'
+            end = i + 2
+            if at_start and end == length:
+                result.append('.*')
+                i = end
+                continue
+            if at_start and pattern[end] == '/':
+                result.append('(?:.*/)?')
+                i = end + 1
+                continue
+            result.append('[^/]*')
+            i = end
+        elif char == '*':
+            result.append('[^/]*')
+            i += 1
+        elif char == '?':
+            result.append('[^/]')
+            i += 1
+        elif char == '[':
+            end = i + 1
+            if end < length and pattern[end] in '!^':
+                end += 1
+            if end < length and pattern[end] == ']':
+                end += 1
+            end = pattern.find(']', end)
+            if end == -1:
+                result.append(re.escape(char))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            negate = body[:1] in ('!', '^')
+            if negate:
+                body = body[1:]
+            body = body.replace('\\', '\\\\')
+            if negate:
+                result.append('[^/{0}]'.format(body))
+            else:
+                result.append('[{0}]'.format(body))
+            i = end + 1
+        elif char == '\\' and i + 1 < length:
+            result.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            result.append(re.escape(char))
+            i += 1
+    flags = re.IGNORECASE if ignore_case else 0
+    return re.compile('\\A{0}\\Z'.format(''.join(result)), flags | re.DOTALL)
+
+
+def _include_condition_pattern(pattern, filename):
+    """prepare an includeIf gitdir pattern the way git does"""
+    if pattern.startswith('~/'):
+        pattern = os.path.expanduser(pattern)
+    elif pattern.startswith('./'):
+        if filename is None:
+            raise GitConfigParseError(
+                "relative includeIf path with no including file"
+            )
+        pattern = os.path.join(os.path.dirname(filename), pattern[2:])
+    if not os.path.isabs(pattern):
+        pattern = '**/' + pattern
+    if pattern.endswith('/'):
+        pattern = pattern + '**'
+    return pattern
+
+
+def include_condition(condition, filename):
+    """
+    evaluate an includeIf condition for the repo in the cwd,
+    conditions git supports that cant be evaluated here are false
+    """
+    kind, _, pattern = condition.partition(':')
+    if kind in ('gitdir', 'gitdir/i'):
+        git_dir = find_git_dir()
+        if git_dir is None:
+            return False
+        regex = wildmatch_regex(
+            _include_condition_pattern(pattern, filename),
+            ignore_case=(kind == 'gitdir/i')
+        )
+        return any(
+            regex.match(path) for path in
+            (os.path.realpath(git_dir), os.path.abspath(git_dir))
+        )
+    if kind == 'onbranch':
+        git_dir = find_git_dir()
+        if git_dir is None:
+            return False
+        try:
+            with open(os.path.join(git_dir, 'HEAD'), 'r') as handle:
+                head = handle.read().strip()
+        except (IOError, OSError):
+            return False
+        if not head.startswith('ref: refs/heads/'):
+            return False
+        if pattern.endswith('/'):
+            pattern = pattern + '**'
+        regex = wildmatch_regex(pattern)
+        return regex.match(head[len('ref: refs/heads/'):]) is not None
+    return False
+
+
+def _parse_error(message, filename, line):
+    return GitConfigParseError(
+        "bad config line {0} in {1}: {2}".format(
+            line, filename or '<string>', message
+        )
+    )
+
+
+def _parse_value(text, pos, filename, line):
+    """
+    parse a value starting after the = up to the end of the line,
+    returns the value and the position and line number after it
+    """
+    value = []
+    quote = False
+    comment = False
+    space = 0
+    length = len(text)
+    while True:
+        char = text[pos] if pos < length else '\n'
+        pos += 1
+        if char == '\n':
+            if quote:
+                raise _parse_error("unterminated quote", filename, line)
+            return ''.join(value), pos, line + 1
+        if comment:
+            continue
+        if not quote and char.isspace():
+            if value:
+                space += 1
+            continue
+        if not quote and char in ';#':
+            comment = True
+            continue
+        if space:
+            value.append(' ' * space)
+            space = 0
+        if char == '\\':
+            char = text[pos] if pos < length else '\n'
+            pos += 1
+            if char == '\n':
+                line += 1
+                continue
+            if char not in VALUE_ESCAPES:
+                raise _parse_error("invalid escape", filename, line)
+            value.append(VALUE_ESCAPES[char])
+            continue
+        if char == '"':
+            quote = not quote
+            continue
+        value.append(char)
+
+
+def _parse_section(text, pos, filename, line):
+    """
+    parse a section header starting after the [, returns the
+    section name and the position after the ]
+    """
+    length = len(text)
+    start = pos
+    while pos < length and text[pos] in SECTION_CHARS:
+        pos += 1
+    name = text[start:pos].lower()
+    if pos < length and text[pos] == ']':
+        return name, pos + 1
+    while pos < length and text[pos] in ' \t':
+        pos += 1
+    if not name or pos >= length or text[pos] != '"':
+        raise _parse_error("bad section header", filename, line)
+    pos += 1
+    subsection = []
+    while pos < length and text[pos] != '"':
+        char = text[pos]
+        if char == '\n':
+            raise _parse_error("bad section header", filename, line)
+        if char == '\\':
+            pos += 1
+            if pos >= length or text[pos] == '\n':
+                raise _parse_error("bad section header", filename, line)
+            char = text[pos]
+        subsection.append(char)
+        pos += 1
+    if text[pos + 1:pos + 2] != ']':
+        raise _parse_error("bad section header", filename, line)
+    return '{0}.{1}'.format(name, ''.join(subsection)), pos + 2
+
+
+def _normalise(text):
+    """strip a BOM and convert CRLF line endings"""
+    text = text.replace('\r\n', '\n')
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    return text
+
+
+def scan_config(text, filename=None):
+    """
+    _scan_config_
+
+    Generate the section headers and keys in normalised gitconfig
+    text in file order, as tuples of
+
+    ('section', name, start, end) for headers
+    ('entry', section name, key, value, start, end) for keys
+
+    where start, end are the offsets of the header or of the key
+    through to the end of its line. Section names are lowercased
+    with any subsection appended after a dot, keys are lowercased
+    and value is None for keys with no value.
+
+    :raises GitConfigParseError: for invalid syntax
+
+    """
+    length = len(text)
+    pos = 0
+    line = 1
+    section = None
+    while pos < length:
+        char = text[pos]
+        if char == '\n':
+            line += 1
+            pos += 1
+        elif char.isspace():
+            pos += 1
+        elif char in '#;':
+            end = text.find('\n', pos)
+            pos = length if end == -1 else end
+        elif char == '[':
+            start = pos
+            section, pos = _parse_section(text, pos + 1, filename, line)
+            yield ('section', section, start, pos)
+        elif char in string.ascii_letters:
+            if section is None:
+                raise _parse_error("key outside a section", filename, line)
+            start = pos
+            while pos < length and text[pos] in KEY_CHARS:
+                pos += 1
+            key = text[start:pos].lower()
+            while pos < length and text[pos] in ' \t':
+                pos += 1
+            if pos >= length or text[pos] == '\n':
+                value = None
+                end = min(pos + 1, length)
+            elif text[pos] == '=':
+                value, pos, line = _parse_value(text, pos + 1, filename, line)
+                pos = end = min(pos, length)
+            else:
+                raise _parse_error("bad key", filename, line)
+            yield ('entry', section, key, value, start, end)
+        else:
+            raise _parse_error("unexpected character", filename, line)
+
+
+def parse_config(text, filename=None, depth=0):
+    """
+    _parse_config_
+
+    Parse gitconfig text into a list of (name, value) tuples in file
+    order, the same as git config -l, with names of the form
+    section.key or section.subsection.key and value None for keys
+    with no value. include and includeIf entries are expanded in
+    place, relative include paths are resolved against filename.
+
+    :raises GitConfigParseError: for invalid syntax
+
+    """
+    entries = []
+    for item in scan_config(_normalise(text), filename):
+        if item[0] != 'entry':
+            continue
+        _, section, key, value, _, _ = item
+        entries.append(('{0}.{1}'.format(section, key), value))
+        entries.extend(_include(section, key, value, filename, depth))
+    return entries
+
+
+def _include(section, key, value, filename, depth):
+    """entries from an include or includeIf entry, if it is one"""
+    if key != 'path':
+        return []
+    if section == 'include':
+        condition = None
+    elif section.startswith('includeif.'):
+        condition = section[len('includeif.'):]
+    else:
+        return []
+    if value is None:
+        raise GitConfigParseError("missing value for include path")
+    if condition is not None and not include_condition(condition, filename):
+        return []
+    path = os.path.expanduser(value)
+    if not os.path.isabs(path):
+        if filename is None:
+            raise GitConfigParseError(
+                "relative include path with no including file"
+            )
+        path = os.path.join(os.path.dirname(filename), path)
+    if depth + 1 > MAX_INCLUDE_DEPTH:
+        raise GitConfigParseError(
+            "exceeded maximum include depth including {0}".format(path)
+        )
+    return read_config_file(path, depth + 1)
+
+
+def read_config_file(filename, depth=0):
+    """
+    parse a gitconfig file and the files it includes, a missing
+    file has no entries
+    """
+    try:
+        with open(filename, 'r', encoding='utf-8') as handle:
+            text = handle.read()
+    except (IOError, OSError):
+        return []
+    except UnicodeDecodeError as ex:
+        raise GitConfigParseError(str(ex))
+    return parse_config(text, filename=filename, depth=depth)
+
+
+def split_name(section, param):
+    """
+    split a section, param pair as used by GitConfig into the
+    section name as returned by scan_config, the section, the
+    subsection or None and the lowercased key
+    """
+    head, key = '{0}.{1}'.format(section, param).rsplit('.', 1)
+    base, _, subsection = head.partition('.')
+    if not subsection:
+        subsection = None
+        name = base.lower()
+    else:
+        name = '{0}.{1}'.format(base.lower(), subsection)
+    return name, base.lower(), subsection, key.lower()
+
+
+def format_value(value):
+    """escape and if needed quote a value for writing to a gitconfig"""
+    value = str(value)
+    escaped = value
+    for char, escape in (
+            ('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'),
+            ('\t', '\\t'), ('\b', '\\b')):
+        escaped = escaped.replace(char, escape)
+    if value != value.strip(' ') or ';' in value or '#' in value:
+        escaped = '"{0}"'.format(escaped)
+    return escaped
+
+
+def format_section(base, subsection):
+    """format a section header"""
+    if subsection is None:
+        return '[{0}]'.format(base)
+    subsection = subsection.replace('\\', '\\\\').replace('"', '\\"')
+    return '[{0} "{1}"]'.format(base, subsection)
+
+
+def set_in_text(text, section, param, value):
+    """
+    _set_in_text_
+
+    Set a parameter in normalised gitconfig text, replacing the last
+    existing value of the key or else adding it to the end of the last
+    block of the section, adding the section if it doesnt exist
+
+    :returns: the updated text
+
+    """
+    name, base, subsection, key = split_name(section, param)
+    current = None
+    last = None
+    match = None
+    for item in scan_config(text):
+        if item[0] == 'section':
+            current = item[1]
+            if current == name:
+                last = item
+        elif current == name:
+            last = item
+            if item[2] == key:
+                match = item
+    line = '{0} = {1}\n'.format(key, format_value(value))
+    if match is not None:
+        start, end = match[-2:]
+        return text[:start] + line + text[end:]
+    if last is not None:
+        if last[0] == 'entry':
+            pos = last[-1]
+        else:
+            pos = text.find('\n', last[-1])
+            pos = len(text) if pos == -1 else pos + 1
+        prefix = '' if text[pos - 1:pos] in ('', '\n') else '\n'
+        return text[:pos] + prefix + '\t' + line + text[pos:]
+    prefix = '' if text[-1:] in ('', '\n') else '\n'
+    return text + prefix + format_section(base, subsection) + '\n\t' + line
+
+
+def unset_in_text(text, section, param):
+    """
+    _unset_in_text_
+
+    Remove all values of a parameter from normalised gitconfig text
+
+    :returns: the updated text
+
+    """
+    name, _, _, key = split_name(section, param)
+    spans = [
+        item[-2:] for item in scan_config(text)
+        if item[0] == 'entry' and item[1] == name and item[2] == key
+    ]
+    for start, end in reversed(spans):
+        line_start = text.rfind('\n', 0, start) + 1
+        if not text[line_start:start].strip():
+            start = line_start
+        text = text[:start] + text[end:]
+    return text
+
+
 class GitConfigSection(object):
     """
     helper/wrapper for a section of the gitconfig
@@ -88,7 +570,10 @@ class GitConfig(dict):
         super(GitConfig, self).__init__(self)
         if filename is None:
             filename = '${HOME}/.gitconfig'
-        self.filename = os.path.expanduser(filename)
+        self.filename = os.path.expandvars(os.path.expanduser(filename))
+        self.entries = []
+        self._batch_depth = 0
+        self._pending = []
 
     @property
     def command(self):
@@ -98,11 +583,13 @@ class GitConfig(dict):
     def parse(self):
         """re-read and parse all elements of git config and populate self"""
         self.clear()
-        result = shell_command(self.command + " -l")
-        for line in result.split('\n'):
-            section, param_val = line.split('.', 1)
+        try:
+            self.entries = read_config_file(self.filename)
+        except GitConfigParseError:
+            self.entries = git_config_list(self.filename)
+        for name, value in self.entries:
+            section, param = name.split('.', 1)
             sect_dict = self.setdefault(section, {})
-            param, value = param_val.split('=', 1)
             sect_dict[param] = value
 
     @property
@@ -118,8 +605,15 @@ class GitConfig(dict):
 
     def get_param(self, section, param, default=None):
         """get a parameter from a section"""
+        if section not in self:
+            return default
         return self[section].get(param, default)
 
+    def get_all(self, section, param):
+        """get all the values of a multi valued parameter"""
+        name = '{0}.{1}'.format(section, param)
+        return [v for n, v in self.entries if n == name]
+
     def has_param(self, section, param, validator=lambda x: x is not None):
         """check parameter is present in section with optional validator"""
         if param not in section:
@@ -129,18 +623,122 @@ class GitConfig(dict):
     def add_section(self, section):
         """add a new section, returns section instance"""
         self.set_param(section, 'cirrus-section-init-xyz', 'xyz')
-        self.parse()
         return self[section]
 
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        _batch_
+
+        Collect the set_param and unset_param calls made in the
+        with block and write them to the file in a single atomic
+        rewrite when the outermost batch exits. The in memory view
+        is updated as each call is made. If the block raises, nothing
+        is written and the file is reread.
+
+        with config.batch():
+            config.set_param('cirrus', 'github-user', user)
+            config.set_param('cirrus', 'github-token', token)
+
+        """
+        self._batch_depth += 1
+        completed = False
+        try:
+            yield self
+            completed = True
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                pending, self._pending = self._pending, []
+                if not completed:
+                    self.parse()
+                elif pending:
+                    self._write(pending)
+
     def set_param(self, section, param, value):
         """set/add parameter in section"""
-        shell_command(self.command + ' {0}.{1} \"{2}\"'.format(section, param, str(value)))
-        self.parse()
+        with self.batch():
+            self._pending.append(('set', section, param, str(value)))
+            _, base, subsection, key = split_name(section, param)
+            if subsection is not None:
+                key = '{0}.{1}'.format(subsection, key)
+            self.setdefault(base, {})[key] = str(value)
+            full_name = '{0}.{1}'.format(base, key)
+            for index in reversed(range(len(self.entries))):
+                if self.entries[index][0] == full_name:
+                    self.entries[index] = (full_name, str(value))
+                    break
+            else:
+                self.entries.append((full_name, str(value)))
 
     def unset_param(self, section, param):
         """unset a parameter in the section provided"""
-        shell_command(self.command + " --unset {0}.{1}".format(section, param))
-        self.parse()
+        with self.batch():
+            self._pending.append(('unset', section, param, None))
+            _, base, subsection, key = split_name(section, param)
+            if subsection is not None:
+                key = '{0}.{1}'.format(subsection, key)
+            self.get(base, {}).pop(key, None)
+            full_name = '{0}.{1}'.format(base, key)
+            self.entries = [x for x in self.entries if x[0] != full_name]
+
+    def _write(self, changes):
+        """
+        apply a list of (action, section, param, value) changes to
+        the file, holding the same lock file git config uses and
+        replacing the file with the updated copy
+        """
+        path = os.path.realpath(self.filename)
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                text = _normalise(handle.read())
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            text, mode = '', None
+        try:
+            for action, section, param, value in changes:
+                if action == 'set':
+                    text = set_in_text(text, section, param, value)
+                else:
+                    text = unset_in_text(text, section, param)
+        except GitConfigParseError:
+            self._write_with_git(changes)
+            return
+
+        lock = '{0}.lock'.format(path)
+        try:
+            fd = os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            msg = "Unable to write {0}, {1} exists".format(path, lock)
+            raise RuntimeError(msg)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+                handle.write(text)
+                handle.flush()
+                os.fsync(handle.fileno())
+            if mode is not None:
+                os.chmod(lock, mode)
+            os.replace(lock, path)
+        except Exception:
+            if os.path.exists(lock):
+                os.unlink(lock)
+            raise
+
+    def _write_with_git(self, changes):
+        """apply changes with git config for files we cant parse"""
+        for action, section, param, value in changes:
+            command = ['git', 'config', '--file', self.filename]
+            name = '{0}.{1}'.format(section, param)
+            if action == 'set':
+                command.extend([name, value])
+            else:
+                command.extend(['--unset-all', name])
+            process = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+            )
+            stdout, _ = process.communicate()
+            if process.returncode not in (0, 5):
+                raise RuntimeError(stdout)
 
     @property
     def exists(self):
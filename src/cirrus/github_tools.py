@@ -2,16 +2,43 @@
 Contains class for handling the creation of pull requests
 """
 import time
+import itertools
+import collections
 
-import arrow
-import git
-import requests
+from cirrus.branch_classifier import BranchClassifier
 from cirrus.configuration import get_github_auth, load_configuration, get_github_api_base
+from cirrus.git_session import get_session
 from cirrus.git_tools import get_active_branch, push
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
 
+arrow = lazy_import('arrow')
+git = lazy_import('git')
+requests = lazy_import('requests')
+
 LOGGER = get_logger()
 
+#
+# remote branches deleted by a single git push --delete
+#
+DELETE_BATCH_SIZE = 200
+
+
+def parse_push_porcelain(output):
+    """
+    parse git push --porcelain output into a dict of
+    remote ref name: (flag, summary), where flag is - for
+    deleted refs and ! for rejected refs
+    """
+    result = {}
+    for line in output.splitlines():
+        fields = line.split('\t')
+        if len(fields) < 3:
+            continue
+        remote_ref = fields[1].rpartition(':')[2]
+        result[remote_ref] = (fields[0], fields[2])
+    return result
+
 
 class GitHubContext:
     """
@@ -23,7 +50,8 @@ class GitHubContext:
     """
     def __init__(self, repo_dir, package_dir=None):
         self.repo_dir = repo_dir
-        self.repo = git.Repo(repo_dir)
+        self.git_session = get_session(repo_dir)
+        self.repo = self.git_session.repo
         self.config = load_configuration(package_dir)
         self.gh_user, self.token = get_github_auth()
         self.auth_headers = {
@@ -198,7 +226,9 @@ class GitHubContext:
         if branch_name is not None:
             self.repo.git.checkout(branch_name)
         ref = "refs/heads/{0}:refs/remotes/origin/{0}".format(branch_name)
-        return self.repo.remotes.origin.pull(ref)
+        result = self.repo.remotes.origin.pull(ref)
+        self.git_session.refresh_refs()
+        return result
 
     def push_branch(self, branch_name=None):
         """
@@ -210,6 +240,7 @@ class GitHubContext:
         if branch_name is not None:
             self.repo.git.checkout(branch_name)
         ret = self.repo.remotes.origin.push(self.repo.head)
+        self.git_session.refresh_refs()
         # Check to make sure that we haven't errored out.
         for r in ret:
             if r.flags >= r.ERROR:
@@ -246,6 +277,48 @@ class GitHubContext:
             )
             raise RuntimeError(msg)
 
+    def push_atomic(self, refspecs, remote='origin'):
+        """
+        _push_atomic_
+
+        Push a list of refspecs to remote with a single
+        git push --atomic, so that either all the refs are
+        updated or none of them are
+        """
+        try:
+            return self.repo.git.push('--atomic', remote, *refspecs)
+        except git.exc.GitCommandError as ex:
+            raise RuntimeError(str(ex))
+        finally:
+            self.git_session.refresh_refs()
+
+    def push_atomic_with_retry(self, refspecs, attempts=300, cooloff=2):
+        """
+        _push_atomic_with_retry_
+
+        push_atomic with the same retry loop as push_branch_with_retry,
+        retrying the whole batch of refspecs
+
+        """
+        count = 0
+        error_flag = None
+        while count < attempts:
+            try:
+                error_flag = None
+                self.push_atomic(refspecs)
+                break
+            except RuntimeError as ex:
+                msg = "Error pushing {}: {}".format(' '.join(refspecs), str(ex))
+                LOGGER.info(msg)
+                count += 1
+                error_flag = ex
+                time.sleep(cooloff)
+        if error_flag is not None:
+            msg = "Unable to push {} due to repeated failures: {}".format(
+                ' '.join(refspecs), str(error_flag)
+            )
+            raise RuntimeError(msg)
+
     def merge_branch(self, branch_name):
         """
         _merge_branch_
@@ -253,6 +326,7 @@ class GitHubContext:
         merge branch_name into current branch using no-ff option
         """
         result = self.repo.git.merge('--no-ff', branch_name)
+        self.git_session.refresh_refs()
         return result
 
     def tag_release(self, tag, master='master', push=True):
@@ -265,8 +339,7 @@ class GitHubContext:
         if self.active_branch_name != master:
             self.repo.git.checkout(master)
 
-        exists = any(existing_tag.name == tag for existing_tag in self.repo.tags)
-        if exists:
+        if self.git_session.refs.has_tag(tag):
             # tag already exists
             msg = (
                 "Attempting to create tag {0} on "
@@ -274,8 +347,10 @@ class GitHubContext:
             ).format(tag, master)
             raise RuntimeError(msg)
         self.repo.create_tag(tag)
+        self.git_session.refresh_refs()
         if push:
             self.repo.remotes.origin.push(self.repo.head, tags=True)
+            self.git_session.refresh_refs()
 
     def delete_branch(self, branch_name, remote=True):
         """
@@ -289,6 +364,67 @@ class GitHubContext:
         self.repo.git.branch('-D', branch_name)
         if remote:
             self.repo.git.push('origin', '--delete', branch_name)
+        self.git_session.refresh_refs()
+
+    def delete_remote_branches(self, branch_names, remote='origin',
+                               batch_size=DELETE_BATCH_SIZE):
+        """
+        _delete_remote_branches_
+
+        Delete branches from remote with one git push --delete per
+        batch_size branches. A batch that git refuses to push because
+        some of the branches are already gone is split in half and
+        retried to find them. Any other failure of a whole batch, eg
+        bad credentials or an unreachable remote, fails all the
+        remaining branches without pushing them.
+
+        :returns: list of deleted branch names and an OrderedDict
+          of branch name: error for the branches that werent deleted
+
+        """
+        branch_names = list(branch_names)
+        deleted = []
+        failed = collections.OrderedDict()
+        batches = [
+            branch_names[start:start + batch_size]
+            for start in range(0, len(branch_names), batch_size)
+        ]
+        while batches:
+            batch = batches.pop(0)
+            LOGGER.info(
+                "Deleting {0} branches from {1}".format(len(batch), remote)
+            )
+            _, stdout, stderr = self.repo.git.push(
+                '--porcelain', remote, '--delete', *batch,
+                with_extended_output=True,
+                with_exceptions=False
+            )
+            results = parse_push_porcelain(stdout)
+            missing = 'remote ref does not exist' in stderr
+            if not results and missing and len(batch) > 1:
+                middle = len(batch) // 2
+                batches[:0] = [batch[:middle], batch[middle:]]
+                continue
+            if not results and not missing:
+                error = stderr.strip()
+                LOGGER.error(
+                    "Unable to delete branches from {0}: {1}".format(
+                        remote, error
+                    )
+                )
+                for name in itertools.chain(batch, *batches):
+                    failed[name] = error
+                break
+            for name in batch:
+                flag, summary = results.get(
+                    'refs/heads/{0}'.format(name), (None, stderr.strip())
+                )
+                if flag == '-':
+                    deleted.append(name)
+                else:
+                    failed[name] = summary
+        self.git_session.refresh_refs()
+        return deleted, failed
 
     def iter_github_branches(self):
         """
@@ -319,18 +455,17 @@ class GitHubContext:
     def iter_git_branches(self, merged=False):
         """
         iterate over all git branches, remote and local,
-        using git branch -a.
+        named as by git branch -a.
 
-        Optionally filter for only branches that have been merged
-        using passing merged=True
+        By default only branches that are not merged into the
+        current branch are included, pass merged=True to include
+        merged branches as well
 
         """
-        args = ['-a']
+        only = None
         if not merged:
-            args.append('--no-merged')
-        branch_data = self.repo.git.branch(*args)
-        branches = (x.strip() for x in branch_data.split() if x.strip())
-        for b in branches:
+            only = self.git_session.unmerged_refs()
+        for b in self.git_session.refs.branch_names(only):
             yield b
 
     def iter_git_feature_branches(self, merged=False):
@@ -346,6 +481,32 @@ class GitHubContext:
         branches = filter(lambda x: x.startswith(feature_pfix), branches)
         return branches
 
+    def branch_classifier(self):
+        """
+        BranchClassifier for the branches of origin against
+        the develop and master branches
+        """
+        return BranchClassifier(
+            self.git_session,
+            [
+                self.config.gitflow_branch_name(),
+                self.config.gitflow_master_name()
+            ]
+        )
+
+    def classify_branches(self, prefixes=None, local=True, counts=True):
+        """
+        _classify_branches_
+
+        BranchInfo for each branch with its merged status against
+        the develop and master branches, and ahead/behind counts
+        against develop, see BranchClassifier.classify
+
+        """
+        return self.branch_classifier().classify(
+            prefixes, local=local, counts=counts
+        )
+
     def pull_requests(self, user=None):
         """
         _pull_requests_
@@ -485,7 +646,7 @@ def current_branch_mark_status(repo_dir, state):
 
     config = load_configuration()
     token = get_github_auth()[1]
-    sha = git.Repo(repo_dir).head.commit.hexsha
+    sha = get_session(repo_dir).resolve('HEAD')
 
     try:
         # @HACK: Do a push that we expect will fail -- we just want to
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+_lazy_import_
+
+Deferred imports for the heavy third party modules used by
+cirrus commands, so that a dependency is only imported when it
+is first used rather than when the command module is imported.
+
+Usage:
+
+from cirrus.lazy_import import lazy_import, lazy_callable
+
+git = lazy_import('git')
+run = lazy_callable('invoke', 'run')
+
+git.Repo(repo_dir)   # imports git on first attribute access
+run('ls')            # imports invoke on first call
+
+"""
+import importlib
+
+
+class LazyModule(object):
+    """
+    _LazyModule_
+
+    Stand in for a module that imports the real module on
+    first attribute access and delegates to it from then on.
+
+    """
+    def __init__(self, module_name):
+        self._lazy_name = module_name
+        self._lazy_module = None
+
+    def _lazy_load(self):
+        """import the real module if needed and return it"""
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        if attr.startswith('_') and self._lazy_module is None:
+            # introspection (mock, inspect, copy etc) probes for
+            # private and special attributes, which shouldnt
+            # trigger the import
+            raise AttributeError(attr)
+        return getattr(self._lazy_load(), attr)
+
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+    def __repr__(self):
+        state = 'loaded' if self._lazy_module is not None else 'not loaded'
+        return "<LazyModule {0} ({1})>".format(self._lazy_name, state)
+
+
+def lazy_import(module_name):
+    """
+    _lazy_import_
+
+    :param module_name: dotted name of the module to import
+    :returns: LazyModule proxy for the named module
+
+    """
+    return LazyModule(module_name)
+
+
+def lazy_callable(module_name, attr):
+    """
+    _lazy_callable_
+
+    Wrapper for a function in a module that is imported the first
+    time the function is called, eg for from module import func
+    style imports.
+
+    :param module_name: dotted name of the module to import
+    :param attr: name of the callable in the module
+    :returns: function that calls through to module.attr
+
+    """
+    module = lazy_import(module_name)
+
+    def wrapper(*args, **kwargs):
+        return getattr(module, attr)(*args, **kwargs)
+    wrapper.__name__ = attr
+    wrapper.__doc__ = "lazily imported {0}.{1}".format(module_name, attr)
+    wrapper.lazy_module = module
+    return wrapper
+
+
+def load_lazy_modules(module):
+    """
+    _load_lazy_modules_
+
+    Import all the lazily imported modules referenced at the
+    top level of module now, eg to warm up a long running process.
+
+    :param module: module object to inspect
+    :returns: list of names of lazy modules that failed to import
+
+    """
+    failed = []
+    for value in list(vars(module).values()):
+        if isinstance(value, LazyModule):
+            lazy = value
+        elif callable(value) and hasattr(value, 'lazy_module'):
+            lazy = value.lazy_module
+        else:
+            continue
+        try:
+            lazy._lazy_load()
+        except Exception:
+            failed.append(lazy._lazy_name)
+    return failed
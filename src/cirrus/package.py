@@ -19,14 +19,13 @@ import inspect
 import os
 import sys
 
-import pystache
 import configparser
-import pluggage.registry
 
 import cirrus.templates
 
 from argparse import ArgumentParser
 
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
 from cirrus.utils import update_version
 from cirrus.git_tools import (
@@ -39,6 +38,9 @@ from cirrus.git_tools import (
 )
 
 
+pystache = lazy_import('pystache')
+pluggage_registry = lazy_import('pluggage.registry')
+
 DEFAULT_HISTORY_SENTINEL = "\nCIRRUS_HISTORY_SENTINEL\n"
 LOGGER = get_logger()
 
@@ -49,7 +51,7 @@ def get_plugin(plugin_name):
 
     Get the editor plugin
     """
-    factory = pluggage.registry.get_factory(
+    factory = pluggage_registry.get_factory(
         'editors',
         load_modules=['cirrus.plugins.editors']
     )
@@ -57,7 +59,7 @@ def get_plugin(plugin_name):
 
 
 def list_plugins():
-    factory = pluggage.registry.get_factory(
+    factory = pluggage_registry.get_factory(
         'editors',
         load_modules=['cirrus.plugins.editors']
     )
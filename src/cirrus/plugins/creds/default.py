@@ -32,6 +32,10 @@ class Default(CredsPlugin):
             self.gitconfig_file = os.path.join(os.environ['HOME'], '.gitconfig')
         self.config = load_gitconfig(self.gitconfig_file)
 
+    def batch(self):
+        """write credentials set in the with block in one update"""
+        return self.config.batch()
+
     def github_credentials(self):
         github_user = self.config.get_param('cirrus', 'github-user')
         github_token = self.config.get_param('cirrus', 'github-token')
@@ -41,8 +45,9 @@ class Default(CredsPlugin):
         }
 
     def set_github_credentials(self, username, token):
-        self.config.set_param('cirrus', 'github-user', username)
-        self.config.set_param('cirrus', 'github-token', token)
+        with self.batch():
+            self.config.set_param('cirrus', 'github-user', username)
+            self.config.set_param('cirrus', 'github-token', token)
 
     def pypi_credentials(self):
         pypi_user = self.config.get_param('cirrus', 'pypi-user')
@@ -53,8 +58,9 @@ class Default(CredsPlugin):
         }
 
     def set_pypi_credentials(self, username, token):
-        self.config.set_param('cirrus', 'pypi-user', username)
-        self.config.set_param('cirrus', 'pypi-token', token)
+        with self.batch():
+            self.config.set_param('cirrus', 'pypi-user', username)
+            self.config.set_param('cirrus', 'pypi-token', token)
 
     def ssh_credentials(self):
         pypi_ssh_user = self.config.get_param('cirrus', 'ssh-user')
@@ -65,8 +71,9 @@ class Default(CredsPlugin):
         }
 
     def set_ssh_credentials(self, user, keyfile):
-        self.config.set_param('cirrus', 'ssh-user', user)
-        self.config.set_param('cirrus', 'ssh-key', keyfile)
+        with self.batch():
+            self.config.set_param('cirrus', 'ssh-user', user)
+            self.config.set_param('cirrus', 'ssh-key', keyfile)
 
     def buildserver_credentials(self):
         """
@@ -78,8 +85,9 @@ class Default(CredsPlugin):
         }
 
     def set_buildserver_credentials(self, user, token):
-        self.config.set_param('cirrus', 'buildserver-user', user)
-        self.config.set_param('cirrus', 'buildserver-token', token)
+        with self.batch():
+            self.config.set_param('cirrus', 'buildserver-user', user)
+            self.config.set_param('cirrus', 'buildserver-token', token)
 
     def chef_credentials(self):
         """
@@ -99,11 +107,12 @@ class Default(CredsPlugin):
         if client_key is None:
             client_key = keyfile
 
-        self.config.set_param('cirrus', 'chef-server', server)
-        self.config.set_param('cirrus', 'chef-username', username)
-        self.config.set_param('cirrus', 'chef-keyfile', keyfile)
-        self.config.set_param('cirrus', 'chef-client-user', client_user)
-        self.config.set_param('cirrus', 'chef-client-keyfile', client_key)
+        with self.batch():
+            self.config.set_param('cirrus', 'chef-server', server)
+            self.config.set_param('cirrus', 'chef-username', username)
+            self.config.set_param('cirrus', 'chef-keyfile', keyfile)
+            self.config.set_param('cirrus', 'chef-client-user', client_user)
+            self.config.set_param('cirrus', 'chef-client-keyfile', client_key)
 
     def dockerhub_credentials(self):
         return {
@@ -113,9 +122,10 @@ class Default(CredsPlugin):
         }
 
     def set_dockerhub_credentials(self, email, user, password):
-        self.config.set_param('cirrus', 'docker-login-username', user)
-        self.config.set_param('cirrus', 'docker-login-email', email)
-        self.config.set_param('cirrus', 'docker-login-password', password)
+        with self.batch():
+            self.config.set_param('cirrus', 'docker-login-username', user)
+            self.config.set_param('cirrus', 'docker-login-email', email)
+            self.config.set_param('cirrus', 'docker-login-password', password)
 
     def file_server_credentials(self):
         return {
@@ -124,5 +134,6 @@ class Default(CredsPlugin):
         }
 
     def set_file_server_credentials(self, username, keyfile):
-        self.config.set_param('cirrus', 'file-server-username', username)
-        self.config.set_param('cirrus', 'file-server-keyfile', keyfile)
+        with self.batch():
+            self.config.set_param('cirrus', 'file-server-username', username)
+            self.config.set_param('cirrus', 'file-server-keyfile', keyfile)
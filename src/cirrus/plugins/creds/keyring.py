@@ -2,9 +2,66 @@
 """
 keyring module plugin
 
+All the cirrus credentials are stored together as a single JSON
+secret in the keyring, read once per process and cached, since each
+keyring lookup can be a slow round trip to the platform keyring
+service. Credentials stored as one secret per field by earlier
+versions are migrated to the single secret the first time they
+are read, and then removed from the keyring.
+
+If the cirrus creds agent is running the credentials are shared
+with later commands through it.
+
 """
-from . import keyring
+import json
+import contextlib
+
 from cirrus.creds_plugin import CredsPlugin
+from cirrus.lazy_import import lazy_import
+from cirrus.logger import get_logger
+
+keyring = lazy_import('keyring')
+
+LOGGER = get_logger()
+
+#
+# keyring username for the secret holding all the credentials
+#
+CREDENTIALS_SECRET = 'cirrus-credentials'
+
+#
+# per field secrets used by earlier versions of this plugin
+#
+LEGACY_FIELDS = [
+    'github-user',
+    'github-token',
+    'pypi-user',
+    'pypi-token',
+    'ssh-user',
+    'ssh-key',
+    'buildserver-user',
+    'buildserver-token',
+    'chef-server',
+    'chef-username',
+    'chef-keyfile',
+    'chef-client-user',
+    'chef-client-keyfile',
+    'docker_login_username',
+    'docker_login_email',
+    'docker_login_password',
+    'file-server-username',
+    'file-server-keyfile',
+]
+
+#
+# credentials read from the keyring in this process, by section
+#
+_CREDENTIALS_CACHE = {}
+
+
+def clear_cache():
+    """drop the cached credentials so they are reread"""
+    _CREDENTIALS_CACHE.clear()
 
 
 class Keyring(CredsPlugin):
@@ -21,6 +78,8 @@ class Keyring(CredsPlugin):
     def __init__(self):
         self.keyring = None
         self.section = "cirrus"
+        self._batch_depth = 0
+        self._pending = {}
         super(Keyring, self).__init__()
 
     def load(self):
@@ -29,65 +88,157 @@ class Keyring(CredsPlugin):
         """
         self.keyring = keyring.get_keyring()
 
+    def credentials(self):
+        """
+        get the dict of all credential fields, reading the keyring
+        only if they are not already cached in this process or
+        the creds agent
+        """
+        if self.section not in _CREDENTIALS_CACHE:
+            credentials = self.agent_lookup(self.section)
+            if credentials is None:
+                credentials = self._read_secret()
+                self.agent_store(self.section, credentials)
+            _CREDENTIALS_CACHE[self.section] = credentials
+        return _CREDENTIALS_CACHE[self.section]
+
+    def _read_secret(self):
+        secret = self.keyring.get_password(self.section, CREDENTIALS_SECRET)
+        if secret is not None:
+            try:
+                return json.loads(secret)
+            except ValueError:
+                LOGGER.warning(
+                    "Unreadable cirrus credentials in keyring, "
+                    "migrating from individual entries"
+                )
+        return self._migrate_secrets()
+
+    def _migrate_secrets(self):
+        """
+        read the per field secrets from earlier versions and store
+        them as the single credentials secret, then delete them.
+        Nothing is written if there are no per field secrets.
+        """
+        result = {}
+        for field in LEGACY_FIELDS:
+            value = self.keyring.get_password(self.section, field)
+            if value is not None:
+                result[field] = value
+        if not result:
+            return result
+        self._write_secret(result)
+        LOGGER.info(
+            "Migrated {0} cirrus credentials to the {1} keyring entry".format(
+                len(result), CREDENTIALS_SECRET
+            )
+        )
+        for field in result:
+            try:
+                self.keyring.delete_password(self.section, field)
+            except Exception as ex:
+                LOGGER.warning(
+                    "Unable to remove migrated keyring entry {0}: {1}".format(
+                        field, ex
+                    )
+                )
+        return result
+
+    def _write_secret(self, credentials):
+        self.keyring.set_password(
+            self.section,
+            CREDENTIALS_SECRET,
+            json.dumps(credentials, sort_keys=True)
+        )
+
+    def get(self, field):
+        """get a single credential field"""
+        return self.credentials().get(field)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        store all the credentials set in the with block in a
+        single keyring update
+        """
+        self._batch_depth += 1
+        completed = False
+        try:
+            yield self
+            completed = True
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                pending, self._pending = self._pending, {}
+                if completed and pending:
+                    credentials = dict(self.credentials())
+                    credentials.update(pending)
+                    self._write_secret(credentials)
+                    _CREDENTIALS_CACHE[self.section] = credentials
+                    self.agent_store(self.section, credentials)
+
+    def set(self, field, value):
+        """set a single credential field"""
+        with self.batch():
+            self._pending[field] = value
+
     def github_credentials(self):
-        github_user = self.keyring.get_password(self.section, 'github-user')
-        github_token = self.keyring.get_password(self.section, 'github-token')
         return {
-            'github_user': github_user,
-            'github_token': github_token
+            'github_user': self.get('github-user'),
+            'github_token': self.get('github-token')
         }
 
     def set_github_credentials(self, username, token):
-        self.keyring.set_password(self.section, 'github-user', username)
-        self.keyring.set_password(self.section, 'github-token', token)
+        with self.batch():
+            self.set('github-user', username)
+            self.set('github-token', token)
 
     def pypi_credentials(self):
-        pypi_user = self.keyring.get_password(self.section, 'pypi-user')
-        pypi_token = self.keyring.get_password(self.section, 'pypi-token')
         return {
-            'username': pypi_user,
-            'token': pypi_token
+            'username': self.get('pypi-user'),
+            'token': self.get('pypi-token')
         }
 
     def set_pypi_credentials(self, username, token):
-        self.keyring.set_password(self.section, 'pypi-user', username)
-        self.keyring.set_password(self.section, 'pypi-token', token)
+        with self.batch():
+            self.set('pypi-user', username)
+            self.set('pypi-token', token)
 
     def ssh_credentials(self):
-        pypi_ssh_user = self.keyring.get_password(self.section, 'ssh-user')
-        pypi_key = self.keyring.get_password(self.section, 'ssh-key')
         return {
-            'ssh_username': pypi_ssh_user,
-            'ssh_key': pypi_key
+            'ssh_username': self.get('ssh-user'),
+            'ssh_key': self.get('ssh-key')
         }
 
     def set_ssh_credentials(self, user, keyfile):
-        self.keyring.set_password(self.section, 'ssh-user', user)
-        self.keyring.set_password(self.section, 'ssh-key', keyfile)
+        with self.batch():
+            self.set('ssh-user', user)
+            self.set('ssh-key', keyfile)
 
     def buildserver_credentials(self):
         """
 
         """
         return {
-            'buildserver-user': self.keyring.get_password(self.section, 'buildserver-user'),
-            'buildserver-token': self.keyring.get_password(self.section, 'buildserver-token')
+            'buildserver-user': self.get('buildserver-user'),
+            'buildserver-token': self.get('buildserver-token')
         }
 
     def set_buildserver_credentials(self, user, token):
-        self.keyring.set_password(self.section, 'buildserver-user', user)
-        self.keyring.set_password(self.section, 'buildserver-token', token)
+        with self.batch():
+            self.set('buildserver-user', user)
+            self.set('buildserver-token', token)
 
     def chef_credentials(self):
         """
 
         """
         return {
-            'chef_server': self.keyring.get_password(self.section, 'chef-server'),
-            'chef_username': self.keyring.get_password(self.section, 'chef-username'),
-            'chef_keyfile': self.keyring.get_password(self.section, 'chef-keyfile'),
-            'chef_client_user': self.keyring.get_password(self.section, 'chef-client-user'),
-            'chef_client_keyfile': self.keyring.get_password(self.section, 'chef-client-keyfile')
+            'chef_server': self.get('chef-server'),
+            'chef_username': self.get('chef-username'),
+            'chef_keyfile': self.get('chef-keyfile'),
+            'chef_client_user': self.get('chef-client-user'),
+            'chef_client_keyfile': self.get('chef-client-keyfile')
         }
 
     def set_chef_credentials(self, server, username, keyfile, client_user=None, client_key=None):
@@ -95,30 +246,33 @@ class Keyring(CredsPlugin):
             client_user = username
         if client_key is None:
             client_key = keyfile
-        self.keyring.set_password(self.section, 'chef-server', server)
-        self.keyring.set_password(self.section, 'chef-username', username)
-        self.keyring.set_password(self.section, 'chef-keyfile', keyfile)
-        self.keyring.set_password(self.section, 'chef-client-user', client_user)
-        self.keyring.set_password(self.section, 'chef-client-keyfile', client_key)
+        with self.batch():
+            self.set('chef-server', server)
+            self.set('chef-username', username)
+            self.set('chef-keyfile', keyfile)
+            self.set('chef-client-user', client_user)
+            self.set('chef-client-keyfile', client_key)
 
     def dockerhub_credentials(self):
         return {
-            'username': self.keyring.get_password(self.section, 'docker_login_username'),
-            'email': self.keyring.get_password(self.section, 'docker_login_email'),
-            'password': self.keyring.get_password(self.section, 'docker_login_password')
+            'username': self.get('docker_login_username'),
+            'email': self.get('docker_login_email'),
+            'password': self.get('docker_login_password')
         }
 
     def set_dockerhub_credentials(self, email, user, password):
-        self.keyring.set_password(self.section, 'docker_login_username', user)
-        self.keyring.set_password(self.section, 'docker_login_email', email)
-        self.keyring.set_password(self.section, 'docker_login_password', password)
+        with self.batch():
+            self.set('docker_login_username', user)
+            self.set('docker_login_email', email)
+            self.set('docker_login_password', password)
 
     def file_server_credentials(self):
         return {
-            'file_server_username': self.keyring.get_password(self.section, 'file-server-username'),
-            'file_server_keyfile': self.keyring.get_password(self.section, 'file-server-keyfile')
+            'file_server_username': self.get('file-server-username'),
+            'file_server_keyfile': self.get('file-server-keyfile')
         }
 
     def set_file_server_credentials(self, username, keyfile):
-        self.keyring.set_password(self.section, 'file-server-username', username)
-        self.keyring.set_password(self.section, 'file-server-keyfile', keyfile)
+        with self.batch():
+            self.set('file-server-username', username)
+            self.set('file-server-keyfile', keyfile)
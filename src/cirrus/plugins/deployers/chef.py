@@ -25,7 +25,7 @@ from cirrus.fabric_helpers import FabricHelper
 from cirrus.logger import get_logger
 from cirrus.deploy_plugins import Deployer
 import cirrus.chef_tools as ct
-from cirrus.configuration import get_chef_auth
+from cirrus.configuration import convert_bool, get_chef_auth
 
 
 LOGGER = get_logger()
@@ -91,7 +91,8 @@ class ChefServerDeployer(Deployer):
                 args['chef_username'],
                 args['environment'],
                 attributes,
-                chef_repo=args['chef_repo']
+                chef_repo=args['chef_repo'],
+                worktree=convert_bool(args['chef_repo_worktree'])
             )
 
         if args['role'] is not None:
@@ -159,6 +160,7 @@ class ChefServerDeployer(Deployer):
             'query_attribute',
             'query_format_str',
             'chef_repo',
+            'chef_repo_worktree',
             'chef_server',
             'chef_username',
             'chef_keyfile',
@@ -250,6 +252,16 @@ class ChefServerDeployer(Deployer):
                 'environment files, if desired'
             )
         )
+        self.parser.add_argument(
+            '--chef-repo-worktree',
+            dest='chef_repo_worktree',
+            action='store_true',
+            default=None,
+            help=(
+                'Edit the chef-repo in a worktree instead of '
+                'its current checkout'
+            )
+        )
         self.parser.add_argument(
             '--chef-server',
             dest='chef_server',
@@ -1,7 +1,9 @@
-import requests
 from cirrus.configuration import get_buildserver_auth
+from cirrus.lazy_import import lazy_import
 from cirrus.logger import get_logger
 
+requests = lazy_import('requests')
+
 LOGGER = get_logger()
 
 
@@ -6,12 +6,14 @@ repo/cirrus independent util for flagging PRs in github as plusone'd
 
 """
 import os
-import git
 import sys
 import json
 import argparse
-import requests
 from .configuration import get_github_auth, get_github_api_base
+from .lazy_import import lazy_import
+
+git = lazy_import('git')
+requests = lazy_import('requests')
 
 
 class GitHubHelper(object):
@@ -17,47 +17,372 @@ Eg:
 carburetor==0.1.2
 then it will check out that tag in the local repo clone prior to installing
 
+Clones are made with --reference to a bare mirror of each repo kept
+in .cirrus/cache/mirrors in the cirrus home, or the dir set with the
+CIRRUS_MIRROR_CACHE env var, so only new objects are fetched over the
+network. An empty CIRRUS_MIRROR_CACHE disables the mirrors, and repos
+are then cloned with --filter=blob:none, shallow if a tag is needed.
+Existing clones are updated with a fetch instead of being cloned again.
+
+Mirrors and clones keep the plain https url of the repo as origin, the
+github credentials are passed to git through the environment and a
+credential helper given with -c, so they dont appear in git command
+lines, logs or the stored git config.
+
+Repos are cloned in parallel, --jobs at a time, with the git output
+for each prefixed with the requirement name, and then installed with
+a single pip install. Failed clones are listed at the end.
 
 """
 import os
+import re
+import sys
+import fcntl
 import shutil
+import hashlib
+import argparse
 import subprocess
+import concurrent.futures
 
-from pip.req import parse_requirements
-
+from cirrus.config_snapshot import SNAPSHOT_DIR, ensure_cache_dir
 from cirrus.configuration import load_configuration
 from cirrus.configuration import get_github_auth
+from cirrus.environment import cirrus_home
+from cirrus.lazy_import import lazy_callable
+from cirrus.logger import get_logger
+
+parse_requirements = lazy_callable('pip.req', 'parse_requirements')
+
+LOGGER = get_logger()
+
+MIRROR_DIR = 'mirrors'
+
+#
+# default number of repos to clone at once
+#
+DEFAULT_JOBS = 4
+
+
+def build_parser(argslist):
+    """
+    _build_parser_
+
+    Set up command line parser for the prestage command
+
+    """
+    parser = argparse.ArgumentParser(description='git cirrus prestage')
+    parser.add_argument('command', nargs='?')
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=DEFAULT_JOBS,
+        help='number of repos to clone at the same time'
+    )
+    opts = parser.parse_args(argslist)
+    return opts
+
+
+def mirror_cache_dir():
+    """
+    dir to keep repo mirrors in, or None if mirrors
+    are disabled with an empty CIRRUS_MIRROR_CACHE
+    """
+    cache_dir = os.environ.get('CIRRUS_MIRROR_CACHE')
+    if cache_dir is not None:
+        return cache_dir or None
+    cache_dir = os.path.join(cirrus_home(), SNAPSHOT_DIR, MIRROR_DIR)
+    try:
+        # keeps the cache out of git status if cirrus home is a repo
+        ensure_cache_dir(cache_dir)
+    except OSError as ex:
+        LOGGER.info("Unable to use mirror cache {0}: {1}".format(cache_dir, ex))
+        return None
+    return cache_dir
+
+
+def mirror_path(cache_dir, repo_url):
+    """path to the bare mirror of repo_url in cache_dir"""
+    name = re.sub(r'[^\w.-]+', '-', repo_url).strip('-.')
+    digest = hashlib.sha256(repo_url.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(cache_dir, '{0}-{1}.git'.format(name, digest))
+
+
+def github_clone_url(repo_url):
+    """https clone url for repo_url, without credentials"""
+    return 'https://{0}'.format(repo_url)
+
+
+def github_auth_env(auth=None):
+    """
+    environment for git commands that supplies the github user
+    and token, auth, to CREDENTIAL_ARGS. Looks up the github
+    credentials if auth is not provided.
+    """
+    gh_user, gh_tok = auth or get_github_auth()
+    env = dict(os.environ)
+    env.update({
+        'CIRRUS_GIT_USERNAME': gh_user or '',
+        'CIRRUS_GIT_PASSWORD': gh_tok or '',
+    })
+    return env
+
+
+#
+# git config options that replace any configured credential helpers
+# with one that answers with the credentials in the github_auth_env
+#
+CREDENTIAL_ARGS = (
+    '-c', 'credential.helper=',
+    '-c', (
+        'credential.helper=!f() { test "$1" = get && '
+        'echo "username=$CIRRUS_GIT_USERNAME" && '
+        'echo "password=$CIRRUS_GIT_PASSWORD"; }; f'
+    ),
+)
+
 
+def redact(text):
+    """remove credentials from any urls in text"""
+    return re.sub(r'://[^/@\s]+@', '://', text or '')
 
-def git_clone_repo(repo_url, dirname, tag=None):
+
+class GitCommandError(subprocess.CalledProcessError):
+    """
+    CalledProcessError for a git command that describes the
+    failure by the git subcommand rather than the full command
+    line, which can include credentials
+    """
+    def __str__(self):
+        return "git {0} failed with exit code {1}".format(
+            self.cmd[1], self.returncode
+        )
+
+
+def _git(*args, **kwargs):
+    """
+    run a git command, in cwd if provided, logging its
+    output with the prefix provided. The credentials from
+    github_auth_env are provided to git if env is provided.
+    """
+    env = kwargs.get('env')
+    command = ('git',)
+    if env is not None:
+        command += CREDENTIAL_ARGS
+    try:
+        output = subprocess.check_output(
+            command + args,
+            cwd=kwargs.get('cwd'),
+            env=env,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True
+        )
+    except subprocess.CalledProcessError as ex:
+        output = redact(ex.output)
+        _log_output(kwargs.get('prefix'), output)
+        raise GitCommandError(ex.returncode, ('git', args[0]), output=output)
+    _log_output(kwargs.get('prefix'), redact(output))
+    return output
+
+
+def _log_output(prefix, output):
+    for line in (output or '').splitlines():
+        LOGGER.info('{0}{1}'.format(prefix or '', line))
+
+
+def update_mirror(clone_url, path, prefix='', env=None):
+    """
+    _update_mirror_
+
+    Create the bare mirror of clone_url at path,
+    or fetch any new refs if it exists already.
+    Updates of the same mirror wait for each other.
+    env is the github_auth_env for the git commands.
+
+    """
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open('{0}.lock'.format(path), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.isdir(path):
+                LOGGER.info("{0}Updating mirror {1}".format(prefix, path))
+                # replaces urls with credentials saved by older versions
+                _git('remote', 'set-url', 'origin', clone_url, cwd=path)
+                _git(
+                    'fetch', '--quiet', '--prune', 'origin',
+                    cwd=path, prefix=prefix, env=env
+                )
+            else:
+                LOGGER.info("{0}Creating mirror {1}".format(prefix, path))
+                _git(
+                    'clone', '--quiet', '--mirror', clone_url, path,
+                    prefix=prefix, env=env
+                )
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return path
+
+
+def update_clone(dirname, tag=None, prefix='', clone_url=None, env=None):
+    """
+    _update_clone_
+
+    Fetch into an existing clone and check out tag,
+    or the remote default branch if tag is None.
+    clone_url replaces the url of origin if provided,
+    env is the github_auth_env for the fetch.
+
+    """
+    LOGGER.info("{0}Updating clone {1}".format(prefix, dirname))
+    if clone_url is not None:
+        _git('remote', 'set-url', 'origin', clone_url, cwd=dirname)
+    if os.path.exists(os.path.join(dirname, '.git', 'shallow')):
+        if tag is None:
+            _git(
+                'fetch', '--quiet', '--depth', '1', 'origin',
+                cwd=dirname, prefix=prefix, env=env
+            )
+        else:
+            _git(
+                'fetch', '--quiet', '--depth', '1', 'origin', 'tag', tag,
+                cwd=dirname, prefix=prefix, env=env
+            )
+    else:
+        _git(
+            'fetch', '--quiet', '--tags', 'origin',
+            cwd=dirname, prefix=prefix, env=env
+        )
+    if tag is not None:
+        _git('checkout', '--quiet', tag, cwd=dirname, prefix=prefix)
+        return
+    head = _git(
+        'symbolic-ref', '--short', 'refs/remotes/origin/HEAD', cwd=dirname
+    ).strip()
+    branch = head.split('/', 1)[1]
+    _git(
+        'checkout', '--quiet', '-B', branch, head, cwd=dirname, prefix=prefix
+    )
+
+
+def git_clone_repo(repo_url, dirname, tag=None, cache_dir=None, prefix='',
+                   auth=None):
     """
     _git_clone_repo_
 
     Get a local clone of the repo so that we can install
-    it locally via pip -e into the virtualenv
+    it locally via pip -e into the virtualenv.
+
+    An existing clone is updated with a fetch, new clones
+    reference the mirror of the repo in cache_dir if provided,
+    otherwise they are partial clones. Log messages are
+    prefixed with prefix. auth is the github (user, token),
+    looked up if not provided.
+
     """
-    gh_user, gh_tok = get_github_auth()
+    clone_url = github_clone_url(repo_url)
+    env = github_auth_env(auth)
+    if os.path.isdir(os.path.join(dirname, '.git')):
+        try:
+            update_clone(
+                dirname, tag, prefix=prefix, clone_url=clone_url, env=env
+            )
+            return
+        except subprocess.CalledProcessError as ex:
+            LOGGER.info(
+                "{0}Unable to update {1}, cloning again: {2}".format(
+                    prefix, dirname, ex
+                )
+            )
     if os.path.exists(dirname):
         shutil.rmtree(dirname)
-    clone_url = 'https://{0}:{1}@{2}'.format(gh_user, gh_tok, repo_url)
-    clone_comm = 'git clone {0} {1}'.format(clone_url, dirname)
-    subprocess.check_call(clone_comm, shell=True)
+
+    mirror = None
+    if cache_dir is not None:
+        try:
+            mirror = update_mirror(
+                clone_url, mirror_path(cache_dir, repo_url),
+                prefix=prefix, env=env
+            )
+        except (subprocess.CalledProcessError, OSError) as ex:
+            LOGGER.info(
+                "{0}Unable to use mirror for {1}: {2}".format(
+                    prefix, repo_url, ex
+                )
+            )
+
+    if mirror is not None:
+        _git(
+            'clone', '--quiet', '--reference', mirror, '--dissociate',
+            clone_url, dirname, prefix=prefix, env=env
+        )
+    elif tag is not None:
+        _git(
+            'clone', '--quiet', '--filter=blob:none', '--depth', '1',
+            '--branch', tag, clone_url, dirname, prefix=prefix, env=env
+        )
+    else:
+        _git(
+            'clone', '--quiet', '--filter=blob:none', clone_url, dirname,
+            prefix=prefix, env=env
+        )
     if tag is not None:
-        comm = 'cd {0} && git checkout {1}'.format(dirname, tag)
-        subprocess.check_call(comm, shell=True)
+        _git('checkout', '--quiet', tag, cwd=dirname, prefix=prefix)
 
 
-def install_from_repo(venv, local_repo):
+def install_from_repo(venv, *local_repos):
     """
     _install_from_repo_
 
-    install package from a local clone of the repo into the virtualenv
+    install packages from local clones of their repos into the
+    virtualenv with a single pip install
 
     """
-    command = ". {0} && pip install -e {1}".format(venv, local_repo)
+    command = ". {0} && pip install {1}".format(
+        venv, ' '.join('-e {0}'.format(x) for x in local_repos)
+    )
     subprocess.check_call(command, shell=True)
 
 
+def clone_repos(repos, repo_cache, cache_dir=None, jobs=DEFAULT_JOBS):
+    """
+    _clone_repos_
+
+    Clone or update repos, a list of (requirement, repo url, tag),
+    into repo_cache using a pool of jobs threads. The github
+    credentials are looked up once, before starting the threads.
+
+    :returns: list of local clones and dict of requirement: error
+       for the repos that couldnt be cloned
+
+    """
+    clones = []
+    failures = {}
+    auth = get_github_auth()
+    with concurrent.futures.ThreadPoolExecutor(max(jobs, 1)) as pool:
+        futures = {}
+        for req, repo, tag in repos:
+            msg = "Prestaging repo for requirement {req} from {repo}"
+            if tag is not None:
+                msg += " with tag {tag}"
+            LOGGER.info(msg.format(req=req, repo=repo, tag=tag))
+            local_repo = os.path.join(repo_cache, req)
+            future = pool.submit(
+                git_clone_repo, repo, local_repo, tag=tag,
+                cache_dir=cache_dir, prefix='[{0}] '.format(req), auth=auth
+            )
+            futures[future] = (req, local_repo)
+        for future in concurrent.futures.as_completed(futures):
+            req, local_repo = futures[future]
+            try:
+                future.result()
+            except Exception as ex:
+                failures[req] = ex
+            else:
+                clones.append(local_repo)
+    clones.sort()
+    return clones, failures
+
+
 def main():
     """
     _main_
@@ -65,10 +390,11 @@ def main():
     Execute prestage command:
     - look into cirrus conf for requirements to be prestaged
     - look for matching version requirement in requirements.txt
-    - clone each repo locally
-    - pip install -e the repo into the virtualenv
+    - clone the repos locally in parallel
+    - pip install -e the repos into the virtualenv
 
     """
+    opts = build_parser(sys.argv)
     working_dir = os.getcwd()
     repo_cache = os.path.join(working_dir, 'prestage')
     if not os.path.exists(repo_cache):
@@ -80,6 +406,7 @@ def main():
     reqs_name = build_params.get('requirements_file', 'requirements.txt')
     venv_path = os.path.join(working_dir, venv_name)
     venv_command = os.path.join(venv_path, 'bin', 'activate')
+    cache_dir = mirror_cache_dir()
 
     reqs = {}
     # TODO: this only supports explicit == version reqs right now
@@ -91,17 +418,25 @@ def main():
                 reqs[req.name] = versions[0]
 
     # prestage section contains a map of package name: repo
-    for req, repo in prestage_params.items():
-        msg = "Prestaging repo for requirement {req} from {repo}"
-        tag = reqs.get(req)
-        if tag is not None:
-            msg += " with tag {tag}"
-        msg.format(req=req, repo=repo, tag=tag)
-        print(msg)
-        local_repo = os.path.join(repo_cache, req)
-        git_clone_repo(repo, local_repo, tag=reqs.get(req))
-        install_from_repo(venv_command, local_repo)
+    repos = [
+        (req, repo, reqs.get(req)) for req, repo in prestage_params.items()
+    ]
+    clones, failures = clone_repos(
+        repos, repo_cache, cache_dir=cache_dir, jobs=opts.jobs
+    )
+    if clones:
+        install_from_repo(venv_command, *clones)
+    if failures:
+        LOGGER.error("Failed to prestage {0} repos:".format(len(failures)))
+        for req, error in sorted(failures.items()):
+            LOGGER.error(
+                " {0}: {1}, see the [{0}] output above".format(
+                    req, redact(str(error))
+                )
+            )
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
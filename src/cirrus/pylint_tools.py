@@ -6,13 +6,14 @@ Wrapper for pylint execution
 import os
 import re
 import sys
-from invoke import run
 
+from cirrus.lazy_import import lazy_import, lazy_callable
 from cirrus.logger import get_logger
 
 LOGGER = get_logger()
 
-import pep8
+run = lazy_callable('invoke', 'run')
+pep8 = lazy_import('pep8')
 
 
 def pylint_file(filenames, **kwargs):
@@ -6,25 +6,29 @@ import os
 import sys
 import datetime
 import itertools
+import contextlib
 import shutil
 from collections import OrderedDict
-from invoke import run
-import pluggage.registry
 
 import argparse
 from argparse import ArgumentParser
 from cirrus.configuration import load_configuration
 from cirrus.environment import repo_directory
-from cirrus.git_tools import build_release_notes
+from cirrus.git_tools import iter_release_notes
 from cirrus.git_tools import has_unstaged_changes
-from cirrus.git_tools import branch, checkout_and_pull
+from cirrus.git_tools import branch, checkout_and_pull, fetch_branch
 from cirrus.git_tools import commit_files, remote_branch_exists
 from cirrus.git_tools import get_active_commit_sha, get_active_branch
 from cirrus.github_tools import GitHubContext
-from cirrus.utils import update_file, update_version
+from cirrus.utils import chdir, update_file, update_version
+from cirrus.worktrees import check_branches_free, worktree, worktree_path
+from cirrus.lazy_import import lazy_import, lazy_callable
 from cirrus.logger import get_logger
 from cirrus.plugins.jenkins import JenkinsClient
 
+run = lazy_callable('invoke', 'run')
+pluggage_registry = lazy_import('pluggage.registry')
+
 BUILD_CMD = 'python setup.py bdist_wheel'
 BUILD_CMD_TAGGED = "python setup.py egg_info --tag-build '.{}' bdist_wheel"
 LOGGER = get_logger()
@@ -130,24 +134,13 @@ def release_branch_name(config):
     return branch_name
 
 
-def convert_bool(value):
-    """helper to make sure bools are bools"""
-    if value in (True, False):
-        return value
-    if value is None:
-        return False
-    if str(value).lower() in ('true', '1'):
-        return True
-    return False
-
-
 def get_plugin(plugin_name):
     """
     _get_plugin_
 
     Get the deploy plugin requested from the factory
     """
-    factory = pluggage.registry.get_factory(
+    factory = pluggage_registry.get_factory(
         'upload',
         load_modules=['cirrus.plugins.uploaders']
     )
@@ -161,39 +154,12 @@ def release_config(config, opts):
     Extract and validate the release config parameters
     from the cirrus config for the package
     """
-    release_config_defaults = {
-        'wait_on_ci': False,
-        'wait_on_ci_develop': False,
-        'wait_on_ci_master': False,
-        'wait_on_ci_timeout': 600,
-        'wait_on_ci_interval': 2,
-        'push_retry_attempts': 1,
-        'push_retry_cooloff': 0,
-        'github_context_string': None,
-        'update_github_context': False,
-        'develop_github_context_string': None,
-        'master_github_context_string': None,
-        'update_develop_github_context': False,
-        'update_master_github_context': False
-    }
-
-    release_config = {}
-    if 'release' not in config:
-        release_config = release_config_defaults
-    else:
-        for key, val in release_config_defaults.items():
-            release_config[key] = config.get_param('release', key, val)
-
-    release_config['wait_on_ci'] = convert_bool(release_config['wait_on_ci'])
-    release_config['wait_on_ci_develop'] = convert_bool(
-        release_config['wait_on_ci_develop']
-    )
-    release_config['wait_on_ci_master'] = convert_bool(
-        release_config['wait_on_ci_master']
-    )
+    release_config = config.release_settings()
 
     if opts.wait_on_ci:
         release_config['wait_on_ci'] = True
+    if opts.atomic_push:
+        release_config['atomic_push'] = True
     if opts.github_context_string:
         release_config['update_github_context'] = True
         release_config['github_context_string'] = opts.github_context_string
@@ -205,23 +171,6 @@ def release_config(config, opts):
         release_config['update_master_github_context'] = True
         release_config['github_master_context_string'] = opts.github_master_context_string
 
-    # validate argument types
-    release_config['wait_on_ci_timeout'] = int(
-        release_config['wait_on_ci_timeout']
-    )
-    release_config['wait_on_ci_interval'] = int(
-        release_config['wait_on_ci_interval']
-    )
-    release_config['update_github_context'] = convert_bool(
-        release_config['update_github_context']
-    )
-    release_config['push_retry_attempts'] = int(
-        release_config['push_retry_attempts']
-    )
-    release_config['push_retry_cooloff'] = int(
-        release_config['push_retry_cooloff']
-    )
-
     if release_config['update_github_context']:
         # require context string
         if release_config['github_context_string'] is None:
@@ -283,6 +232,18 @@ def build_parser(argslist):
         nargs='+',
         help='package versions (pkg==0.0.0) to update in requirements.txt'
     )
+    new_command.add_argument(
+        '--worktree',
+        action='store_true',
+        dest='worktree',
+        help='create the release in a worktree instead of the current checkout'
+    )
+    new_command.add_argument(
+        '--no-cache',
+        action='store_true',
+        dest='no_cache',
+        help='read all release notes commits from git, bypassing the commit cache'
+    )
 
     # borrow --micro/minor/major options from "new" command.
     subparsers.add_parser('trigger', parents=[new_command], add_help=False)
@@ -336,6 +297,23 @@ def build_parser(argslist):
         default=False,
         help='Skip the develop merge and push'
     )
+    merge_command.add_argument(
+        '--worktree',
+        action='store_true',
+        dest='worktree',
+        default=False,
+        help='run the merges in a worktree instead of the current checkout'
+    )
+    merge_command.add_argument(
+        '--atomic-push',
+        action='store_true',
+        dest='atomic_push',
+        default=False,
+        help=(
+            'push master, the new tag, develop and the release branch '
+            'cleanup in a single atomic git push'
+        )
+    )
     merge_command.add_argument(
         '--log-status',
         action='store_true',
@@ -409,6 +387,32 @@ def get_release_version(opts):
     return field
 
 
+def release_worktree_name(config):
+    """
+    name of the worktree used for releases of the package,
+    so that sibling packages in a repo use separate worktrees
+    """
+    return 'release-{0}'.format(config.package_name())
+
+
+@contextlib.contextmanager
+def in_release_worktree(config, rev, branches=()):
+    """
+    run the rest of a release command in the package dir of the
+    package's release worktree, checked out at rev, after making
+    sure none of branches are checked out in other worktrees
+    """
+    repo_dir = repo_directory()
+    package_dir = os.path.relpath(os.getcwd(), repo_dir)
+    name = release_worktree_name(config)
+    check_branches_free(
+        repo_dir, branches, path=worktree_path(repo_dir, name)
+    )
+    with worktree(repo_dir, name, rev) as path:
+        with chdir(os.path.join(path, package_dir)):
+            yield path
+
+
 def new_release(opts):
     """
     _new_release_
@@ -417,6 +421,24 @@ def new_release(opts):
     - Edit the conf to bump the version
     - Edit the history file with release notes
 
+    With opts.worktree the release branch is created from the
+    remote develop branch in the package's release worktree,
+    leaving the current checkout as is.
+
+    """
+    if not opts.worktree:
+        return _new_release(opts)
+    config = load_configuration()
+    main_branch = config.gitflow_branch_name()
+    fetch_branch(repo_directory(), main_branch)
+    with in_release_worktree(config, 'origin/{0}'.format(main_branch)):
+        return _new_release(opts, branch_from='HEAD')
+
+
+def _new_release(opts, branch_from=None):
+    """
+    create the release in the current dir, from branch_from if
+    provided, otherwise from the pulled develop branch
     """
     LOGGER.info("Creating new release...")
     config = load_configuration()
@@ -459,11 +481,12 @@ def new_release(opts):
         LOGGER.error(msg)
         raise RuntimeError(msg)
 
-    main_branch = config.gitflow_branch_name()
-    checkout_and_pull(repo_dir, main_branch)
+    if branch_from is None:
+        branch_from = config.gitflow_branch_name()
+        checkout_and_pull(repo_dir, branch_from)
 
     # create release branch
-    branch(repo_dir, branch_name, main_branch)
+    branch(repo_dir, branch_name, branch_from)
 
     # update cirrus conf
     config.update_package_version(new_version)
@@ -491,10 +514,15 @@ def new_release(opts):
             new_version,
             datetime.datetime.utcnow().isoformat()
         )
-        relnotes += build_release_notes(
-            repo_dir,
-            current_version,
-            config.release_notes_format()
+        relnotes = itertools.chain(
+            [relnotes],
+            iter_release_notes(
+                repo_dir,
+                current_version,
+                config.release_notes_format(),
+                use_cache=not opts.no_cache,
+                **config.release_notes_log_options()
+            )
         )
         update_file(relnotes_file, relnotes_sentinel, relnotes)
         changes.append(relnotes_file)
@@ -588,13 +616,40 @@ def merge_release(opts):
     branches (or those configured for this package) and tag
     master.
 
+    With opts.worktree the merges are run in the package's release
+    worktree, which must be able to check out the release, master
+    and develop branches, so none of them can be checked out in
+    the current checkout.
+
+    With atomic_push the master and develop branches, the new tag
+    and the release branch deletion are pushed together in a single
+    git push --atomic once the merges are done, instead of each
+    being pushed as it happens.
+
     """
     config = load_configuration()
+    if opts.worktree:
+        release_branch = release_branch_name(config)
+        branches = [
+            release_branch,
+            config.gitflow_master_name(),
+            config.gitflow_branch_name()
+        ]
+        with in_release_worktree(config, release_branch, branches):
+            return _merge_release(opts)
+    return _merge_release(opts)
+
+
+def _merge_release(opts):
+    """merge the release branch checked out in the current dir"""
+    config = load_configuration()
     rel_conf = release_config(config, opts)
     repo_dir = os.getcwd()
     tag = config.package_version()
     master = config.gitflow_master_name()
     develop = config.gitflow_branch_name()
+    atomic = rel_conf['atomic_push']
+    refspecs = []
 
     with GitHubContext(repo_dir) as ghc:
 
@@ -670,12 +725,18 @@ def merge_release(opts):
                         ctx,
                         branch=sha
                     )
-            ghc.push_branch_with_retry(
-                attempts=rel_conf['push_retry_attempts'],
-                cooloff=rel_conf['push_retry_cooloff']
-            )
+            if atomic:
+                refspecs.append(
+                    'refs/heads/{0}:refs/heads/{0}'.format(master)
+                )
+                refspecs.append('refs/tags/{0}:refs/tags/{0}'.format(tag))
+            else:
+                ghc.push_branch_with_retry(
+                    attempts=rel_conf['push_retry_attempts'],
+                    cooloff=rel_conf['push_retry_cooloff']
+                )
             LOGGER.info("Tagging {} as {}".format(master, tag))
-            ghc.tag_release(tag, master)
+            ghc.tag_release(tag, master, push=not atomic)
 
         LOGGER.info("Merging {} into {}".format(release_branch, develop))
         if opts.log_status:
@@ -718,12 +779,31 @@ def merge_release(opts):
                         ctx,
                         branch=sha
                     )
-            ghc.push_branch_with_retry(
+            if atomic:
+                refspecs.append(
+                    'refs/heads/{0}:refs/heads/{0}'.format(develop)
+                )
+            else:
+                ghc.push_branch_with_retry(
+                    attempts=rel_conf['push_retry_attempts'],
+                    cooloff=rel_conf['push_retry_cooloff']
+                )
+        if not atomic:
+            if opts.cleanup:
+                ghc.delete_branch(release_branch)
+            return
+
+        if opts.cleanup:
+            refspecs.append(':refs/heads/{0}'.format(release_branch))
+        if refspecs:
+            LOGGER.info("Pushing {0}".format(' '.join(refspecs)))
+            ghc.push_atomic_with_retry(
+                refspecs,
                 attempts=rel_conf['push_retry_attempts'],
                 cooloff=rel_conf['push_retry_cooloff']
             )
         if opts.cleanup:
-            ghc.delete_branch(release_branch)
+            ghc.delete_branch(release_branch, remote=False)
 
 
 def build_release(opts):
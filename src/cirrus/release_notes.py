@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+_release_notes_
+
+Release notes formatters.
+
+A formatter consumes an iterator of commit rows, as produced by
+git_tools.get_commit_msgs, with committer, message and date values
+and writes the notes to a stream in a single pass, or yields them
+in chunks with iterate. Commits are grouped by committer with a
+dict, keeping the order in which each committer first appears,
+and newest first within each committer.
+
+"""
+import io
+import json
+import collections
+
+
+def group_by_committer(rows):
+    """
+    _group_by_committer_
+
+    Group rows by committer in one pass over rows, returns
+    an OrderedDict of committer: rows sorted newest first.
+    Rows are sorted by their committed_date timestamp when they
+    all have one, so that CommitRecord dates are only formatted
+    as they are written, otherwise by date.
+
+    """
+    groups = collections.OrderedDict()
+    for row in rows:
+        groups.setdefault(row['committer'], []).append(row)
+    for commits in groups.values():
+        if all('committed_date' in x for x in commits):
+            commits.sort(key=lambda x: x['committed_date'], reverse=True)
+        else:
+            commits.sort(key=lambda x: x['date'], reverse=True)
+    return groups
+
+
+class _ChunkWriter(object):
+    """stream that keeps the text written to it until taken"""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, text):
+        self.chunks.append(text)
+
+    def take(self):
+        text = ''.join(self.chunks)
+        del self.chunks[:]
+        return text
+
+
+class ReleaseNotesFormatter(object):
+    """
+    _ReleaseNotesFormatter_
+
+    Base class for release notes formatters, subclasses
+    implement write_header, write_author and write_commit
+    and can override write_footer
+
+    """
+    name = None
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lines = 0
+
+    def line(self, text):
+        """write a line, lines are separated by newlines"""
+        if self.lines:
+            self.stream.write('\n')
+        self.stream.write(text)
+        self.lines += 1
+
+    def write(self, rows):
+        """write the release notes for rows to the stream"""
+        for _ in self.iter_write(rows):
+            pass
+
+    def iter_write(self, rows):
+        """
+        write the release notes for rows to the stream,
+        yielding after each author and commit
+        """
+        self.write_header()
+        for author, commits in group_by_committer(rows).items():
+            self.write_author(author)
+            yield
+            for commit in commits:
+                self.write_commit(commit)
+                yield
+        self.write_footer()
+        yield
+
+    def write_header(self):
+        raise NotImplementedError
+
+    def write_author(self, author):
+        raise NotImplementedError
+
+    def write_commit(self, commit):
+        raise NotImplementedError
+
+    def write_footer(self):
+        pass
+
+    @classmethod
+    def format(cls, rows):
+        """format rows into a string"""
+        stream = io.StringIO()
+        cls(stream).write(rows)
+        return stream.getvalue()
+
+    @classmethod
+    def iterate(cls, rows):
+        """yield the release notes for rows in chunks of text"""
+        stream = _ChunkWriter()
+        for _ in cls(stream).iter_write(rows):
+            text = stream.take()
+            if text:
+                yield text
+
+
+class PlaintextFormatter(ReleaseNotesFormatter):
+    """
+    Output looks like:
+
+    - Commit History:
+    -- Author: USERAME
+    --- DATETIME: COMMIT MESSAGE
+
+    """
+    name = 'plaintext'
+
+    def write_header(self):
+        self.line(" - Commit History:")
+
+    def write_author(self, author):
+        self.line(" -- Author: {0}".format(author))
+
+    def write_commit(self, commit):
+        self.line(' --- {0}: {1}'.format(commit['date'], commit['message']))
+
+
+class MarkdownFormatter(ReleaseNotesFormatter):
+    """
+    Output looks like:
+
+    Commit History
+    ==============
+
+    Author: USERNAME
+    ----------------------
+
+    DATETIME: COMMIT MESSAGE
+
+    """
+    name = 'markdown'
+
+    def write_header(self):
+        self.line('Commit History\n==============')
+
+    def write_author(self, author):
+        self.line(
+            '\nAuthor: {0}\n--------'.format(author) + '-' * len(author)
+        )
+
+    def write_commit(self, commit):
+        self.line('\n{0}: {1}'.format(commit['date'], commit['message']))
+
+
+class RestructuredTextFormatter(ReleaseNotesFormatter):
+    """
+    Output looks like:
+
+    Commit History
+    ==============
+
+    Author: USERNAME
+    ----------------
+
+    * DATETIME: COMMIT MESSAGE
+
+    """
+    name = 'rst'
+
+    def write_header(self):
+        self.line('Commit History\n==============')
+
+    def write_author(self, author):
+        title = 'Author: {0}'.format(author)
+        self.line('\n{0}\n{1}\n'.format(title, '-' * len(title)))
+
+    def write_commit(self, commit):
+        message = commit['message'].strip().replace('\n', '\n  ')
+        self.line('* {0}: {1}'.format(commit['date'], message))
+
+
+class JSONFormatter(ReleaseNotesFormatter):
+    """
+    Output is a JSON list of authors with their commits:
+
+    [{"author": USERNAME,
+      "commits": [{"date": DATETIME, "message": COMMIT MESSAGE}]}]
+
+    """
+    name = 'json'
+
+    def __init__(self, stream):
+        super(JSONFormatter, self).__init__(stream)
+        self.authors = 0
+        self.commits = 0
+
+    def write_header(self):
+        self.stream.write('[')
+
+    def write_author(self, author):
+        if self.authors:
+            self.stream.write(']},')
+        self.stream.write(
+            '\n{{"author": {0}, "commits": ['.format(json.dumps(author))
+        )
+        self.authors += 1
+        self.commits = 0
+
+    def write_commit(self, commit):
+        if self.commits:
+            self.stream.write(',')
+        data = collections.OrderedDict()
+        if 'sha' in commit:
+            data['sha'] = commit['sha']
+        data['date'] = commit['date']
+        data['message'] = commit['message']
+        self.stream.write('\n  {0}'.format(json.dumps(data)))
+        self.commits += 1
+
+    def write_footer(self):
+        if self.authors:
+            self.stream.write(']}\n')
+        self.stream.write(']')
+
+
+FORMATTERS = collections.OrderedDict(
+    (formatter.name, formatter)
+    for formatter in (
+        PlaintextFormatter,
+        MarkdownFormatter,
+        RestructuredTextFormatter,
+        JSONFormatter
+    )
+)
+
+
+def get_formatter(name):
+    """
+    look up a formatter class by name, raises ValueError
+    if there is no formatter with that name
+    """
+    try:
+        return FORMATTERS[name]
+    except KeyError:
+        raise ValueError(
+            'Invalid release notes formatting: {0} Update cirrus.conf'
+            ' entry to use one of: {1}'.format(name, ', '.join(FORMATTERS))
+        )
@@ -9,33 +9,23 @@ looking up the latest release and using that instead.
 """
 import sys
 import argparse
-import arrow
 import os
 import inspect
-import contextlib
-
-from invoke import run
 
 import cirrus
+from cirrus.command_index import build_command_index
 from cirrus.configuration import load_configuration
 from cirrus.environment import cirrus_home, virtualenv_home
 from cirrus.github_tools import get_releases
 from cirrus.git_tools import update_to_branch, update_to_tag
+from cirrus.lazy_import import lazy_callable
 from cirrus.logger import get_logger
+from cirrus.utils import chdir
 
-
-LOGGER = get_logger()
+run = lazy_callable('invoke', 'run')
 
 
-@contextlib.contextmanager
-def chdir(dirname=None):
-    curdir = os.getcwd()
-    try:
-        if dirname is not None:
-            os.chdir(dirname)
-        yield
-    finally:
-        os.chdir(curdir)
+LOGGER = get_logger()
 
 
 def build_parser(argslist):
@@ -112,6 +102,7 @@ def setup_develop(config):
             config.venv_name()
         )
     )
+    build_command_index()
     return
 
 
@@ -127,6 +118,8 @@ def pip_install(version):
             venv_name, pip_req
         )
     )
+    LOGGER.info("rebuilding command index...")
+    build_command_index()
 
 
 def legacy_update(opts):
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+"""
+_server_
+
+Opt in background server that keeps a warm interpreter with the
+cirrus command modules and their dependencies already imported,
+listening on a per user unix socket.
+
+git cirrus server start
+
+The delegate forwards each command to the server if it is running:
+the client sends argv, cwd and env along with its stdin, stdout and
+stderr file descriptors, the server forks a child that runs the
+command entry point writing directly to the client terminal and
+sends back the exit code. When the server is not running, or the
+cirrus install has changed since it started, the delegate falls back
+to running the command normally.
+
+The configuration for the package directory the server is started in
+is loaded up front and reused by commands run there while cirrus.conf
+and the gitconfig are unchanged.
+
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import importlib
+import traceback
+import socketserver
+
+from cirrus.command_index import installed_commands, site_packages_mtime
+from cirrus.daemon import (
+    MessageReader,
+    daemonize,
+    peer_uid,
+    read_pidfile,
+    remove_file,
+    runtime_dir,
+    send_message,
+    write_pidfile
+)
+from cirrus.environment import SERVER_SOCKET
+from cirrus.logger import get_logger
+
+
+LOGGER = get_logger()
+
+#
+# commands that are never forwarded to the server
+#
+LOCAL_COMMANDS = (
+    'cirrus', 'server', 'creds-agent', 'selfupdate', 'selfsetup'
+)
+
+#
+# shut down after this many seconds without a request
+#
+DEFAULT_IDLE_TIMEOUT = 3600
+
+
+def socket_path():
+    """path to the server socket, CIRRUS_SERVER_SOCK overrides"""
+    path = os.environ.get('CIRRUS_SERVER_SOCK')
+    if path is None:
+        path = os.path.join(runtime_dir(), SERVER_SOCKET)
+    return path
+
+
+def pid_path():
+    """path to the server pid file"""
+    return '{0}.pid'.format(socket_path())
+
+
+def log_path():
+    """path to the server log file"""
+    return '{0}.log'.format(socket_path())
+
+
+def connect(path=None, timeout=None):
+    """
+    connect to the server socket, returns None if the server
+    is not running
+    """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except (OSError, socket.error):
+        sock.close()
+        return None
+    return sock
+
+
+def forward(command, command_path, entry_point, args, fds=(0, 1, 2),
+            path=None):
+    """
+    _forward_
+
+    Run a command in the server if it is running
+
+    :param command: name of the cirrus command
+    :param command_path: path to the console script for the command
+    :param entry_point: entry point value for the command
+    :param args: command line args for the command
+    :param fds: stdin, stdout, stderr file descriptors for the command
+    :param path: optional server socket path
+    :returns: exit code of the command, or None if the command
+      could not be run in the server
+
+    """
+    if command in LOCAL_COMMANDS or not hasattr(socket, 'SCM_RIGHTS'):
+        return None
+    try:
+        sock = connect(path)
+    except RuntimeError:
+        return None
+    if sock is None:
+        return None
+    request = {
+        'action': 'run',
+        'command': command,
+        'command_path': command_path,
+        'entry_point': entry_point,
+        'args': list(args),
+        'cwd': os.getcwd(),
+        'env': dict(os.environ)
+    }
+    with sock:
+        try:
+            send_message(sock, request, fds)
+            reader = MessageReader(sock)
+            response = reader.read()
+        except (OSError, socket.error, ValueError):
+            return None
+        if response is None or response.get('status') != 'running':
+            return None
+        # the command has started, from here on there is no fall back
+        child = response['pid']
+        old_handler = signal.signal(
+            signal.SIGINT,
+            lambda signum, frame: os.kill(child, signal.SIGINT)
+        )
+        try:
+            response = reader.read()
+        except (OSError, socket.error, ValueError):
+            response = None
+        finally:
+            signal.signal(signal.SIGINT, old_handler)
+    if response is None:
+        print(
+            "cirrus server connection lost running {0}".format(command),
+            file=sys.stderr
+        )
+        return 1
+    return response['exit_code']
+
+
+class CommandRequestHandler(socketserver.BaseRequestHandler):
+    """
+    _CommandRequestHandler_
+
+    Handle a single request in the forked child of the server
+
+    """
+    def handle(self):
+        uid = peer_uid(self.request)
+        if uid is not None and uid != os.getuid():
+            return
+        reader = MessageReader(self.request, max_fds=3)
+        request = reader.read()
+        if request is None:
+            return
+        action = request.get('action')
+        if action == 'status':
+            send_message(self.request, self.server.status())
+            return
+        if action != 'run' or len(reader.fds) != 3:
+            send_message(self.request, {'status': 'error'})
+            return
+        if site_packages_mtime() != self.server.site_packages_mtime:
+            # cirrus has been updated, let the client run the command
+            # and shut down so the next start picks up the new code
+            send_message(self.request, {'status': 'stale'})
+            os.kill(self.server.pid, signal.SIGTERM)
+            return
+        send_message(
+            self.request, {'status': 'running', 'pid': os.getpid()}
+        )
+        code = self.run_command(request, reader.fds)
+        send_message(self.request, {'exit_code': code})
+
+    def run_command(self, request, fds):
+        """
+        switch this process over to the client stdio, cwd and env
+        and run the command entry point
+        """
+        from cirrus.delegate import run_in_process
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # make sure the standard streams are the ones on fds 0-2
+        sys.stdin = sys.__stdin__
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        try:
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            code = run_in_process(
+                request['command_path'],
+                request['entry_point'],
+                request['args']
+            )
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        return code
+
+
+class CommandServer(socketserver.ForkingMixIn,
+                    socketserver.UnixStreamServer):
+    """
+    _CommandServer_
+
+    Unix socket server that forks a child per command from a
+    parent process with the cirrus commands preloaded
+
+    """
+    def __init__(self, path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        remove_file(path)
+        socketserver.UnixStreamServer.__init__(
+            self, path, CommandRequestHandler
+        )
+        os.chmod(path, 0o600)
+        self.path = path
+        self.pid = os.getpid()
+        self.idle_timeout = idle_timeout
+        self.started = time.time()
+        self.last_request = self.started
+        self.site_packages_mtime = site_packages_mtime()
+        self.running = False
+        self.timeout = 1
+
+    def preload(self, commands):
+        """
+        import the command modules and their lazily imported
+        dependencies so that forked children start warm
+        """
+        from cirrus.lazy_import import load_lazy_modules
+        for command, entry_point in sorted(commands.items()):
+            if command in LOCAL_COMMANDS:
+                continue
+            module_name = entry_point.split(':', 1)[0].strip()
+            try:
+                module = importlib.import_module(module_name)
+            except Exception as ex:
+                LOGGER.warning(
+                    "Unable to preload {0}: {1}".format(module_name, ex)
+                )
+                continue
+            for failed in load_lazy_modules(module):
+                LOGGER.warning(
+                    "Unable to preload {0} for {1}".format(
+                        failed, module_name
+                    )
+                )
+
+    def status(self):
+        """status message for this server"""
+        return {
+            'status': 'ok',
+            'pid': self.pid,
+            'started': self.started,
+            'last_request': self.last_request,
+            'children': len(self.active_children or ())
+        }
+
+    def process_request(self, request, client_address):
+        self.last_request = time.time()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        socketserver.ForkingMixIn.process_request(
+            self, request, client_address
+        )
+
+    def handle_timeout(self):
+        socketserver.ForkingMixIn.handle_timeout(self)
+        if time.time() - self.last_request > self.idle_timeout:
+            LOGGER.info("cirrus server idle, shutting down")
+            self.running = False
+
+    def stop(self, signum=None, frame=None):
+        """stop serving, used as the SIGTERM handler"""
+        self.running = False
+
+    def run(self):
+        """serve requests until stopped or idle"""
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            while self.running:
+                self.handle_request()
+                self.collect_children()
+        finally:
+            self.server_close()
+            if os.getpid() == self.pid:
+                remove_file(self.path)
+
+
+def server_status(path=None):
+    """get the status message from the server or None"""
+    sock = connect(path, timeout=5)
+    if sock is None:
+        return None
+    with sock:
+        try:
+            send_message(sock, {'action': 'status'})
+            return MessageReader(sock).read()
+        except (OSError, socket.error, ValueError):
+            return None
+
+
+def warm_configuration():
+    """
+    load the configuration for the package the server is started
+    in, so that commands run there get it from the cache
+    """
+    from cirrus.configuration import load_configuration
+    try:
+        load_configuration()
+    except Exception as ex:
+        LOGGER.info("Not preloading configuration: {0}".format(ex))
+
+
+def start_server(opts):
+    """
+    start the server, daemonizing unless running in the foreground
+    """
+    if server_status() is not None:
+        LOGGER.info("cirrus server already running")
+        return 0
+    path = socket_path()
+    pidfile = pid_path()
+    commands = installed_commands()
+    warm_configuration()
+    if not opts.foreground:
+        daemonize(log_path())
+    write_pidfile(pidfile)
+    try:
+        server = CommandServer(path, idle_timeout=opts.idle_timeout)
+        server.preload(commands)
+        LOGGER.info(
+            "cirrus server {0} listening on {1}".format(os.getpid(), path)
+        )
+        server.run()
+    finally:
+        if read_pidfile(pidfile) == os.getpid():
+            remove_file(pidfile)
+    return 0
+
+
+def stop_server(opts):
+    """stop the running server"""
+    status = server_status()
+    pid = status['pid'] if status else read_pidfile(pid_path())
+    if pid is None:
+        LOGGER.info("cirrus server not running")
+        return 0
+    os.kill(pid, signal.SIGTERM)
+    LOGGER.info("cirrus server {0} stopped".format(pid))
+    return 0
+
+
+def show_status(opts):
+    """print the server status, exit code 1 if not running"""
+    status = server_status()
+    if status is None:
+        print("cirrus server not running")
+        return 1
+    print(
+        "cirrus server {0} running on {1} since {2}".format(
+            status['pid'],
+            socket_path(),
+            time.ctime(status['started'])
+        )
+    )
+    return 0
+
+
+def build_parser(argslist):
+    """
+    _build_parser_
+
+    Set up command line parser for the server command
+
+    """
+    parser = argparse.ArgumentParser(
+        description='git cirrus server command, runs a warm cirrus server'
+    )
+    parser.add_argument('command', nargs='?')
+    subparsers = parser.add_subparsers(dest='command')
+    start_command = subparsers.add_parser('start')
+    start_command.add_argument(
+        '--foreground',
+        help='run the server in the foreground',
+        action='store_true',
+        default=False
+    )
+    start_command.add_argument(
+        '--idle-timeout',
+        help='seconds without a request before the server exits',
+        dest='idle_timeout',
+        type=int,
+        default=DEFAULT_IDLE_TIMEOUT
+    )
+    subparsers.add_parser('stop')
+    subparsers.add_parser('status')
+    opts = parser.parse_args(argslist)
+    return opts
+
+
+def main():
+    """
+    _main_
+
+    Execute server command
+    """
+    opts = build_parser(sys.argv)
+    if opts.command == 'start':
+        return start_server(opts)
+    if opts.command == 'stop':
+        return stop_server(opts)
+    if opts.command == 'status':
+        return show_status(opts)
+    print("usage: git cirrus server start|stop|status")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
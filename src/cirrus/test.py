@@ -5,10 +5,12 @@ Command to run available test suites in a package
 '''
 import sys
 
-from invoke import run
 from argparse import ArgumentParser
 
 from cirrus.configuration import load_configuration
+from cirrus.lazy_import import lazy_callable
+
+run = lazy_callable('invoke', 'run')
 
 
 def build_parser(argslist):
@@ -5,7 +5,30 @@ _utils_
 General purpose utils
 
 """
-import codecs
+import os
+import shutil
+import tempfile
+import contextlib
+
+#
+# characters read at a time when copying files in update_file
+#
+COPY_CHUNK_SIZE = 65536
+
+
+@contextlib.contextmanager
+def chdir(dirname=None):
+    """
+    context to change to dirname, if provided, and back
+    to the current dir on exit
+    """
+    curdir = os.getcwd()
+    try:
+        if dirname is not None:
+            os.chdir(dirname)
+        yield
+    finally:
+        os.chdir(curdir)
 
 
 def update_file(filename, sentinel, text):
@@ -34,18 +57,68 @@ def update_file(filename, sentinel, text):
     Other text
     "
 
+    The file is copied to a temp file in chunks with the text
+    added after the first sentinel, and the temp file is then
+    renamed over the original. text can be a string or an
+    iterable of strings, eg the chunks from a release notes
+    formatter. The file is left as is if the sentinel isnt found.
+
     """
-    content = None
-    with codecs.open(filename, 'r', encoding='utf-8') as handle:
-        content = handle.read()
-
-    replacement = "{0}\n\n{1}".format(sentinel, text)
-    content = content.replace(sentinel, replacement, 1)
-    with codecs.open(filename, 'w', encoding='utf-8') as handle:
-        handle.write(content)
+    if isinstance(text, str):
+        text = [text]
+    handle, temp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)),
+        prefix='.{0}.'.format(os.path.basename(filename)),
+        suffix='.tmp'
+    )
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8', newline='') as writer:
+            with open(filename, 'r', encoding='utf-8', newline='') as reader:
+                rest = _copy_to_sentinel(reader, writer, sentinel)
+                if rest is not None:
+                    writer.write('\n\n')
+                    for chunk in text:
+                        writer.write(chunk)
+                    writer.write(rest)
+                    shutil.copyfileobj(reader, writer, COPY_CHUNK_SIZE)
+        if rest is None:
+            os.unlink(temp)
+            return
+        shutil.copymode(filename, temp)
+        os.replace(temp, filename)
+    except Exception:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
     return
 
 
+def _copy_to_sentinel(reader, writer, sentinel):
+    """
+    copy reader to writer in chunks up to and including the first
+    sentinel. Returns the text read past the sentinel, or None
+    if it wasnt found, in which case all of reader is copied
+    """
+    # the end of the last chunk, which might be the start of
+    # a sentinel split across chunks
+    keep = len(sentinel) - 1
+    pending = ''
+    while True:
+        chunk = reader.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            writer.write(pending)
+            return None
+        buff = pending + chunk
+        index = buff.find(sentinel)
+        if index != -1:
+            index += len(sentinel)
+            writer.write(buff[:index])
+            return buff[index:]
+        split = max(len(buff) - keep, 0)
+        writer.write(buff[:split])
+        pending = buff[split:]
+
+
 def update_version(filename, new_version, vers_attr='__version__'):
     """
     _update_version_
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+_worktrees_
+
+Temporary git worktree checkouts for cirrus commands.
+
+Commands such as release new/merge and ChefRepo.feature_branch can
+run in a worktree instead of switching branches in the developer's
+checkout. Worktrees live in the cirrus-worktrees dir of the repo's
+git dir, so they share its object store and refs, and are named by
+their use so that eg releases of sibling packages in the same repo
+get their own worktree and can run at the same time.
+
+A worktree is left in place with a detached HEAD when the command
+finishes and is reused by the next command with the same name if
+it has no changes, otherwise it is removed and added again.
+
+"""
+import os
+import re
+import fcntl
+import contextlib
+import subprocess
+import collections
+
+from cirrus.environment import discover_repo
+from cirrus.logger import get_logger
+
+
+LOGGER = get_logger()
+
+WORKTREE_DIR = 'cirrus-worktrees'
+
+
+def _git(path, *args):
+    """run a git command in path and return its output"""
+    try:
+        return subprocess.check_output(
+            ('git',) + args,
+            cwd=path,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+    except subprocess.CalledProcessError as ex:
+        msg = "git {0} failed in {1}: {2}".format(
+            ' '.join(args), path, ex.stderr.strip()
+        )
+        LOGGER.error(msg)
+        raise RuntimeError(msg)
+
+
+def worktree_path(repo_dir, name):
+    """path to the worktree called name for the repo containing repo_dir"""
+    location = discover_repo(repo_dir)
+    if location is None:
+        raise RuntimeError("{0} is not in a git repo".format(repo_dir))
+    safe_name = re.sub(r'[^\w.-]+', '-', name).strip('-.')
+    return os.path.join(location.common_dir, WORKTREE_DIR, safe_name)
+
+
+def list_worktrees(repo_dir):
+    """
+    _list_worktrees_
+
+    Worktrees of the repo containing repo_dir, as an OrderedDict
+    of path: dict with the head sha and the branch checked out
+    in the worktree, which is None for a detached HEAD
+
+    """
+    result = collections.OrderedDict()
+    current = None
+    output = _git(repo_dir, 'worktree', 'list', '--porcelain')
+    for line in output.splitlines():
+        key, _, value = line.partition(' ')
+        if key == 'worktree':
+            current = {'head': None, 'branch': None}
+            result[os.path.realpath(value)] = current
+        elif key == 'HEAD':
+            current['head'] = value
+        elif key == 'branch':
+            current['branch'] = value[len('refs/heads/'):]
+    return result
+
+
+def check_branches_free(repo_dir, branches, path=None):
+    """
+    raise a RuntimeError if any of branches are checked out
+    in a worktree of the repo other than path, as a worktree
+    cant check out a branch that is checked out elsewhere
+    """
+    path = os.path.realpath(path) if path else None
+    for tree, info in list_worktrees(repo_dir).items():
+        if tree != path and info['branch'] in branches:
+            msg = (
+                "Branch {0} is checked out in {1}, please switch that "
+                "checkout to another branch to run in a worktree"
+            ).format(info['branch'], tree)
+            LOGGER.error(msg)
+            raise RuntimeError(msg)
+
+
+def is_clean(path):
+    """check a worktree has no changes or untracked files"""
+    return not _git(path, 'status', '--porcelain').strip()
+
+
+def prepare_worktree(repo_dir, name, rev='HEAD'):
+    """
+    _prepare_worktree_
+
+    Get the worktree called name checked out at rev, reusing an
+    existing unchanged worktree. rev is checked out as a detached
+    HEAD unless it is a local branch name.
+
+    :returns: path to the worktree
+
+    """
+    path = worktree_path(repo_dir, name)
+    known = os.path.realpath(path) in list_worktrees(repo_dir)
+    if known and os.path.isdir(path):
+        if is_clean(path):
+            LOGGER.info("Reusing worktree {0}".format(path))
+            _git(path, 'checkout', '-q', rev)
+            return path
+        LOGGER.info("Worktree {0} has changes, recreating it".format(path))
+        _git(repo_dir, 'worktree', 'remove', '--force', path)
+    elif known:
+        _git(repo_dir, 'worktree', 'prune')
+
+    LOGGER.info("Adding worktree {0} at {1}".format(path, rev))
+    _git(repo_dir, 'worktree', 'add', '-q', '--detach', path, rev)
+    _git(path, 'checkout', '-q', rev)
+    return path
+
+
+@contextlib.contextmanager
+def worktree(repo_dir, name, rev='HEAD'):
+    """
+    _worktree_
+
+    Context that provides the path to the worktree called name
+    checked out at rev. Commands using the same name wait for
+    each other. HEAD is detached on exit so that no branch is
+    kept checked out in the worktree.
+
+    """
+    path = worktree_path(repo_dir, name)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open('{0}.lock'.format(path), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            path = prepare_worktree(repo_dir, name, rev)
+            try:
+                yield path
+            finally:
+                if os.path.isdir(path):
+                    _git(path, 'checkout', '-q', '--detach')
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+tests for branch classification
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cirrus.branch_classifier import BranchClassifier, classify_branches
+from cirrus.git_session import RepositorySession
+
+from .harnesses import init_repo, run_git
+
+
+class BranchClassifierTest(unittest.TestCase):
+    """
+    classification of branches in a real repo, with
+    remote tracking branches set up by update-ref
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        init_repo(self.dir)
+        self.commit('first', 1438210000)
+        run_git(self.dir, 'checkout', '-q', '-b', 'develop')
+        self.commit('develop', 1438220000)
+        run_git(self.dir, 'branch', 'feature/merged')
+        self.commit('more develop', 1438230000)
+        run_git(self.dir, 'checkout', '-q', '-b', 'feature/open')
+        self.commit('feature one', 1438240000)
+        self.commit('feature two', 1438250000)
+        run_git(self.dir, 'checkout', '-q', 'develop')
+        for name in ('master', 'develop', 'feature/open', 'feature/merged'):
+            run_git(
+                self.dir, 'update-ref',
+                'refs/remotes/origin/{0}'.format(name), name
+            )
+        run_git(
+            self.dir, 'symbolic-ref', 'refs/remotes/origin/HEAD',
+            'refs/remotes/origin/develop'
+        )
+        self.session = RepositorySession(self.dir)
+        self.clock = lambda: 1438250000 + 3 * 86400
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.dir)
+
+    def commit(self, message, date):
+        run_git(
+            self.dir, 'commit', '-q', '--allow-empty', '-m', message,
+            env={
+                'GIT_AUTHOR_DATE': '{0} +0000'.format(date),
+                'GIT_COMMITTER_DATE': '{0} +0000'.format(date)
+            }
+        )
+
+    def test_classify(self):
+        """branches are classified against develop and master"""
+        classifier = BranchClassifier(
+            self.session, ['develop', 'master'], clock=self.clock
+        )
+        result = classifier.classify(prefixes=['feature/'])
+        self.assertEqual(
+            [x.name for x in result],
+            [
+                'feature/merged',
+                'feature/open',
+                'remotes/origin/feature/merged',
+                'remotes/origin/feature/open'
+            ]
+        )
+        merged = result[2]
+        self.assertEqual(merged.ref, 'refs/remotes/origin/feature/merged')
+        self.assertEqual(merged.remote, 'origin')
+        self.assertEqual(merged.branch, 'feature/merged')
+        self.assertEqual(merged.merged_into, ['develop'])
+        self.assertEqual((merged.ahead, merged.behind), (0, 1))
+        self.assertEqual(merged.committed_date, 1438220000)
+
+        self.assertEqual(
+            dict(classifier.base_commits()),
+            {
+                'develop': run_git(self.dir, 'rev-parse', 'develop'),
+                'master': run_git(self.dir, 'rev-parse', 'master')
+            }
+        )
+
+        unmerged = result[3]
+        self.assertEqual(unmerged.merged_into, [])
+        self.assertEqual((unmerged.ahead, unmerged.behind), (2, 0))
+        self.assertEqual(unmerged.age, 3 * 86400)
+        self.assertEqual(
+            unmerged.sha, run_git(self.dir, 'rev-parse', 'feature/open')
+        )
+
+    def test_classify_remote(self):
+        """base branches and origin/HEAD are left out"""
+        result = classify_branches(
+            self.session, ['develop', 'master', 'release'],
+            local=False, counts=False
+        )
+        self.assertEqual(
+            [(x.branch, x.merged_into, x.ahead) for x in result],
+            [
+                ('feature/merged', ['develop'], None),
+                ('feature/open', [], None),
+            ]
+        )
+
+    def test_ahead_behind_atom(self):
+        """newer git counts all branches in one for-each-ref"""
+        output = (
+            'refs/remotes/origin/feature/open\x002 0\n'
+            'refs/remotes/origin/feature/merged\x000 1\n'
+        )
+        with mock.patch(
+                'cirrus.git_session.git_version', return_value=(2, 41, 0)):
+            with mock.patch(
+                    'cirrus.git_session.subprocess.check_output',
+                    return_value=output) as mock_output:
+                result = self.session.ahead_behind(
+                    'refs/remotes/origin/develop',
+                    [
+                        'refs/remotes/origin/feature/open',
+                        'refs/remotes/origin/feature/merged'
+                    ]
+                )
+        self.assertEqual(mock_output.call_count, 1)
+        self.assertIn(
+            '--format=%(refname)%00%(ahead-behind:refs/remotes/origin/develop)',
+            mock_output.call_args[0][0]
+        )
+        self.assertEqual(result, {
+            'refs/remotes/origin/feature/open': (2, 0),
+            'refs/remotes/origin/feature/merged': (0, 1),
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+tests for the persisted cirrus command index
+"""
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from cirrus.command_index import (
+    build_command_index,
+    installed_commands,
+    load_command_index
+)
+
+
+class CommandIndexTest(unittest.TestCase):
+    """
+    test building, loading and invalidating the command index
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.site_packages = os.path.join(self.dir, 'site-packages')
+        os.makedirs(self.site_packages)
+        self.index = os.path.join(self.dir, 'index.json')
+        self.commands = {
+            'cirrus': 'cirrus.delegate:main',
+            'hello': 'cirrus.hello:main'
+        }
+        self.patch_site = mock.patch(
+            'cirrus.command_index.site_packages_dir'
+        )
+        self.mock_site = self.patch_site.start()
+        self.mock_site.return_value = self.site_packages
+        self.patch_scan = mock.patch('cirrus.command_index.scan_entry_points')
+        self.mock_scan = self.patch_scan.start()
+        self.mock_scan.return_value = self.commands
+
+    def tearDown(self):
+        self.patch_site.stop()
+        self.patch_scan.stop()
+        if os.path.exists(self.dir):
+            os.system('rm -rf {0}'.format(self.dir))
+
+    def test_build_and_load(self):
+        """index is written and read back without a rescan"""
+        self.assertIsNone(load_command_index(self.index))
+        result = build_command_index(self.index)
+        self.assertEqual(result, self.commands)
+        with open(self.index) as handle:
+            data = json.load(handle)
+        self.assertEqual(data['commands'], self.commands)
+
+        self.mock_scan.reset_mock()
+        self.assertEqual(installed_commands(self.index), self.commands)
+        self.assertFalse(self.mock_scan.called)
+
+    def test_stale_index(self):
+        """changing site-packages invalidates the index"""
+        build_command_index(self.index)
+        stat = os.stat(self.site_packages)
+        os.utime(
+            self.site_packages,
+            (stat.st_atime, stat.st_mtime + 10)
+        )
+        self.assertIsNone(load_command_index(self.index))
+
+        self.mock_scan.reset_mock()
+        self.mock_scan.return_value = {'hello': 'cirrus.hello:main'}
+        self.assertEqual(
+            installed_commands(self.index), {'hello': 'cirrus.hello:main'}
+        )
+        self.assertTrue(self.mock_scan.called)
+        self.assertEqual(
+            load_command_index(self.index), {'hello': 'cirrus.hello:main'}
+        )
+
+    def test_corrupt_index(self):
+        """unreadable index is treated as missing"""
+        with open(self.index, 'w') as handle:
+            handle.write('{not json')
+        self.assertIsNone(load_command_index(self.index))
+        self.assertEqual(installed_commands(self.index), self.commands)
+
+
+if __name__ == '__main__':
+    unittest.main()
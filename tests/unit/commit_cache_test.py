@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+tests for the commit metadata cache
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from cirrus.commit_cache import CommitCache, open_cache
+from cirrus.git_session import CommitRecord
+
+
+class CommitCacheTest(unittest.TestCase):
+    """
+    test coverage for CommitCache
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, '.cirrus', 'cache', 'commits.sqlite')
+        self.now = 1000
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def clock(self):
+        return self.now
+
+    def record(self, sha):
+        return CommitRecord(
+            sha, 'steve', 'bob', 1438210783, '{0} message\n'.format(sha)
+        )
+
+    def test_get_put(self):
+        """commits are stored by sha"""
+        with CommitCache(self.path, clock=self.clock) as cache:
+            cache.put_many([self.record('abc'), self.record('def')])
+            self.assertEqual(len(cache), 2)
+
+        self.assertTrue(
+            os.path.exists(os.path.join(self.dir, '.cirrus', '.gitignore'))
+        )
+        with CommitCache(self.path, clock=self.clock) as cache:
+            result = cache.get_many(['abc', 'xyz'])
+        self.assertEqual(list(result), ['abc'])
+        record = result['abc']
+        self.assertEqual(record.author, 'steve')
+        self.assertEqual(record['committer'], 'bob')
+        self.assertEqual(record['message'], 'abc message\n')
+        self.assertEqual(record['date'], '2015-07-29T22:59:43+00:00')
+
+    def test_evict(self):
+        """least recently used commits are evicted"""
+        cache = CommitCache(self.path, max_entries=2, clock=self.clock)
+        cache.put_many([self.record('abc'), self.record('def')])
+        self.now = 1001
+        cache.get_many(['abc'])
+        self.now = 1002
+        cache.put_many([self.record('ghi')])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(
+            sorted(cache.get_many(['abc', 'def', 'ghi'])), ['abc', 'ghi']
+        )
+        cache.close()
+
+    def test_open_cache(self):
+        """a cache that cant be written is not used"""
+        with open(os.path.join(self.dir, '.cirrus'), 'w') as handle:
+            handle.write('not a dir')
+        self.assertIsNone(open_cache(self.dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+tests for the config command
+"""
+import os
+import unittest
+import tempfile
+
+from cirrus.config_command import explain
+from cirrus.configuration import clear_configuration_cache, load_configuration
+
+from .harnesses import write_cirrus_conf
+
+
+class ConfigCommandTest(unittest.TestCase):
+    """
+    test coverage for config explain
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.gitconfig = os.path.join(self.dir, '.gitconfig')
+        with open(self.gitconfig, 'w') as handle:
+            handle.write('[cirrus]\n\tcredential-plugin = default\n')
+        write_cirrus_conf(
+            os.path.join(self.dir, 'cirrus.conf'),
+            package={'name': 'cirrus-tests', 'python_versions': '3'},
+            release={'wait_on_ci': 'true'}
+        )
+        clear_configuration_cache()
+
+    def tearDown(self):
+        clear_configuration_cache()
+        if os.path.exists(self.dir):
+            os.system('rm -rf {0}'.format(self.dir))
+
+    def test_explain(self):
+        """values are shown with their sources"""
+        config = load_configuration(
+            package_dir=self.dir, gitconfig_file=self.gitconfig
+        )
+        lines = explain(config)
+        self.assertIn(
+            'snapshot: written to {0}'.format(
+                os.path.join(self.dir, '.cirrus', 'cache', 'config.json')
+            ),
+            lines
+        )
+        self.assertIn('[package]', lines)
+        self.assertIn('    name = cirrus-tests', lines)
+        self.assertIn(
+            '    package_name = cirrus_tests    (cirrus.conf [package] name)',
+            lines
+        )
+        self.assertIn(
+            '    credential_plugin = default    '
+            '({0} [cirrus] credential-plugin)'.format(self.gitconfig),
+            lines
+        )
+        self.assertIn(
+            '        wait_on_ci = True    (cirrus.conf [release] wait_on_ci)',
+            lines
+        )
+        self.assertIn('        wait_on_ci_timeout = 600    (default)', lines)
+        self.assertTrue(
+            any(x.startswith('    quality_threshold: error:') for x in lines)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,7 @@ from unittest import mock
 
 from cirrus.plugins.creds.default import Default
 from cirrus.configuration import (
+    clear_configuration_cache,
     get_github_api_base,
     load_configuration,
     Configuration
@@ -75,6 +76,10 @@ class ConfigurationTests(unittest.TestCase):
         self.assertEqual(config.gitflow_feature_prefix(), 'feature/')
 
         self.assertEqual(config.release_notes(), (None, None))
+        self.assertEqual(
+            config.release_notes_log_options(),
+            {'first_parent': False, 'no_merges': False}
+        )
         self.assertEqual(config.version_file(), (None, '__version__'))
 
         self.assertIsNotNone(config.credentials)
@@ -87,27 +92,22 @@ class ConfigurationTests(unittest.TestCase):
         self.assertEqual(config2.package_version(), '1.2.4')
 
     @mock.patch('cirrus.gitconfig.shell_command')
-    @mock.patch('cirrus.configuration.subprocess.Popen')
-    def test_reading_missing(self, mock_pop, mock_shell):
+    @mock.patch('cirrus.configuration.repo_directory')
+    def test_reading_missing(self, mock_repo, mock_shell):
         """test config load using repo dir"""
-        mock_result = mock.Mock()
-        mock_result.communicate = mock.Mock()
-        mock_result.returncode = 0
-        mock_result.communicate.return_value = (self.dir.encode(), None)
-        mock_pop.return_value = mock_result
-        mock_shell.return_value = self.gitconf_str
-        config = load_configuration(package_dir="womp")
+        mock_repo.return_value = self.dir
+        config = load_configuration(
+            package_dir="womp", gitconfig_file=self.gitconfig
+        )
 
-        self.assertTrue(mock_result.communicate.called)
-        mock_pop.assert_has_calls([
-            mock.call(['git', 'rev-parse', '--show-toplevel'], stdout=-1)
-        ])
+        self.assertTrue(mock_repo.called)
         self.assertEqual(config.package_version(), '1.2.3')
         self.assertEqual(config.package_name(), 'cirrus_tests')
-        self.assertTrue(mock_shell.called)
-        mock_shell.assert_has_calls([
-            mock.call('git config --file {} -l'.format(self.gitconfig))
-        ])
+        # gitconfig is read in process
+        self.assertFalse(mock_shell.called)
+        self.assertEqual(
+            config.get_gitconfig_param('credential-plugin'), 'default'
+        )
 
     def test_configuration_map(self):
         """test building config mapping"""
@@ -125,6 +125,91 @@ class ConfigurationTests(unittest.TestCase):
             mapping['cirrus']['configuration']['package']['name'], 'cirrus_tests'
         )
 
+    def test_configuration_cache(self):
+        """repeat loads share an instance until the files change"""
+        config = load_configuration(
+            package_dir=self.dir, gitconfig_file=self.gitconfig
+        )
+        with mock.patch('cirrus.configuration.Configuration') as mock_config:
+            config2 = load_configuration(
+                package_dir=self.dir, gitconfig_file=self.gitconfig
+            )
+            self.assertFalse(mock_config.called)
+        self.assertIs(config, config2)
+
+        # writes through the configuration keep the cache consistent
+        config.update_package_version('1.2.4')
+        config.set_gitconfig_param('github-user', 'steve')
+        config3 = load_configuration(
+            package_dir=self.dir, gitconfig_file=self.gitconfig
+        )
+        self.assertIs(config, config3)
+        self.assertEqual(config3.package_version(), '1.2.4')
+        self.assertEqual(config3.get_gitconfig_param('github-user'), 'steve')
+
+        # external edits are picked up
+        with open(self.test_file, 'a') as handle:
+            handle.write('\n[extra]\nthing = womp\n')
+        config4 = load_configuration(
+            package_dir=self.dir, gitconfig_file=self.gitconfig
+        )
+        self.assertIsNot(config, config4)
+        self.assertEqual(config4.get_param('extra', 'thing'), 'womp')
+        self.assertEqual(config4.package_version(), '1.2.4')
+
+        clear_configuration_cache()
+        config5 = load_configuration(
+            package_dir=self.dir, gitconfig_file=self.gitconfig
+        )
+        self.assertIsNot(config4, config5)
+
+    def test_configuration_snapshot(self):
+        """later processes load the snapshot instead of parsing"""
+        config = load_configuration(
+            package_dir=self.dir, gitconfig_file=self.gitconfig
+        )
+        self.assertEqual(config.snapshot, 'written')
+        snapshot = os.path.join(self.dir, '.cirrus', 'cache', 'config.json')
+        self.assertTrue(os.path.exists(snapshot))
+        self.assertEqual(config.derived['python_versions'], 'py2.py3')
+        self.assertEqual(
+            config.derived['release_settings']['wait_on_ci_timeout'], 600
+        )
+        self.assertNotIn('quality_threshold', config.derived)
+
+        clear_configuration_cache()
+        with mock.patch('cirrus.configuration.configparser') as mock_parser:
+            config2 = load_configuration(
+                package_dir=self.dir, gitconfig_file=self.gitconfig
+            )
+            self.assertFalse(mock_parser.RawConfigParser.called)
+        self.assertEqual(config2.snapshot, 'loaded')
+        self.assertEqual(dict(config2), dict(config))
+        self.assertEqual(config2.package_name(), 'cirrus_tests')
+        self.assertEqual(config2.python_versions(), 'py2.py3')
+        self.assertFalse(config2.release_settings()['wait_on_ci'])
+        self.assertRaises(TypeError, config2.quality_threshold)
+
+        # the snapshot is keyed by the content
+        config2.update_package_version('1.2.4')
+        clear_configuration_cache()
+        config3 = load_configuration(
+            package_dir=self.dir, gitconfig_file=self.gitconfig
+        )
+        self.assertEqual(config3.snapshot, 'written')
+        self.assertEqual(config3.package_version(), '1.2.4')
+
+        # and the credential plugin setting
+        config3.set_gitconfig_param('credential-plugin', 'keyring')
+        self.assertEqual(config3.derived_value('credential_plugin'), 'keyring')
+        clear_configuration_cache()
+        with mock.patch('cirrus.configuration.get_creds_plugin'):
+            config4 = load_configuration(
+                package_dir=self.dir, gitconfig_file=self.gitconfig
+            )
+        self.assertEqual(config4.snapshot, 'written')
+        self.assertEqual(config4.derived['credential_plugin'], 'keyring')
+
     @mock.patch('cirrus.configuration.load_configuration')
     def test_get_github_api_base(self, load_config):
         """The github.api_base value from cirrus.conf is returned"""
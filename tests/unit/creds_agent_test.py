@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+tests for the creds agent and its client
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+from cirrus.creds_agent import (
+    CredentialStore,
+    CredsAgent,
+    agent_clear,
+    agent_get,
+    agent_put,
+    agent_status
+)
+
+
+class CredentialStoreTest(unittest.TestCase):
+    """
+    expiry of the in memory credentials
+    """
+    def setUp(self):
+        self.now = 1000
+        self.store = CredentialStore(ttl=100, idle=30, clock=lambda: self.now)
+
+    def test_idle(self):
+        """entries not used within the idle time expire"""
+        self.store.put('a', {'user': 'steve'})
+        self.now += 20
+        self.assertEqual(self.store.get('a'), {'user': 'steve'})
+        self.now += 20
+        self.assertEqual(self.store.get('a'), {'user': 'steve'})
+        self.now += 31
+        self.assertIsNone(self.store.get('a'))
+
+    def test_ttl(self):
+        """entries expire after the ttl even if used"""
+        self.store.put('a', 'value')
+        for _ in range(4):
+            self.now += 25
+            self.assertEqual(self.store.get('a'), 'value')
+        self.now += 25
+        self.assertIsNone(self.store.get('a'))
+        self.assertEqual(len(self.store), 0)
+
+
+class CredsAgentTest(unittest.TestCase):
+    """
+    run an agent in a child process and talk to it
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sock = os.path.join(self.dir, 'creds-agent.sock')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                CredsAgent(self.sock, client_timeout=0.5).run()
+            finally:
+                os._exit(0)
+        for _ in range(100):
+            if agent_status(self.sock) is not None:
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        os.kill(self.pid, signal.SIGTERM)
+        os.waitpid(self.pid, 0)
+        if os.path.exists(self.dir):
+            os.system('rm -rf {0}'.format(self.dir))
+
+    def test_agent(self):
+        """values are shared through the agent"""
+        self.assertEqual(os.stat(self.sock).st_mode & 0o777, 0o600)
+        self.assertIsNone(agent_get('keyring:cirrus', self.sock))
+        self.assertTrue(
+            agent_put('keyring:cirrus', {'github-user': 'steve'}, self.sock)
+        )
+        self.assertEqual(
+            agent_get('keyring:cirrus', self.sock), {'github-user': 'steve'}
+        )
+        status = agent_status(self.sock)
+        self.assertEqual(status['pid'], self.pid)
+        self.assertEqual(status['entries'], 1)
+        self.assertTrue(agent_clear(self.sock))
+        self.assertIsNone(agent_get('keyring:cirrus', self.sock))
+
+    def test_stalled_client(self):
+        """a client that sends nothing doesnt block the agent"""
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with stalled:
+            stalled.connect(self.sock)
+            stalled.sendall(b'{"action": ')
+            self.assertTrue(agent_put('key', 'value', self.sock))
+            self.assertEqual(agent_get('key', self.sock), 'value')
+            self.assertEqual(stalled.recv(1024), b'')
+
+    def test_not_running(self):
+        """clients get nothing if the agent isnt running or is disabled"""
+        missing = os.path.join(self.dir, 'missing.sock')
+        self.assertIsNone(agent_get('key', missing))
+        self.assertFalse(agent_put('key', 'value', missing))
+        with mock.patch.dict(os.environ, {'CIRRUS_CREDS_AGENT_SOCK': ''}):
+            self.assertIsNone(agent_get('key'))
+            self.assertIsNone(agent_status())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,32 @@
 """
 creds_plugin tests
 """
+import json
 import unittest
 
+import pystache
+
 from cirrus.creds_plugin import CredsPlugin
 
 
+class CountingPlugin(CredsPlugin):
+    """plugin that counts credential lookups"""
+    def __init__(self):
+        self.calls = {}
+        super(CountingPlugin, self).__init__()
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def github_credentials(self):
+        self._count('github_credentials')
+        return {'github_user': 'steve', 'github_token': None}
+
+    def pypi_credentials(self):
+        self._count('pypi_credentials')
+        return {}
+
+
 class CredsPluginTest(unittest.TestCase):
     """
     test coverage for creds plugin object
@@ -24,6 +45,30 @@ class CredsPluginTest(unittest.TestCase):
         self.assertEqual(gh_defaults['github_user'], None)
         self.assertEqual(gh_defaults['github_token'], None)
 
+    def test_credential_map_lazy(self):
+        """credential groups are only looked up when used"""
+        plugin = CountingPlugin()
+        mapping = plugin.credential_map()
+        self.assertIn('pypi_credentials', mapping)
+        self.assertEqual(plugin.calls, {})
+
+        rendered = pystache.render(
+            '{{cirrus.credentials.github_credentials.github_user}}',
+            {'cirrus': {'credentials': mapping}}
+        )
+        self.assertEqual(rendered, 'steve')
+        self.assertEqual(mapping.resolved(), ['github_credentials'])
+        self.assertEqual(mapping['github_credentials']['github_user'], 'steve')
+        self.assertEqual(plugin.calls, {'github_credentials': 1})
+
+        # whole map access resolves everything
+        self.assertEqual(
+            json.loads(json.dumps(mapping))['pypi_credentials'], {}
+        )
+        self.assertEqual(dict(mapping), mapping)
+        self.assertEqual(plugin.calls['github_credentials'], 1)
+        self.assertEqual(plugin.calls['pypi_credentials'], 1)
+
 
 if __name__ == '__main__':
     unittest.main()
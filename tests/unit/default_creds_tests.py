@@ -6,6 +6,7 @@ import os
 import unittest
 import tempfile
 import configparser
+from unittest import mock
 
 from cirrus.plugins.creds.default import Default
 
@@ -46,6 +47,27 @@ class DefaultCredsTests(unittest.TestCase):
         for n, m in plugin.credential_methods():
             m()
 
+    def test_setting_credentials(self):
+        """each setter updates the gitconfig in one write"""
+        plugin = Default(gitconfig_file=self.gitconfig)
+        with mock.patch.object(
+                plugin.config, '_write', wraps=plugin.config._write
+        ) as mock_write:
+            plugin.set_chef_credentials('server', 'steve', 'key.pem')
+            self.assertEqual(mock_write.call_count, 1)
+            with plugin.batch():
+                plugin.set_pypi_credentials('steve', 'pypi')
+                plugin.set_ssh_credentials('steve', 'id_rsa')
+            self.assertEqual(mock_write.call_count, 2)
+
+        plugin = Default(gitconfig_file=self.gitconfig)
+        self.assertEqual(
+            plugin.chef_credentials()['chef_client_keyfile'], 'key.pem'
+        )
+        self.assertEqual(plugin.pypi_credentials()['token'], 'pypi')
+        self.assertEqual(plugin.ssh_credentials()['ssh_key'], 'id_rsa')
+        self.assertEqual(plugin.github_credentials()['github_user'], 'steve')
+
 
 if __name__ == '__main__':
     unittest.main()
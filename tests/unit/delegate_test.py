@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+tests for the cirrus delegate command
+"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from cirrus.delegate import forward, main, run_in_process
+
+
+class DelegateTest(unittest.TestCase):
+    """
+    test coverage for subprocess and in process dispatch
+    """
+    def setUp(self):
+        self.patch_env = mock.patch.dict(
+            os.environ, {'VIRTUALENV_HOME': '/venv'}
+        )
+        self.patch_env.start()
+        os.environ.pop('GIT_PREFIX', None)
+        os.environ.pop('CIRRUS_DISPATCH', None)
+        self.patch_commands = mock.patch('cirrus.delegate.installed_commands')
+        self.mock_commands = self.patch_commands.start()
+        self.mock_commands.return_value = {
+            'cirrus': 'cirrus.delegate:main',
+            'hello': 'cirrus.hello:main'
+        }
+        self.patch_signals = mock.patch(
+            'cirrus.delegate.install_signal_handlers'
+        )
+        self.patch_signals.start()
+        self.patch_forward = mock.patch('cirrus.delegate.forward')
+        self.mock_forward = self.patch_forward.start()
+        self.mock_forward.return_value = None
+        self.old_argv = sys.argv
+
+    def tearDown(self):
+        sys.argv = self.old_argv
+        self.patch_forward.stop()
+        self.patch_signals.stop()
+        self.patch_commands.stop()
+        self.patch_env.stop()
+
+    @mock.patch('cirrus.delegate.run_command')
+    @mock.patch('cirrus.delegate.os.path.exists')
+    def test_subprocess_dispatch(self, mock_exists, mock_run):
+        """default mode runs the console script"""
+        mock_exists.return_value = True
+        mock_run.return_value = 3
+        sys.argv = ['cirrus', 'hello', '--thing']
+        self.assertEqual(main(), 3)
+        mock_run.assert_called_with(['/venv/bin/hello', '--thing'])
+
+    @mock.patch('cirrus.delegate.run_command')
+    @mock.patch('cirrus.delegate.load_entry_point')
+    def test_in_process_dispatch(self, mock_load, mock_run):
+        """in process mode calls the entry point with argv set up"""
+        seen = {}
+
+        def fake_main():
+            seen['argv'] = list(sys.argv)
+            seen['cwd'] = os.getcwd()
+            return 4
+
+        mock_load.return_value = fake_main
+        os.environ['CIRRUS_DISPATCH'] = 'inprocess'
+        os.environ['GIT_PREFIX'] = '/'
+        sys.argv = ['cirrus', 'hello', '--thing']
+        cwd = os.getcwd()
+        self.assertEqual(main(), 4)
+        self.assertEqual(seen['argv'], ['/venv/bin/hello', '--thing'])
+        self.assertEqual(seen['cwd'], '/')
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertFalse(mock_run.called)
+        mock_load.assert_called_with('cirrus.hello:main')
+
+    @mock.patch('cirrus.delegate.run_command')
+    def test_server_dispatch(self, mock_run):
+        """commands run by the cirrus server are not run again"""
+        self.mock_forward.return_value = 5
+        sys.argv = ['cirrus', 'hello', '--thing']
+        self.assertEqual(main(), 5)
+        self.mock_forward.assert_called_with(
+            'hello', '/venv/bin/hello', 'cirrus.hello:main', ['--thing']
+        )
+        self.assertFalse(mock_run.called)
+
+    @mock.patch('cirrus.delegate.os.path.exists')
+    def test_unknown_command(self, mock_exists):
+        """unknown commands exit 127 in either mode"""
+        mock_exists.return_value = False
+        os.environ['CIRRUS_DISPATCH'] = 'inprocess'
+        sys.argv = ['cirrus', 'womp']
+        self.assertEqual(main(), 127)
+
+    @mock.patch('cirrus.delegate.load_entry_point')
+    def test_run_in_process_exit_codes(self, mock_load):
+        """SystemExit codes are converted like the interpreter does"""
+        def exits(code):
+            def func():
+                sys.exit(code)
+            return func
+
+        mock_load.return_value = exits(2)
+        self.assertEqual(run_in_process('hello', 'x:main', []), 2)
+        mock_load.return_value = exits(None)
+        self.assertEqual(run_in_process('hello', 'x:main', []), 0)
+        mock_load.return_value = exits('error message')
+        self.assertEqual(run_in_process('hello', 'x:main', []), 1)
+        self.assertEqual(sys.argv, self.old_argv)
+
+
+
+class ForwardTest(unittest.TestCase):
+    """
+    the server client is only used when its socket exists
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sock = os.path.join(self.dir, 'server.sock')
+        self.patch_env = mock.patch.dict(
+            os.environ, {'CIRRUS_SERVER_SOCK': self.sock}
+        )
+        self.patch_env.start()
+
+    def tearDown(self):
+        self.patch_env.stop()
+        os.system('rm -rf {0}'.format(self.dir))
+
+    @mock.patch('cirrus.delegate.server')
+    def test_forward(self, mock_server):
+        self.assertIsNone(forward('hello', '/venv/bin/hello', 'x:main', []))
+        self.assertFalse(mock_server.forward.called)
+
+        open(self.sock, 'w').close()
+        mock_server.forward.return_value = 3
+        self.assertEqual(
+            forward('hello', '/venv/bin/hello', 'x:main', ['-h']), 3
+        )
+        mock_server.forward.assert_called_once_with(
+            'hello', '/venv/bin/hello', 'x:main', ['-h'], path=self.sock
+        )
+
+if __name__ == '__main__':
+    unittest.main()
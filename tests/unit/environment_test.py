@@ -9,8 +9,14 @@ import copy
 from unittest import TestCase, mock
 import tempfile
 
+import cirrus
 from cirrus.environment import cirrus_home
 from cirrus.environment import virtualenv_home
+from cirrus.environment import clear_repo_cache
+from cirrus.environment import discover_repo
+from cirrus.environment import repo_directory
+
+from .harnesses import init_repo, run_git
 
 
 class EnvironmentFunctionTests(TestCase):
@@ -70,25 +76,23 @@ class CleanEnvironmentTests(TestCase):
         if os.path.exists(self.dir):
             os.system('rm -rf {}'.format(self.dir))
 
-    @mock.patch('cirrus.environment.inspect.getsourcefile')
     @mock.patch('cirrus.environment.repo_directory')
     @mock.patch('cirrus.environment.os.environ')
-    def test_cirrus_home_in_venv(self, mock_env, mock_repo, mock_srcfile):
+    def test_cirrus_home_in_venv(self, mock_env, mock_repo):
         mock_env.get = mock.Mock()
         mock_env.get = mock.Mock()
         mock_env.get.return_value = None
         mock_env.__getitem__ = mock.Mock()
         mock_env.__getitem__.return_value = self.dir
         mock_env.__setitem__ = mock.Mock()
-        mock_srcfile.return_value = self.venv_dir
-        self.assertEqual(cirrus_home(), self.dir)
+        with mock.patch.object(cirrus, '__file__', self.venv_dir):
+            self.assertEqual(cirrus_home(), self.dir)
         self.assertTrue(not mock_repo.called)
         self.assertTrue(mock_env.__setitem__.called)
 
-    @mock.patch('cirrus.environment.inspect.getsourcefile')
     @mock.patch('cirrus.environment.repo_directory')
     @mock.patch('cirrus.environment.os.environ')
-    def test_cirrus_home_in_bad_repo(self, mock_env, mock_repo, mock_srcfile):
+    def test_cirrus_home_in_bad_repo(self, mock_env, mock_repo):
         """test no venv or repo"""
         mock_env.get = mock.Mock()
         mock_env.get = mock.Mock()
@@ -96,27 +100,110 @@ class CleanEnvironmentTests(TestCase):
         mock_env.__getitem__ = mock.Mock()
         mock_env.__getitem__.return_value = self.dir
         mock_env.__setitem__ = mock.Mock()
-        mock_srcfile.return_value = self.venv_dir_2
         mock_repo.return_value = None
-        self.assertRaises(RuntimeError, cirrus_home)
+        with mock.patch.object(cirrus, '__file__', self.venv_dir_2):
+            self.assertRaises(RuntimeError, cirrus_home)
         self.assertTrue(not mock_env.__setitem__.called)
 
-    @mock.patch('cirrus.environment.inspect.getsourcefile')
     @mock.patch('cirrus.environment.repo_directory')
     @mock.patch('cirrus.environment.os.environ')
-    def test_cirrus_home_in_repo(self, mock_env, mock_repo, mock_srcfile):
+    def test_cirrus_home_in_repo(self, mock_env, mock_repo):
         """test repo source file and no repo info"""
         mock_env.get = mock.Mock()
         mock_env.get.return_value = None
         mock_env.__getitem__ = mock.Mock()
         mock_env.__getitem__.return_value = None
         mock_env.__setitem__ = mock.Mock()
-        mock_srcfile.return_value = self.venv_dir_2
         mock_repo.return_value = os.path.dirname(self.venv_dir_2)
-        self.assertEqual(cirrus_home(), os.path.dirname(self.venv_dir_2))
-        self.assertTrue(mock_repo.called)
+        with mock.patch.object(cirrus, '__file__', self.venv_dir_2):
+            self.assertEqual(cirrus_home(), os.path.dirname(self.venv_dir_2))
+        mock_repo.assert_called_once_with(os.path.dirname(self.venv_dir_2))
         self.assertTrue(mock_env.__setitem__.called)
 
 
+class RepoDiscoveryTests(TestCase):
+    """
+    repo discovery compared with git rev-parse
+    """
+    def setUp(self):
+        clear_repo_cache()
+        self.dir = os.path.realpath(tempfile.mkdtemp())
+        self.repo = os.path.join(self.dir, 'repo')
+        init_repo(self.repo)
+        run_git(self.repo, 'commit', '-q', '--allow-empty', '-m', 'initial')
+        self.subdir = os.path.join(self.repo, 'src', 'package')
+        os.makedirs(self.subdir)
+        self.cwd = os.getcwd()
+        self.environ = mock.patch.dict(os.environ)
+        self.environ.start()
+        for name in ('GIT_DIR', 'GIT_WORK_TREE', 'GIT_CEILING_DIRECTORIES'):
+            os.environ.pop(name, None)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.environ.stop()
+        clear_repo_cache()
+        if os.path.exists(self.dir):
+            os.system('rm -rf {}'.format(self.dir))
+
+    def assertMatchesGit(self, path):
+        os.chdir(path)
+        self.assertEqual(
+            repo_directory(), run_git(path, 'rev-parse', '--show-toplevel')
+        )
+        self.assertEqual(
+            os.path.realpath(discover_repo().common_dir),
+            os.path.realpath(run_git(path, 'rev-parse', '--git-common-dir'))
+        )
+
+    def test_repo(self):
+        """top level and subdirs of a repo"""
+        self.assertMatchesGit(self.repo)
+        self.assertMatchesGit(self.subdir)
+        self.assertEqual(
+            discover_repo(self.subdir).git_dir,
+            os.path.join(self.repo, '.git')
+        )
+
+    def test_worktree(self):
+        """linked worktrees use their gitdir file"""
+        worktree = os.path.join(self.dir, 'worktree')
+        run_git(self.repo, 'worktree', 'add', '-q', worktree)
+        self.assertMatchesGit(worktree)
+        location = discover_repo(worktree)
+        self.assertEqual(
+            location.git_dir,
+            os.path.join(self.repo, '.git', 'worktrees', 'worktree')
+        )
+        self.assertEqual(location.common_dir, os.path.join(self.repo, '.git'))
+
+    def test_git_env(self):
+        """GIT_DIR and GIT_WORK_TREE are honoured"""
+        os.environ['GIT_DIR'] = os.path.join(self.repo, '.git')
+        os.environ['GIT_WORK_TREE'] = self.subdir
+        self.assertMatchesGit(self.dir)
+        del os.environ['GIT_WORK_TREE']
+        self.assertMatchesGit(self.subdir)
+
+    def test_not_a_repo(self):
+        """outside a repo there is no repo directory"""
+        outside = os.path.join(self.dir, 'outside')
+        os.makedirs(outside)
+        os.environ['GIT_CEILING_DIRECTORIES'] = self.dir
+        self.assertIsNone(repo_directory(outside))
+        bare = os.path.join(self.dir, 'bare.git')
+        init_repo(bare, '--bare')
+        location = discover_repo(bare)
+        self.assertEqual(location.git_dir, bare)
+        self.assertIsNone(location.work_tree)
+
+    def test_memoized(self):
+        """repeat lookups from a directory dont walk the tree again"""
+        repo_directory(self.subdir)
+        with mock.patch('cirrus.environment._discover') as mock_discover:
+            self.assertEqual(repo_directory(self.subdir), self.repo)
+            self.assertFalse(mock_discover.called)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,10 +2,17 @@
 feature command tests
 """
 import os
+import json
 import tempfile
 from unittest import TestCase, mock
 
-from cirrus.feature import new_feature_branch, new_pr
+from cirrus.branch_classifier import BranchInfo
+from cirrus.feature import (
+    list_feature_branches,
+    new_feature_branch,
+    new_pr,
+    prune_branches
+)
 
 from .harnesses import CirrusConfigurationHarness, write_cirrus_conf
 
@@ -96,5 +103,107 @@ class FeatureCommandTest(TestCase):
             self.assertTrue(mock_pr.called)
 
 
+    @mock.patch('cirrus.feature.print', create=True)
+    @mock.patch('cirrus.feature.GitHubContext')
+    def test_list_feature_branches(self, mock_ghc, mock_print):
+        """
+        _test_list_feature_branches_
+        """
+        def branch(name, merged_into):
+            return BranchInfo(
+                'remotes/origin/feature/{0}'.format(name),
+                'refs/remotes/origin/feature/{0}'.format(name),
+                'origin', 'feature/{0}'.format(name), 'abc', 1438210000,
+                3 * 86400, merged_into, 2, 1
+            )
+        ghc = mock_ghc.return_value.__enter__.return_value
+        ghc.classify_branches.return_value = [
+            branch('done', ['develop']),
+            branch('womp', ['master']),
+        ]
+        opts = mock.Mock()
+        opts.merged = False
+        opts.counts = True
+
+        list_feature_branches(opts)
+        ghc.classify_branches.assert_called_once_with(
+            prefixes=['feature/'], local=False, counts=True
+        )
+        self.assertEqual(
+            [x[0][0] for x in mock_print.call_args_list],
+            [
+                'unmerged feature branches:',
+                'remotes/origin/feature/womp (2 ahead, 1 behind develop; '
+                'last commit 3 days ago; merged into master)'
+            ]
+        )
+
+    @mock.patch('cirrus.feature.GitHubContext')
+    def test_prune_branches(self, mock_ghc):
+        """
+        _test_prune_branches_
+        """
+        def branch(name, age_days, merged_into, sha='abc'):
+            return BranchInfo(
+                'remotes/origin/{0}'.format(name),
+                'refs/remotes/origin/{0}'.format(name),
+                'origin', name, sha, 1438210000,
+                age_days * 86400, merged_into, None, None
+            )
+        ghc = mock_ghc.return_value.__enter__.return_value
+        classifier = ghc.branch_classifier.return_value
+        classifier.classify.return_value = [
+            branch('feature/old', 40, ['develop']),
+            branch('feature/new', 2, ['develop']),
+            branch('feature/open', 90, []),
+            branch('feature/pushed', 90, ['develop', 'master'], 'tip'),
+            branch('release/1.0', 100, ['develop', 'master']),
+        ]
+        classifier.base_commits.return_value = {
+            'develop': 'tip', 'master': 'tip'
+        }
+        ghc.delete_remote_branches.return_value = (
+            ['feature/old'], {'release/1.0': '[remote rejected]'}
+        )
+        opts = mock.Mock()
+        opts.older_than = 30
+        opts.prefix = None
+        opts.batch_size = 100
+        opts.dry_run = True
+        opts.fetch = False
+        opts.report = os.path.join(self.dir, 'report.json')
+
+        report = prune_branches(opts)
+        classifier.classify.assert_called_once_with(
+            ['feature/', 'release/'], local=False, counts=False
+        )
+        self.assertFalse(ghc.delete_remote_branches.called)
+        self.assertEqual(report['stale'], 2)
+        self.assertEqual(
+            [(x['branch'], x['status']) for x in report['branches']],
+            [('feature/old', 'would-delete'), ('release/1.0', 'would-delete')]
+        )
+
+        opts.dry_run = False
+        opts.fetch = True
+        report = prune_branches(opts)
+        ghc.repo.remotes['origin'].fetch.assert_called_once_with(prune=True)
+        ghc.delete_remote_branches.assert_called_once_with(
+            ['feature/old', 'release/1.0'], batch_size=100
+        )
+        with open(opts.report) as handle:
+            self.assertEqual(json.load(handle), report)
+        self.assertEqual((report['deleted'], report['failed']), (1, 1))
+        self.assertEqual(report['branches'][0]['status'], 'deleted')
+        self.assertEqual(report['branches'][1], {
+            'branch': 'release/1.0',
+            'sha': 'abc',
+            'committed_date': 1438210000,
+            'age_days': 100,
+            'merged_into': ['develop', 'master'],
+            'status': 'failed',
+            'error': '[remote rejected]',
+        })
+
 if __name__ == '__main__':
     unittest.main()
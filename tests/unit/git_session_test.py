@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+tests for the shared git repository sessions
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+from cirrus.git_session import (
+    GitSessionError,
+    RefIndex,
+    RepositorySession,
+    close_sessions,
+    get_session,
+    parse_ref_line
+)
+
+from .harnesses import init_repo, run_git
+
+
+class RepositorySessionTest(unittest.TestCase):
+    """
+    sessions against a real repo
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        init_repo(self.dir)
+        with open(os.path.join(self.dir, 'file.txt'), 'w') as handle:
+            handle.write('womp\n')
+        run_git(self.dir, 'add', 'file.txt')
+        run_git(
+            self.dir, 'commit', '-q', '-m', 'first line\n\nmore detail',
+            env={
+                'GIT_AUTHOR_NAME': 'Steve Womp',
+                'GIT_AUTHOR_EMAIL': 'steve@example.com',
+                'GIT_AUTHOR_DATE': '1438210001 +0100',
+                'GIT_COMMITTER_DATE': '1438210002 +0000'
+            }
+        )
+        run_git(self.dir, 'tag', '-a', '-m', 'tagged', 'v1')
+        run_git(self.dir, 'commit', '-q', '--allow-empty', '-m', 'second')
+
+    def tearDown(self):
+        close_sessions()
+        shutil.rmtree(self.dir)
+
+    def test_lookups(self):
+        """objects are read through one process per batch mode"""
+        session = RepositorySession(self.dir)
+        head = run_git(self.dir, 'rev-parse', 'HEAD')
+        self.assertEqual(session.resolve('HEAD'), head)
+        self.assertIsNone(session.resolve('nope'))
+        self.assertEqual(
+            session.object_info('v1')[1], 'tag'
+        )
+        sha, kind, data = session.read_object('HEAD:file.txt')
+        self.assertEqual((kind, data), ('blob', b'womp\n'))
+
+        commit = session.commit('v1')
+        self.assertEqual(
+            commit.sha, run_git(self.dir, 'rev-parse', 'v1^{commit}')
+        )
+        self.assertEqual(commit.author_name, 'Steve Womp')
+        self.assertEqual(commit.author_email, 'steve@example.com')
+        self.assertEqual(commit.authored_date, 1438210001)
+        self.assertEqual(commit.committer_name, 'bob')
+        self.assertEqual(commit.committed_date, 1438210002)
+        self.assertEqual(commit.message, 'first line\n\nmore detail\n')
+        self.assertEqual(commit.parents, ())
+        self.assertEqual(session.commit('HEAD').parents, (commit.sha,))
+
+        pids = (session.batch.pid, session.batch_check.pid)
+        for _ in range(5):
+            session.commit('HEAD~1')
+            session.resolve('v1')
+        self.assertEqual(pids, (session.batch.pid, session.batch_check.pid))
+
+        batch = session.batch.process
+        session.close()
+        self.assertIsNotNone(batch.poll())
+        # a closed session reopens on use
+        self.assertEqual(session.resolve('HEAD'), head)
+        session.close()
+
+    def test_shared(self):
+        """sessions are shared per repo dir until closed"""
+        session = get_session(self.dir)
+        self.assertIs(get_session(os.path.join(self.dir, '.')), session)
+        self.assertEqual(
+            os.path.realpath(session.repo.working_tree_dir),
+            os.path.realpath(self.dir)
+        )
+        close_sessions()
+        self.assertIsNot(get_session(self.dir), session)
+
+    def test_refs(self):
+        """tags and branches are indexed from one for-each-ref call"""
+        run_git(
+            self.dir, 'tag', '-a', '-m', 'tag of tag', 'v1-again', 'v1',
+        )
+        run_git(self.dir, 'tag', 'v2')
+        run_git(self.dir, 'branch', 'develop', 'v1')
+        session = RepositorySession(self.dir)
+        refs = session.refs
+        first = run_git(self.dir, 'rev-parse', 'v1^{commit}')
+        head = run_git(self.dir, 'rev-parse', 'HEAD')
+        self.assertTrue(refs.has_tag('v1'))
+        self.assertFalse(refs.has_tag('v3'))
+        self.assertTrue(refs.has_branch('develop'))
+        self.assertEqual(
+            refs.tag_commits(),
+            {'v1': first, 'v1-again': first, 'v2': head}
+        )
+        self.assertEqual(refs.tags_by_date()[-2:], ['v1', 'v1-again'])
+        self.assertEqual(refs.tags['v1'].committed_date, 1438210002)
+        self.assertEqual(
+            sorted(session.unmerged_refs('develop')),
+            ['refs/heads/master', 'refs/tags/v2']
+        )
+
+        # the index is kept until refreshed
+        run_git(self.dir, 'tag', 'v3')
+        self.assertIs(session.refs, refs)
+        self.assertFalse(session.refs.has_tag('v3'))
+        session.refresh_refs()
+        self.assertTrue(session.refs.has_tag('v3'))
+        session.close()
+
+    def test_iter_log(self):
+        """commits are streamed from git log with optional filters"""
+        run_git(self.dir, 'checkout', '-q', '-b', 'feature', 'v1')
+        run_git(
+            self.dir, 'commit', '-q', '--allow-empty', '-m', 'feature work'
+        )
+        run_git(self.dir, 'checkout', '-q', 'master')
+        run_git(
+            self.dir, 'merge', '-q', '--no-ff', '-m', 'merge feature',
+            'feature'
+        )
+        session = RepositorySession(self.dir)
+
+        def messages(**options):
+            return [
+                x.message.split('\n')[0]
+                for x in session.iter_log('v1..HEAD', **options)
+            ]
+        self.assertEqual(
+            sorted(messages()), ['feature work', 'merge feature', 'second']
+        )
+        self.assertEqual(
+            messages(first_parent=True), ['merge feature', 'second']
+        )
+        self.assertEqual(
+            sorted(messages(no_merges=True)), ['feature work', 'second']
+        )
+
+        record = next(session.iter_log('HEAD~1'))
+        self.assertEqual(record.sha, run_git(self.dir, 'rev-parse', 'HEAD~1'))
+        self.assertEqual(record['committer'], 'bob')
+        self.assertIn('date', record)
+        self.assertRaises(KeyError, record.__getitem__, 'womp')
+        with self.assertRaises(GitSessionError):
+            list(session.iter_log('nope..HEAD'))
+
+    def test_iter_log_warnings(self):
+        """lots of stderr output from git log doesnt block the stream"""
+        bindir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bindir)
+        with open(os.path.join(bindir, 'git'), 'w') as handle:
+            handle.write(
+                "#!/bin/sh\n"
+                "head -c 300000 /dev/zero | tr '\\000' w >&2\n"
+                "printf 'abc\\037bob\\037bob\\0371438210002\\037womp'\n"
+                "echo ' broken' >&2\n"
+                "exit 1\n"
+            )
+        os.chmod(os.path.join(bindir, 'git'), 0o755)
+        path = '{0}{1}{2}'.format(bindir, os.pathsep, os.environ['PATH'])
+        session = RepositorySession(self.dir)
+        with mock.patch.dict(os.environ, {'PATH': path}):
+            records = session.iter_log('HEAD')
+            self.assertEqual(next(records).message, 'womp')
+            with self.assertRaises(GitSessionError) as context:
+                next(records)
+        self.assertTrue(str(context.exception).endswith('w broken'))
+
+    def test_remote_branches(self):
+        """branches in a clone include the remote tracking branches"""
+        run_git(self.dir, 'branch', 'develop')
+        clone = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, clone)
+        subprocess.check_call(
+            ['git', 'clone', '-q', self.dir, clone]
+        )
+        session = RepositorySession(clone)
+        refs = session.refs
+        self.assertTrue(refs.has_remote_branch('develop'))
+        self.assertTrue(refs.has_remote_branch('origin/develop'))
+        self.assertFalse(refs.has_remote_branch('womp'))
+        self.assertEqual(
+            refs.branch_names(),
+            ['master', 'remotes/origin/develop', 'remotes/origin/master']
+        )
+        self.assertEqual(
+            refs.branch_names(set(['refs/remotes/origin/develop'])),
+            ['remotes/origin/develop']
+        )
+        session.close()
+
+
+class RefIndexTest(unittest.TestCase):
+    """
+    parsing for-each-ref output
+    """
+    def test_parse_ref_line(self):
+        commit = parse_ref_line(
+            'refs/heads/master\x00commit\x00abc\x00\x00\x00100\x00\x00'
+        )
+        self.assertEqual(commit.commit, 'abc')
+        self.assertEqual(commit.committed_date, 100)
+        self.assertIsNone(commit.symref)
+        tag = parse_ref_line(
+            'refs/tags/v1\x00tag\x00def\x00commit\x00abc\x00\x00100\x00'
+        )
+        self.assertEqual((tag.sha, tag.commit), ('def', 'abc'))
+        self.assertEqual(tag.committed_date, 100)
+        head = parse_ref_line(
+            'refs/remotes/origin/HEAD\x00commit\x00abc\x00\x00\x00100\x00\x00'
+            'refs/remotes/origin/master'
+        )
+        index = RefIndex([commit, tag, head])
+        self.assertIn('refs/tags/v1', index)
+        self.assertEqual(index.branch_names(), ['master'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,22 @@
 '''
 tests for git_tools
 '''
+import os
+import shutil
+import tempfile
 from unittest import TestCase, mock
 
 from git.remote import PushInfo
 
+from cirrus.commit_cache import CommitCache
+from cirrus.git_session import RepositorySession, close_sessions
 from cirrus.git_tools import (
     branch,
     build_release_notes,
     checkout_and_pull,
     format_commit_messages,
     get_active_branch,
+    get_active_commit_sha,
     get_commit_msgs,
     get_diff_files,
     get_tags,
@@ -20,6 +26,8 @@ from cirrus.git_tools import (
     push
 )
 
+from .harnesses import init_repo, run_git
+
 
 class GitToolsTest(TestCase):
 
@@ -31,16 +39,6 @@ class GitToolsTest(TestCase):
         self.mock_commits[1].committer.name = 'tom'
         self.mock_commits[1].message = 'toms commit'
         self.mock_commits[1].committed_date = '1438150783'
-        self.mock_tags = [mock.Mock(), mock.Mock(), mock.Mock()]
-        self.mock_tags[0].configure_mock(name='banana')
-        self.mock_tags[0].commit.committed_date = '1438210002'
-        self.mock_tags[0].commit.hexsha = 'BANANA_SHA'
-        self.mock_tags[1].configure_mock(name='apple')
-        self.mock_tags[1].commit.committed_date = '1438210001'
-        self.mock_tags[1].commit.hexsha = 'APPLE_SHA'
-        self.mock_tags[2].configure_mock(name='orange')
-        self.mock_tags[2].commit.committed_date = '1438210003'
-        self.mock_tags[2].commit.hexsha = 'ORANGE_SHA'
         self.mock_repo = mock.Mock()
         self.mock_repo.head.commit.hexsha = 'HEAD_SHA'
         self.mock_repo.iter_commits = mock.Mock()
@@ -51,9 +49,10 @@ class GitToolsTest(TestCase):
         self.mock_repo.remotes.origin.push.side_effect = lambda x: [
             mock_push_return
         ]
-        self.mock_repo.tags = self.mock_tags
-        self.patch_git = mock.patch('cirrus.git_tools.git')
+        self.patch_git = mock.patch('cirrus.git_session.git')
         self.mock_git = self.patch_git.start()
+        self.patch_git_cmd = mock.patch('cirrus.git_tools.git')
+        self.mock_git_cmd = self.patch_git_cmd.start()
         self.mock_git.Repo = mock.Mock()
         self.mock_git.Repo.return_value = self.mock_repo
         self.release = '0.0.0'
@@ -70,6 +69,8 @@ class GitToolsTest(TestCase):
 
     def tearDown(self):
         self.patch_git.stop()
+        self.patch_git_cmd.stop()
+        close_sessions()
 
     def test_checkout_and_pull(self):
         """
@@ -127,7 +128,8 @@ class GitToolsTest(TestCase):
         with mock.patch(
             'cirrus.git_tools.get_tags_with_sha') as mock_get_tags_sha:
             with mock.patch(
-                'cirrus.git_tools.get_commit_msgs') as mock_get_commit:
+                'cirrus.git_tools.get_commit_msgs') as mock_get_commit, \
+                    mock.patch('cirrus.git_tools.open_cache') as mock_cache:
 
                 mock_get_tags_sha.return_value = tag
                 mock_get_commit.return_value = self.commit_info
@@ -137,6 +139,7 @@ class GitToolsTest(TestCase):
                     'plaintext')
                 self.assertTrue(mock_get_tags_sha.called)
                 self.assertTrue(mock_get_commit.called)
+                self.assertTrue(mock_cache.return_value.close.called)
 
     def test_commit_messages(self):
         """
@@ -156,33 +159,84 @@ class GitToolsTest(TestCase):
         msg = markdown_format(self.commit_info)
         print("Markdown release notes:\n{0}\n".format(msg))
 
-    def test_get_commit_msgs(self):                            
-        """                                                    
-        _test_get_commit_msgs_                                 
-        """      
-        result = get_commit_msgs(None, 'RANDOM_SHA')
-        self.assertIn('committer', result[0])
-        self.assertIn('message', result[0])
-        self.assertIn('date', result[0])
-        self.assertIn('committer', result[1])
-        self.assertIn('message', result[1])
-        self.assertIn('date', result[1])
-
-    def test_get_tags(self):                                   
-        """                                                    
-        _test_get_tags_                                        
-        """                                                    
-        result = get_tags(None)  
-        self.assertEqual(result, ['orange', 'banana', 'apple'])  
-
-    def test_get_tags_with_sha(self):                          
-        """                                                    
-        _test_get_tags_with_sha_                               
-        """
-        result = get_tags_with_sha(None)
-        self.assertEqual(result['orange'], 'ORANGE_SHA')
-        self.assertEqual(result['apple'], 'APPLE_SHA')
-        self.assertEqual(result['banana'], 'BANANA_SHA')
+class GitToolsRepoTest(TestCase):
+    """
+    git_tools functions that read objects through the session,
+    run against a real repo
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        init_repo(self.dir)
+        for name, date, tag_args in (
+                ('apple', '1438210001', ()),
+                ('banana', '1438210002', ('-a', '-m', 'annotated')),
+                ('orange', '1438210003', ())):
+            run_git(
+                self.dir, 'commit', '-q', '--allow-empty', '-m', name,
+                env={'GIT_COMMITTER_DATE': '{0} +0000'.format(date)}
+            )
+            run_git(self.dir, 'tag', name, *tag_args)
+
+    def tearDown(self):
+        close_sessions()
+        shutil.rmtree(self.dir)
+
+    def test_get_tags(self):
+        """
+        _test_get_tags_
+        """
+        result = get_tags(self.dir)
+        self.assertEqual(result, ['orange', 'banana', 'apple'])
+
+    def test_get_tags_with_sha(self):
+        """
+        _test_get_tags_with_sha_
+        """
+        result = get_tags_with_sha(self.dir)
+        for name in ('orange', 'apple', 'banana'):
+            self.assertEqual(
+                result[name],
+                run_git(self.dir, 'rev-parse', name + '^{commit}')
+            )
+
+    def test_get_commit_msgs(self):
+        """
+        _test_get_commit_msgs_
+        """
+        result = list(get_commit_msgs(self.dir, 'apple'))
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0]['committer'], 'bob')
+        self.assertEqual(result[0]['message'], 'orange\n')
+        self.assertEqual(result[0]['date'], '2015-07-29T22:46:43+00:00')
+        self.assertEqual(result[1]['message'], 'banana\n')
+
+    def test_get_commit_msgs_cached(self):
+        """commits in the cache are not read from git again"""
+        cache = CommitCache(os.path.join(self.dir, 'commits.sqlite'))
+        self.addCleanup(cache.close)
+        first = list(get_commit_msgs(self.dir, 'apple', cache=cache))
+        self.assertEqual(len(cache), 2)
+        close_sessions()
+        with mock.patch.object(
+                RepositorySession, 'commit',
+                side_effect=AssertionError('read from git')):
+            second = list(get_commit_msgs(self.dir, 'apple', cache=cache))
+        self.assertEqual(
+            [(x.sha, x['message'], x['date']) for x in second],
+            [(x.sha, x['message'], x['date']) for x in first]
+        )
+        self.assertEqual(
+            [x.sha for x in first],
+            [x.sha for x in get_commit_msgs(self.dir, 'apple')]
+        )
+
+    def test_get_active_commit_sha(self):
+        """short sha of HEAD"""
+        self.assertEqual(
+            get_active_commit_sha(self.dir),
+            run_git(self.dir, 'rev-parse', 'HEAD')[:7]
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+tests for the in process gitconfig parser, checked against git config
+"""
+import os
+import unittest
+import tempfile
+import subprocess
+from unittest import mock
+
+from cirrus.gitconfig import (
+    GitConfigParseError,
+    git_config_list,
+    load_gitconfig,
+    parse_config,
+    set_in_text,
+    unset_in_text,
+    wildmatch_regex
+)
+
+
+GITCONFIG = r"""
+# comment line
+; another comment
+[user]
+    name = Steve Womp   # trailing comment
+    email = "steve@example.com"
+[cirrus]
+    github-user = steve
+    github-token = "token with ; and # inside"
+    Credential-Plugin = default
+[alias]
+    lg = "log --graph --pretty=format:'%h %s'"
+    multi = one \
+two
+    escapes = tab\there\nnewline \"quoted\" back\\slash
+    spaces =   lots    of	spaces
+    empty =
+    flag
+[remote "Origin"]
+    url = git@github.com:cloudant/cirrus.git
+    fetch = +refs/heads/*:refs/remotes/origin/*
+    fetch = +refs/tags/*:refs/tags/*
+[url "with \"quotes\" and \\ slash"]
+    insteadOf = x
+[legacy.SubSection]
+    key = value
+[include]
+    path = included.cfg
+[includeIf "gitdir:{repo}/"]
+    path = ./conditional.cfg
+[includeIf "gitdir:/nowhere/"]
+    path = nowhere.cfg
+[includeIf "onbranch:main"]
+    path = branch.cfg
+[includeIf "onbranch:other"]
+    path = nowhere.cfg
+[cirrus]
+    github-user = overridden
+"""
+
+
+class GitConfigParserTest(unittest.TestCase):
+    """
+    compare the parser with git config -l for tricky gitconfigs
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.repo = os.path.join(self.dir, 'repo')
+        os.makedirs(self.repo)
+        subprocess.check_call(
+            ['git', 'init', '-q', '-b', 'main', self.repo]
+        )
+        self.gitconfig = os.path.join(self.dir, 'gitconfig')
+        with open(self.gitconfig, 'w') as handle:
+            handle.write(GITCONFIG.replace('{repo}', self.repo))
+        self.write('included.cfg', '[inc]\n\tvalue = 1\n[include]\n'
+                   '\tpath = nested.cfg\n')
+        self.write('nested.cfg', '[inc "nested"]\n\tvalue = 2\n')
+        self.write('conditional.cfg', '[cond]\n\tgitdir = yes\n')
+        self.write('branch.cfg', '[cond]\n\tbranch = main\n')
+        self.write('nowhere.cfg', '[cond]\n\tnowhere = wrong\n')
+        self.cwd = os.getcwd()
+        os.chdir(self.repo)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        if os.path.exists(self.dir):
+            os.system('rm -rf {0}'.format(self.dir))
+
+    def write(self, name, content):
+        with open(os.path.join(self.dir, name), 'w') as handle:
+            handle.write(content)
+
+    def test_matches_git(self):
+        """parsed entries are the same as git config -l"""
+        config = load_gitconfig(self.gitconfig)
+        self.assertEqual(config.entries, git_config_list(self.gitconfig))
+        self.assertEqual(config.get_param('cirrus', 'github-user'), 'overridden')
+        self.assertEqual(
+            config.get_param('cirrus', 'github-token'),
+            'token with ; and # inside'
+        )
+        self.assertEqual(config.get_param('alias', 'multi'), 'one two')
+        self.assertEqual(
+            config.get_all('remote', 'Origin.fetch'),
+            ['+refs/heads/*:refs/remotes/origin/*', '+refs/tags/*:refs/tags/*']
+        )
+        self.assertEqual(config.get_param('inc', 'nested.value'), '2')
+        self.assertEqual(config.get_param('cond', 'gitdir'), 'yes')
+        self.assertEqual(config.get_param('cond', 'branch'), 'main')
+        self.assertNotIn('nowhere', config['cond'].keys())
+
+    def test_values(self):
+        """escapes, quoting and whitespace handling"""
+        entries = dict(parse_config(
+            '[a]\n'
+            '\tx = tab\\there\n'
+            '\ty = "  keep  " after\n'
+            '\tz\n'
+        ))
+        self.assertEqual(entries['a.x'], 'tab\there')
+        self.assertEqual(entries['a.y'], '  keep   after')
+        self.assertIsNone(entries['a.z'])
+
+    def test_missing_file(self):
+        """missing gitconfig is empty"""
+        config = load_gitconfig(os.path.join(self.dir, 'missing'))
+        self.assertEqual(dict(config), {})
+
+    def test_syntax_errors(self):
+        """invalid syntax raises"""
+        for text in (
+                'key = outside\n',
+                '[bad section\n',
+                '[a]\n\tx = "unterminated\n',
+                '[a]\n\tx = bad \\q escape\n',
+                '[a]\n\t1x = bad key\n'):
+            self.assertRaises(GitConfigParseError, parse_config, text)
+
+    @mock.patch('cirrus.gitconfig.git_config_list')
+    def test_fallback(self, mock_list):
+        """unparseable files are read with git config"""
+        mock_list.return_value = [('cirrus.github-user', 'steve')]
+        self.write('gitconfig', '[a]\n\tx = "unterminated\n')
+        config = load_gitconfig(self.gitconfig)
+        mock_list.assert_called_with(self.gitconfig)
+        self.assertEqual(config.get_param('cirrus', 'github-user'), 'steve')
+
+    def test_wildmatch(self):
+        """includeIf patterns"""
+        self.assertTrue(wildmatch_regex('**/repo/**').match('/a/b/repo/.git'))
+        self.assertTrue(wildmatch_regex('/a/**/c').match('/a/c'))
+        self.assertTrue(wildmatch_regex('/a/*/c').match('/a/b/c'))
+        self.assertFalse(wildmatch_regex('/a/*/c').match('/a/b/b/c'))
+        self.assertTrue(wildmatch_regex('/A/[bc]', True).match('/a/c'))
+        self.assertFalse(wildmatch_regex('/a/[!bc]').match('/a/c'))
+
+
+class GitConfigWriteTest(unittest.TestCase):
+    """
+    batched writes to a gitconfig file
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.gitconfig = os.path.join(self.dir, 'gitconfig')
+        with open(self.gitconfig, 'w') as handle:
+            handle.write(
+                '# keep this comment\n'
+                '[cirrus]\n'
+                '\tgithub-user = steve\n'
+                '\tpypi-user = old\n'
+                '[remote "origin"]\n'
+                '\turl = git@github.com:cloudant/cirrus.git\n'
+            )
+
+    def tearDown(self):
+        if os.path.exists(self.dir):
+            os.system('rm -rf {0}'.format(self.dir))
+
+    def read(self):
+        with open(self.gitconfig) as handle:
+            return handle.read()
+
+    def test_batch(self):
+        """changes in a batch are written once and match git"""
+        config = load_gitconfig(self.gitconfig)
+        with mock.patch('cirrus.gitconfig.os.replace') as mock_replace:
+            mock_replace.side_effect = os.rename
+            with config.batch():
+                config.set_param('cirrus', 'github-user', 'bob')
+                config.set_param('cirrus', 'github-token', ' tok;en "x"')
+                with config.batch():
+                    config.unset_param('cirrus', 'pypi-user')
+                    config.set_param('remote', 'origin.fetch', '+refs/*')
+                    config.set_param('url', 'git@x.com:.insteadOf', 'x:')
+                self.assertFalse(mock_replace.called)
+                # in memory view is updated before the write
+                self.assertEqual(
+                    config.get_param('cirrus', 'github-user'), 'bob'
+                )
+            self.assertEqual(mock_replace.call_count, 1)
+
+        self.assertTrue(self.read().startswith('# keep this comment\n'))
+        self.assertEqual(
+            sorted(config.entries), sorted(git_config_list(self.gitconfig))
+        )
+        reread = load_gitconfig(self.gitconfig)
+        self.assertEqual(dict(reread), dict(config))
+        self.assertEqual(
+            reread.get_param('cirrus', 'github-token'), ' tok;en "x"'
+        )
+        self.assertIsNone(reread.get_param('cirrus', 'pypi-user'))
+        self.assertEqual(reread.get_param('url', 'git@x.com:.insteadof'), 'x:')
+        self.assertFalse(os.path.exists(self.gitconfig + '.lock'))
+
+    def test_batch_error(self):
+        """nothing is written if the batch raises"""
+        config = load_gitconfig(self.gitconfig)
+        before = self.read()
+        with self.assertRaises(ValueError):
+            with config.batch():
+                config.set_param('cirrus', 'github-user', 'bob')
+                raise ValueError('womp')
+        self.assertEqual(self.read(), before)
+        self.assertEqual(config.get_param('cirrus', 'github-user'), 'steve')
+
+    def test_set_param(self):
+        """single set creates the file and is readable by git"""
+        os.unlink(self.gitconfig)
+        config = load_gitconfig(self.gitconfig)
+        config.set_param('cirrus', 'credential-plugin', 'default')
+        self.assertEqual(
+            git_config_list(self.gitconfig),
+            [('cirrus.credential-plugin', 'default')]
+        )
+
+    def test_text_edits(self):
+        """sets replace values in place and add to existing sections"""
+        text = '[a]\n\tx = 1 ; note\n[b]\n\ty = 2\n[a]\n\tz = 3\n'
+        text = set_in_text(text, 'a', 'x', 'new')
+        text = set_in_text(text, 'a', 'w', '4')
+        text = unset_in_text(text, 'b', 'y')
+        self.assertEqual(
+            text, '[a]\n\tx = new\n[b]\n[a]\n\tz = 3\n\tw = 4\n'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
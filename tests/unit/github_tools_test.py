@@ -6,6 +6,7 @@ from unittest import TestCase, mock
 
 from cirrus import configuration
 from cirrus import github_tools
+from cirrus.git_session import close_sessions
 
 from .harnesses import _repo_directory
 
@@ -78,6 +79,7 @@ class GithubToolsTest(TestCase):
         teardown mocks
         """
         mock.patch.stopall()
+        close_sessions()
 
     @mock.patch('cirrus.github_tools.get_active_branch')
     @mock.patch('cirrus.github_tools.requests.post')
@@ -154,7 +156,7 @@ class GitHubContextTest(TestCase):
     """Tests for GitHubContext methods using HTTP calls."""
 
     def setUp(self):
-        self.mock_git = mock.patch('cirrus.github_tools.git').start()
+        self.mock_git = mock.patch('cirrus.git_session.git').start()
         repo = mock.Mock()
         repo.active_branch.name = 'TEST_BRANCH'
         self.mock_git.Repo.return_value = repo
@@ -183,6 +185,7 @@ class GitHubContextTest(TestCase):
 
     def tearDown(self):
         mock.patch.stopall()
+        close_sessions()
 
     def test_constructor(self):
         with github_tools.GitHubContext('.') as gh:
@@ -241,6 +244,86 @@ class GitHubContextTest(TestCase):
 
         m_push.assert_called_with('.')
 
+    @mock.patch('cirrus.github_tools.time')
+    def test_push_atomic_with_retry(self, m_time):
+        refspecs = [
+            'refs/heads/master:refs/heads/master',
+            'refs/tags/1.2.3:refs/tags/1.2.3'
+        ]
+        with github_tools.GitHubContext('.') as gh:
+            gh.repo.git.push.side_effect = [
+                github_tools.git.exc.GitCommandError('push', 1), 'ok'
+            ]
+            gh.push_atomic_with_retry(refspecs, attempts=2, cooloff=1)
+            gh.repo.git.push.assert_called_with(
+                '--atomic', 'origin', *refspecs
+            )
+            self.assertEqual(gh.repo.git.push.call_count, 2)
+
+            gh.repo.git.push.side_effect = github_tools.git.exc.GitCommandError(
+                'push', 1
+            )
+            with self.assertRaises(RuntimeError):
+                gh.push_atomic_with_retry(refspecs, attempts=2, cooloff=1)
+        m_time.sleep.assert_called_with(1)
+
+    def test_delete_remote_branches(self):
+        def push(*args, **kwargs):
+            names = args[3:]
+            if 'nope' in names:
+                return (
+                1, '',
+                "error: unable to delete 'nope': remote ref does not exist\n"
+            )
+            lines = ['To github.com:testorg/testrepo.git']
+            for name in names:
+                if name == 'protected':
+                    lines.append(
+                        '!\t:refs/heads/protected\t[remote rejected] (nope)'
+                    )
+                else:
+                    lines.append('-\t:refs/heads/{0}\t[deleted]'.format(name))
+            lines.append('Done')
+            return (0, '\n'.join(lines), '')
+
+        with github_tools.GitHubContext('.') as gh:
+            gh.repo.git.push.side_effect = push
+            deleted, failed = gh.delete_remote_branches(
+                ['a', 'nope', 'b', 'protected', 'c'], batch_size=4
+            )
+        self.assertEqual(deleted, ['a', 'b', 'c'])
+        self.assertEqual(dict(failed), {
+            'nope': "error: unable to delete 'nope': remote ref does not exist",
+            'protected': '[remote rejected] (nope)',
+        })
+        # [a nope b protected] is split to find the missing branch
+        self.assertEqual(
+            [x[0][3:] for x in gh.repo.git.push.call_args_list],
+            [
+                ('a', 'nope', 'b', 'protected'),
+                ('a', 'nope'),
+                ('a',),
+                ('nope',),
+                ('b', 'protected'),
+                ('c',)
+            ]
+        )
+
+    def test_delete_remote_branches_unreachable(self):
+        """a batch that fails for every branch isnt split"""
+        names = ['feature/{0}'.format(x) for x in range(64)]
+        with github_tools.GitHubContext('.') as gh:
+            gh.repo.git.push.return_value = (
+                128, '', "fatal: unable to access 'https://github.com/'\n"
+            )
+            deleted, failed = gh.delete_remote_branches(names, batch_size=16)
+        self.assertEqual(deleted, [])
+        self.assertEqual(list(failed), names)
+        self.assertEqual(
+            failed['feature/63'], "fatal: unable to access 'https://github.com/'"
+        )
+        self.assertEqual(gh.repo.git.push.call_count, 1)
+
     @mock.patch('cirrus.github_tools.time')
     def test_wait_on_gh_status_success(self, m_time):
         # returns a state which is one of 'failure', 'pending', 'success'
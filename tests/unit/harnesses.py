@@ -44,6 +44,63 @@ def write_cirrus_conf(config_file, **sections):
         parser.write(handle)
 
 
+def write_gitconfig(gitconfig_file, content):
+    """
+    _write_gitconfig_
+
+    Util to write a gitconfig file from content in the
+    section.param=value per line format of git config -l
+
+    """
+    with open(gitconfig_file, 'w') as handle:
+        for line in content.splitlines():
+            name, value = line.split('=', 1)
+            section, param = name.split('.', 1)
+            handle.write('[{0}]\n\t{1} = {2}\n'.format(section, param, value))
+
+
+#
+# identity used for commits in temporary test repos
+#
+GIT_IDENTITY = {
+    'GIT_AUTHOR_NAME': 'bob',
+    'GIT_AUTHOR_EMAIL': 'bob@example.com',
+    'GIT_COMMITTER_NAME': 'bob',
+    'GIT_COMMITTER_EMAIL': 'bob@example.com',
+}
+
+
+def run_git(repo, *args, env=None):
+    """
+    _run_git_
+
+    Util to run a git command in the repo directory with the test
+    identity, returning the stripped output. env is added to the
+    environment, eg GIT_AUTHOR_DATE for a fixed commit date.
+    repo may be None to run in the current directory.
+
+    """
+    git_env = dict(os.environ)
+    git_env.update(GIT_IDENTITY)
+    git_env.update(env or {})
+    return subprocess.check_output(
+        ('git',) + args, cwd=repo, env=git_env, universal_newlines=True
+    ).strip()
+
+
+def init_repo(repo, *args):
+    """
+    _init_repo_
+
+    Util to create a git repo with a master branch in the repo
+    directory, extra args are passed to git init, eg --bare
+
+    """
+    if not os.path.exists(repo):
+        os.makedirs(repo)
+    run_git(repo, 'init', '-q', '-b', 'master', *args)
+
+
 class CirrusConfigurationHarness(object):
     """
     CirrusConfigurationHarness
@@ -64,12 +121,16 @@ class CirrusConfigurationHarness(object):
     def setUp(self):
         self.mock_config = mock.patch(self.module_symbol)
         self.load_mock = self.mock_config.start()
-        self.patch_gitconfig = mock.patch('cirrus.gitconfig.shell_command')
-        self.mock_gitconfig = self.patch_gitconfig.start()
-        self.mock_gitconfig.return_value = self.gitconf_str
-        self.config = Configuration(self.config_file)
+        self.gitconfig_dir = tempfile.mkdtemp()
+        self.gitconfig_file = os.path.join(self.gitconfig_dir, '.gitconfig')
+        write_gitconfig(self.gitconfig_file, self.gitconf_str)
+        self.config = Configuration(
+            self.config_file, gitconfig_file=self.gitconfig_file
+        )
         self.config.load()
         self.load_mock.return_value = self.config
 
     def tearDown(self):
         self.mock_config.stop()
+        if os.path.exists(self.gitconfig_dir):
+            os.system('rm -rf {0}'.format(self.gitconfig_dir))
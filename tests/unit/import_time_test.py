@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+import time budget tests for the cirrus command modules
+
+Each module listed in the [commands] section of cirrus.conf is
+imported in a fresh interpreter with python -X importtime to check
+that heavy third party dependencies are deferred until used and that
+the import stays within a time budget.
+"""
+import os
+import sys
+import unittest
+import subprocess
+import configparser
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)
+)))
+SRC_DIR = os.path.join(REPO_DIR, 'src')
+
+#
+# third party packages that must be lazily imported by command modules
+#
+HEAVY_MODULES = [
+    'arrow',
+    'chef',
+    'dockerstache',
+    'fabric',
+    'git',
+    'invoke',
+    'pep8',
+    'pip',
+    'pkg_resources',
+    'pystache',
+    'requests',
+]
+
+#
+# cumulative import time budget per command module in microseconds
+#
+IMPORT_TIME_BUDGET = 150000
+
+
+def command_modules():
+    """list the modules providing the commands in cirrus.conf"""
+    parser = configparser.RawConfigParser()
+    parser.read(os.path.join(REPO_DIR, 'cirrus.conf'))
+    modules = set(
+        value.split(':', 1)[0].strip()
+        for _, value in parser.items('commands')
+    )
+    return sorted(modules)
+
+
+def import_times(module):
+    """
+    import module in a new interpreter with -X importtime
+
+    :returns: dict of module name: cumulative import time in us
+    """
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(
+        [SRC_DIR, env.get('PYTHONPATH', '')]
+    ).rstrip(os.pathsep)
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env
+    )
+    _, stderr = process.communicate()
+    if process.returncode:
+        raise RuntimeError(stderr.decode('utf-8'))
+    result = {}
+    for line in stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        result[name.strip()] = int(cumulative)
+    return result
+
+
+class ImportTimeTest(unittest.TestCase):
+    """
+    check the import cost of each command module
+    """
+    def test_command_modules(self):
+        """heavy deps are deferred and modules import within budget"""
+        modules = command_modules()
+        self.assertIn('cirrus.delegate', modules)
+        for module in modules:
+            times = import_times(module)
+            self.assertIn(module, times)
+            imported = set(name.split('.', 1)[0] for name in times)
+            for heavy in HEAVY_MODULES:
+                self.assertNotIn(
+                    heavy, imported,
+                    "{} imports {} at module level".format(module, heavy)
+                )
+            self.assertLess(
+                times[module], IMPORT_TIME_BUDGET,
+                "{} import took {}us".format(module, times[module])
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,21 +5,60 @@ keyring_plugin_tests
 Test coverage for the keyring creds plugin
 """
 
+import os
+import json
 import unittest
 from unittest import mock
-from cirrus.plugins.creds.keyring import Keyring
+from cirrus.plugins.creds.keyring import (
+    CREDENTIALS_SECRET,
+    Keyring,
+    clear_cache
+)
+
+
+class FakeKeyring(object):
+    """in memory keyring backend"""
+    def __init__(self, secrets=None):
+        self.secrets = secrets or {}
+        self.get_password = mock.Mock(side_effect=self._get)
+        self.set_password = mock.Mock(side_effect=self._set)
+        self.delete_password = mock.Mock(side_effect=self._delete)
+
+    def _get(self, service, username):
+        return self.secrets.get((service, username))
+
+    def _set(self, service, username, password):
+        self.secrets[(service, username)] = password
+
+    def _delete(self, service, username):
+        del self.secrets[(service, username)]
 
 
 class KeyringCredsTest(unittest.TestCase):
     """
     test coverage for keyring creds accessor
     """
+    def setUp(self):
+        clear_cache()
+        # keep a running creds agent out of the tests
+        self.patch_env = mock.patch.dict(
+            os.environ, {'CIRRUS_CREDS_AGENT_SOCK': ''}
+        )
+        self.patch_env.start()
+
+    def tearDown(self):
+        self.patch_env.stop()
+        clear_cache()
+
     @mock.patch('cirrus.plugins.creds.keyring.keyring')
     def test_keyring_plugin(self, mock_keyring):
         """test keyring plugin with mocked values for gh creds"""
-        mock_instance = mock.Mock()
-        mock_instance.get_password = mock.Mock()
-        mock_instance.get_password.side_effect = ['steve', 'steves token']
+        mock_instance = FakeKeyring({
+            ('cirrus', CREDENTIALS_SECRET): json.dumps({
+                'github-user': 'steve',
+                'github-token': 'steves token'
+            })
+        })
         mock_keyring.get_keyring = mock.Mock()
         mock_keyring.get_keyring.return_value = mock_instance
 
@@ -31,6 +70,11 @@ class KeyringCredsTest(unittest.TestCase):
         self.assertEqual(gh['github_user'], 'steve')
         self.assertEqual(gh['github_token'], 'steves token')
 
+        # all credentials come from one lookup, cached for the process
+        plugin.credential_map()
+        Keyring().credential_map()
+        self.assertEqual(mock_instance.get_password.call_count, 1)
+
     @mock.patch('cirrus.plugins.creds.keyring.keyring')
     def test_all_methods(self, mock_keyring):
         """test coverage for all methods"""
@@ -43,8 +87,87 @@ class KeyringCredsTest(unittest.TestCase):
         plugin = Keyring()
         for n, m in plugin.credential_methods():
             check = m()
-            self.assertTrue(all(v is 'womp' for v in list(check.values())))
+            self.assertTrue(all(v == 'womp' for v in list(check.values())))
+
+    @mock.patch('cirrus.plugins.creds.keyring.keyring')
+    def test_migration(self, mock_keyring):
+        """per field secrets are migrated to the single secret"""
+        mock_instance = FakeKeyring({
+            ('cirrus', 'github-user'): 'steve',
+            ('cirrus', 'pypi-token'): 'pypi',
+        })
+        mock_keyring.get_keyring.return_value = mock_instance
+
+        plugin = Keyring()
+        self.assertEqual(plugin.github_credentials()['github_user'], 'steve')
+        self.assertEqual(plugin.pypi_credentials()['token'], 'pypi')
+        self.assertEqual(
+            json.loads(mock_instance.secrets[('cirrus', CREDENTIALS_SECRET)]),
+            {'github-user': 'steve', 'pypi-token': 'pypi'}
+        )
+        # the migrated entries are removed
+        self.assertEqual(
+            list(mock_instance.secrets), [('cirrus', CREDENTIALS_SECRET)]
+        )
+
+        clear_cache()
+        mock_instance.get_password.reset_mock()
+        plugin = Keyring()
+        self.assertEqual(plugin.pypi_credentials()['token'], 'pypi')
+        mock_instance.get_password.assert_called_once_with(
+            'cirrus', CREDENTIALS_SECRET
+        )
+
+    @mock.patch('cirrus.plugins.creds.keyring.keyring')
+    def test_no_credentials(self, mock_keyring):
+        """an empty keyring isnt written to by reads"""
+        mock_instance = FakeKeyring()
+        mock_keyring.get_keyring.return_value = mock_instance
+        self.assertIsNone(Keyring().github_credentials()['github_user'])
+        self.assertFalse(mock_instance.set_password.called)
+        self.assertEqual(mock_instance.secrets, {})
+
+    @mock.patch('cirrus.plugins.creds.keyring.keyring')
+    def test_setting_credentials(self, mock_keyring):
+        """setters write the credentials secret once per batch"""
+        mock_instance = FakeKeyring()
+        mock_keyring.get_keyring.return_value = mock_instance
+        plugin = Keyring()
+        with plugin.batch():
+            plugin.set_github_credentials('steve', 'token')
+            plugin.set_chef_credentials('server', 'steve', 'key.pem')
+        # nothing to migrate, one write for the batch
+        self.assertEqual(mock_instance.set_password.call_count, 1)
+        self.assertEqual(plugin.github_credentials()['github_token'], 'token')
+        self.assertEqual(
+            json.loads(
+                mock_instance.secrets[('cirrus', CREDENTIALS_SECRET)]
+            )['chef-client-keyfile'],
+            'key.pem'
+        )
+
+    @mock.patch('cirrus.creds_plugin.agent_put')
+    @mock.patch('cirrus.creds_plugin.agent_get')
+    @mock.patch('cirrus.plugins.creds.keyring.keyring')
+    def test_creds_agent(self, mock_keyring, mock_get, mock_put):
+        """credentials are shared with later commands by the agent"""
+        mock_instance = FakeKeyring({
+            ('cirrus', CREDENTIALS_SECRET): json.dumps({'github-user': 'steve'})
+        })
+        mock_keyring.get_keyring.return_value = mock_instance
+        mock_get.return_value = None
+        Keyring().github_credentials()
+        mock_get.assert_called_once_with('keyring:cirrus')
+        mock_put.assert_called_once_with(
+            'keyring:cirrus', {'github-user': 'steve'}
+        )
 
+        # a later command gets them from the agent
+        clear_cache()
+        mock_get.return_value = {'github-user': 'agent'}
+        gh = Keyring().github_credentials()
+        self.assertEqual(gh['github_user'], 'agent')
+        self.assertEqual(mock_instance.get_password.call_count, 1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+tests for prestage repo clones
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+from cirrus.prestage import (
+    CREDENTIAL_ARGS,
+    GitCommandError,
+    clone_repos,
+    git_clone_repo,
+    github_auth_env,
+    install_from_repo,
+    mirror_cache_dir,
+    mirror_path
+)
+
+from .harnesses import init_repo, run_git
+
+
+class GitCloneRepoTest(unittest.TestCase):
+    """
+    clones of a local repo standing in for github
+    """
+    def setUp(self):
+        self.dir = os.path.realpath(tempfile.mkdtemp())
+        self.origin = os.path.join(self.dir, 'origin')
+        self.cache = os.path.join(self.dir, 'mirrors')
+        self.clone = os.path.join(self.dir, 'prestage', 'womp')
+        init_repo(self.origin)
+        run_git(self.origin, 'config', 'uploadpack.allowFilter', 'true')
+        self.commit('0.1.0')
+        self.patch_url = mock.patch(
+            'cirrus.prestage.github_clone_url',
+            new=lambda x: 'file://{0}'.format(self.origin)
+        )
+        self.patch_url.start()
+        self.patch_auth = mock.patch(
+            'cirrus.prestage.get_github_auth',
+            return_value=('bob', 'SECRETTOKEN')
+        )
+        self.mock_auth = self.patch_auth.start()
+
+    def tearDown(self):
+        self.patch_url.stop()
+        self.patch_auth.stop()
+        shutil.rmtree(self.dir)
+
+    def commit(self, tag):
+        with open(os.path.join(self.origin, 'version'), 'w') as handle:
+            handle.write(tag)
+        run_git(self.origin, 'add', 'version')
+        run_git(self.origin, 'commit', '-q', '-m', tag)
+        run_git(self.origin, 'tag', tag)
+
+    def version(self):
+        with open(os.path.join(self.clone, 'version')) as handle:
+            return handle.read()
+
+    def test_mirror_clones(self):
+        """clones use the mirror and are updated in place"""
+        git_clone_repo(
+            'github.com/org/womp.git', self.clone, tag='0.1.0',
+            cache_dir=self.cache
+        )
+        mirror = mirror_path(self.cache, 'github.com/org/womp.git')
+        self.assertTrue(os.path.basename(mirror).startswith(
+            'github.com-org-womp.git-'
+        ))
+        self.assertTrue(os.path.isdir(os.path.join(mirror, 'refs')))
+        self.assertEqual(self.version(), '0.1.0')
+        # the clone doesnt depend on the mirror
+        self.assertFalse(os.path.exists(os.path.join(
+            self.clone, '.git', 'objects', 'info', 'alternates'
+        )))
+
+        self.commit('0.2.0')
+        with open(os.path.join(self.clone, 'marker'), 'w') as handle:
+            handle.write('womp')
+        git_clone_repo(
+            'github.com/org/womp.git', self.clone, tag='0.2.0',
+            cache_dir=self.cache
+        )
+        self.assertEqual(self.version(), '0.2.0')
+        # updated, not cloned again
+        self.assertTrue(os.path.exists(os.path.join(self.clone, 'marker')))
+
+        git_clone_repo(
+            'github.com/org/womp.git', self.clone, cache_dir=self.cache
+        )
+        self.assertEqual(
+            run_git(self.clone, 'rev-parse', '--abbrev-ref', 'HEAD'), 'master'
+        )
+
+    def test_partial_clones(self):
+        """without a mirror tags are shallow partial clones"""
+        git_clone_repo('github.com/org/womp.git', self.clone, tag='0.1.0')
+        self.assertEqual(self.version(), '0.1.0')
+        self.assertTrue(
+            os.path.exists(os.path.join(self.clone, '.git', 'shallow'))
+        )
+        self.commit('0.2.0')
+        git_clone_repo('github.com/org/womp.git', self.clone, tag='0.2.0')
+        self.assertEqual(self.version(), '0.2.0')
+
+    def test_credentials(self):
+        """credentials come from the environment, not the url"""
+        output = subprocess.run(
+            ('git',) + CREDENTIAL_ARGS + ('credential', 'fill'),
+            input='protocol=https\nhost=github.com\n\n',
+            env=github_auth_env(),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            check=True
+        ).stdout
+        self.assertIn('username=bob\n', output)
+        self.assertIn('password=SECRETTOKEN\n', output)
+
+        git_clone_repo(
+            'github.com/org/womp.git', self.clone, cache_dir=self.cache
+        )
+        mirror = mirror_path(self.cache, 'github.com/org/womp.git')
+        for path in (mirror, self.clone):
+            self.assertNotIn(
+                'SECRETTOKEN', run_git(path, 'config', 'remote.origin.url')
+            )
+
+    @mock.patch('cirrus.prestage.LOGGER')
+    def test_clone_errors(self, mock_logger):
+        """failed clones are reported without the credentials"""
+        with mock.patch(
+                'cirrus.prestage.github_clone_url',
+                new=lambda x: 'file://bob:SECRETTOKEN@{0}/nope'.format(
+                    self.dir
+                )):
+            with self.assertRaises(GitCommandError) as context:
+                git_clone_repo(
+                    'github.com/org/nope.git', self.clone,
+                    cache_dir=self.cache
+                )
+        self.assertEqual(
+            str(context.exception), 'git clone failed with exit code 128'
+        )
+        self.assertTrue(mock_logger.info.called)
+        for call in mock_logger.info.call_args_list:
+            self.assertNotIn('SECRETTOKEN', str(call))
+
+    def test_mirror_cache_dir(self):
+        with mock.patch.dict(os.environ, {'CIRRUS_MIRROR_CACHE': ''}):
+            self.assertIsNone(mirror_cache_dir())
+        with mock.patch.dict(os.environ, {'CIRRUS_MIRROR_CACHE': self.cache}):
+            self.assertEqual(mirror_cache_dir(), self.cache)
+
+    def test_clone_repos(self):
+        """repos are cloned in parallel and failures are collected"""
+        repo_cache = os.path.join(self.dir, 'prestage')
+        self.commit('0.2.0')
+        with mock.patch(
+                'cirrus.prestage.github_clone_url',
+                new=lambda x: 'file://{0}/{1}'.format(
+                    self.dir, 'origin' if 'womp' in x else 'missing'
+                )):
+            clones, failures = clone_repos(
+                [
+                    ('womp', 'github.com/org/womp.git', '0.1.0'),
+                    ('wompwomp', 'github.com/org/womp.git', None),
+                    ('nope', 'github.com/org/nope.git', None),
+                ],
+                repo_cache,
+                cache_dir=self.cache,
+                jobs=3
+            )
+        self.assertEqual(clones, [
+            os.path.join(repo_cache, 'womp'),
+            os.path.join(repo_cache, 'wompwomp'),
+        ])
+        self.assertEqual(list(failures), ['nope'])
+        self.mock_auth.assert_called_once_with()
+        self.assertIsInstance(failures['nope'], subprocess.CalledProcessError)
+        self.assertEqual(self.version(), '0.1.0')
+        with open(os.path.join(repo_cache, 'wompwomp', 'version')) as handle:
+            self.assertEqual(handle.read(), '0.2.0')
+
+    @mock.patch('cirrus.prestage.subprocess.check_call')
+    def test_install_from_repo(self, mock_call):
+        """repos are installed with a single pip install"""
+        install_from_repo('venv/bin/activate', 'a/womp', 'a/wompwomp')
+        mock_call.assert_called_once_with(
+            '. venv/bin/activate && pip install -e a/womp -e a/wompwomp',
+            shell=True
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
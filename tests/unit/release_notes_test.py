@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+tests for the release notes formatters
+"""
+import io
+import json
+import unittest
+
+from cirrus.git_session import CommitRecord
+from cirrus.release_notes import (
+    FORMATTERS,
+    JSONFormatter,
+    MarkdownFormatter,
+    PlaintextFormatter,
+    RestructuredTextFormatter,
+    get_formatter,
+    group_by_committer
+)
+
+
+class ReleaseNotesTest(unittest.TestCase):
+    """
+    test coverage for the formatters
+    """
+    def setUp(self):
+        self.rows = [
+            {'committer': 'bob', 'message': 'newer', 'date': '2015-07-30'},
+            {'committer': 'tom', 'message': 'toms commit', 'date': '2015-07-29'},
+            {'committer': 'bob', 'message': 'older\n\ndetail', 'date': '2015-07-28'},
+        ]
+
+    def test_group_by_committer(self):
+        """authors are grouped even when their commits arent adjacent"""
+        groups = group_by_committer(iter(self.rows))
+        self.assertEqual(list(groups), ['bob', 'tom'])
+        self.assertEqual(
+            [x['message'] for x in groups['bob']], ['newer', 'older\n\ndetail']
+        )
+
+    def test_group_records(self):
+        """CommitRecords are sorted by timestamp without formatting dates"""
+        records = [
+            CommitRecord('a', 'bob', 'bob', 999999999, 'older'),
+            CommitRecord('b', 'bob', 'bob', 1438210783, 'newer'),
+        ]
+        groups = group_by_committer(records)
+        self.assertEqual([x.sha for x in groups['bob']], ['b', 'a'])
+        self.assertEqual([x._date for x in records], [None, None])
+
+    def test_plaintext(self):
+        self.assertEqual(
+            PlaintextFormatter.format(self.rows),
+            ' - Commit History:\n'
+            ' -- Author: bob\n'
+            ' --- 2015-07-30: newer\n'
+            ' --- 2015-07-28: older\n\ndetail\n'
+            ' -- Author: tom\n'
+            ' --- 2015-07-29: toms commit'
+        )
+
+    def test_markdown(self):
+        self.assertEqual(
+            MarkdownFormatter.format(self.rows[1:2]),
+            'Commit History\n==============\n'
+            '\nAuthor: tom\n-----------\n'
+            '\n2015-07-29: toms commit'
+        )
+
+    def test_rst(self):
+        self.assertEqual(
+            RestructuredTextFormatter.format(self.rows),
+            'Commit History\n==============\n'
+            '\nAuthor: bob\n-----------\n\n'
+            '* 2015-07-30: newer\n'
+            '* 2015-07-28: older\n  \n  detail\n'
+            '\nAuthor: tom\n-----------\n\n'
+            '* 2015-07-29: toms commit'
+        )
+
+    def test_json(self):
+        """json output is written to the stream as it goes"""
+        stream = io.StringIO()
+        record = CommitRecord('abc', 'steve', 'bob', 1438210783, 'hello\n')
+        JSONFormatter(stream).write(self.rows + [record])
+        data = json.loads(stream.getvalue())
+        self.assertEqual([x['author'] for x in data], ['bob', 'tom'])
+        self.assertEqual(
+            data[0]['commits'][1],
+            {
+                'sha': 'abc',
+                'date': '2015-07-29T22:59:43+00:00',
+                'message': 'hello\n'
+            }
+        )
+        self.assertEqual(len(data[0]['commits']), 3)
+        self.assertEqual(json.loads(JSONFormatter.format([])), [])
+
+    def test_iterate(self):
+        """notes can be produced in chunks"""
+        for formatter in FORMATTERS.values():
+            chunks = list(formatter.iterate(iter(self.rows)))
+            self.assertGreaterEqual(len(chunks), 5)
+            self.assertEqual(''.join(chunks), formatter.format(self.rows))
+
+    def test_get_formatter(self):
+        self.assertEqual(
+            list(FORMATTERS), ['plaintext', 'markdown', 'rst', 'json']
+        )
+        self.assertIs(get_formatter('rst'), RestructuredTextFormatter)
+        self.assertRaises(ValueError, get_formatter, 'womp')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,7 @@ from cirrus.release import (
     artifact_name,
     build_and_upload,
     build_release,
+    merge_release,
     new_release,
     upload_release
 )
@@ -68,6 +69,7 @@ class ReleaseNewCommandTest(TestCase):
         opts.minor = False
         opts.release_candidate = False
         opts.bump = None
+        opts.worktree = False
 
         # should create a new minor release, editing
         # the cirrus config in the test dir
@@ -105,6 +107,7 @@ class ReleaseNewCommandTest(TestCase):
         opts.minor = False
         opts.release_candidate = False
         opts.bump = None
+        opts.worktree = False
         self.assertRaises(RuntimeError, new_release, opts)
 
 
@@ -368,6 +371,89 @@ class ReleaseBuildAndUploadTest(TestCase):
         ])
 
 
+class ReleaseMergeCommandTest(TestCase):
+    """
+    test case for cirrus release merge command
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.config = os.path.join(self.dir, 'cirrus.conf')
+        write_cirrus_conf(self.config,
+            **{
+                'package': {'name': 'cirrus_unittest', 'version': '1.2.3'},
+                'gitflow': {
+                    'develop_branch': 'develop',
+                    'release_branch_prefix': 'release/'
+                }
+            }
+        )
+        self.harness = CirrusConfigurationHarness(
+            'cirrus.release.load_configuration', self.config
+        )
+        self.harness.setUp()
+        self.patch_ghc = mock.patch('cirrus.release.GitHubContext')
+        self.mock_ghc = self.patch_ghc.start()
+        self.ghc = self.mock_ghc.return_value.__enter__.return_value
+        self.ghc.active_branch_name = 'release/1.2.3'
+        self.opts = mock.Mock(
+            wait_on_ci=False,
+            github_context_string=None,
+            github_develop_context_string=None,
+            github_master_context_string=None,
+            skip_master=False,
+            skip_develop=False,
+            log_status=False,
+            cleanup=True,
+            atomic_push=False,
+            worktree=False
+        )
+
+    def tearDown(self):
+        self.patch_ghc.stop()
+        self.harness.tearDown()
+        if os.path.exists(self.dir):
+            os.system('rm -rf {0}'.format(self.dir))
+
+    def test_merge_release(self):
+        """branches and tags are pushed as they are updated"""
+        merge_release(self.opts)
+        self.assertEqual(self.ghc.push_branch_with_retry.call_count, 2)
+        self.ghc.tag_release.assert_called_with('1.2.3', 'master', push=True)
+        self.ghc.delete_branch.assert_called_with('release/1.2.3')
+        self.assertFalse(self.ghc.push_atomic_with_retry.called)
+
+    @mock.patch('cirrus.release.in_release_worktree')
+    def test_merge_release_worktree(self, mock_in_wt):
+        """merges can run in the package release worktree"""
+        self.opts.worktree = True
+        merge_release(self.opts)
+        mock_in_wt.assert_called_with(
+            mock.ANY, 'release/1.2.3', ['release/1.2.3', 'master', 'develop']
+        )
+        self.assertTrue(mock_in_wt.return_value.__enter__.called)
+        self.assertEqual(self.ghc.push_branch_with_retry.call_count, 2)
+
+    def test_merge_release_atomic(self):
+        """everything is pushed in a single atomic push"""
+        self.opts.atomic_push = True
+        merge_release(self.opts)
+        self.assertFalse(self.ghc.push_branch_with_retry.called)
+        self.ghc.tag_release.assert_called_with('1.2.3', 'master', push=False)
+        self.ghc.push_atomic_with_retry.assert_called_once_with(
+            [
+                'refs/heads/master:refs/heads/master',
+                'refs/tags/1.2.3:refs/tags/1.2.3',
+                'refs/heads/develop:refs/heads/develop',
+                ':refs/heads/release/1.2.3'
+            ],
+            attempts=1,
+            cooloff=0
+        )
+        self.ghc.delete_branch.assert_called_with(
+            'release/1.2.3', remote=False
+        )
+
+
 class ArtifactNameTests(TestCase):
     """
     Tests for artifact_name
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+tests for the cirrus server and its client
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import tempfile
+import unittest
+
+from cirrus.server import CommandServer, forward, server_status
+
+
+def fake_command():
+    """command entry point run by the server"""
+    print("argv={0}".format(sys.argv))
+    print("cwd={0}".format(os.getcwd()))
+    print("env={0}".format(os.environ.get('CIRRUS_SERVER_TEST')))
+    return 3
+
+
+class CommandServerTest(unittest.TestCase):
+    """
+    run a server in a child process and forward commands to it
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sock = os.path.join(self.dir, 'server.sock')
+        self.out = os.path.join(self.dir, 'out.txt')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                CommandServer(self.sock, idle_timeout=60).run()
+            finally:
+                os._exit(0)
+        for _ in range(100):
+            if server_status(self.sock) is not None:
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        os.kill(self.pid, signal.SIGTERM)
+        os.waitpid(self.pid, 0)
+        if os.path.exists(self.dir):
+            os.system('rm -rf {0}'.format(self.dir))
+
+    def test_status(self):
+        """status reports the server pid"""
+        status = server_status(self.sock)
+        self.assertEqual(status['status'], 'ok')
+        self.assertEqual(status['pid'], self.pid)
+
+    def test_forward(self):
+        """command runs in the server with the client cwd, env and stdio"""
+        os.environ['CIRRUS_SERVER_TEST'] = 'womp'
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            with open(os.devnull) as stdin, open(self.out, 'w') as stdout:
+                result = forward(
+                    'hello',
+                    '/venv/bin/hello',
+                    '{0}:fake_command'.format(__name__),
+                    ['--thing'],
+                    fds=(stdin.fileno(), stdout.fileno(), stdout.fileno()),
+                    path=self.sock
+                )
+        finally:
+            os.chdir(cwd)
+            del os.environ['CIRRUS_SERVER_TEST']
+        self.assertEqual(result, 3)
+        with open(self.out) as handle:
+            output = handle.read().splitlines()
+        self.assertEqual(output, [
+            "argv=['/venv/bin/hello', '--thing']",
+            "cwd={0}".format(os.path.realpath(self.dir)),
+            "env=womp"
+        ])
+
+    def test_not_running(self):
+        """client falls back when there is no server"""
+        missing = os.path.join(self.dir, 'missing.sock')
+        self.assertIsNone(server_status(missing))
+        self.assertIsNone(
+            forward('hello', 'hello', 'x:main', [], path=missing)
+        )
+        self.assertIsNone(
+            forward('selfupdate', 'selfupdate', 'x:main', [], path=self.sock)
+        )
+
+
+
+class LegacySocketServerTest(CommandServerTest):
+    """
+    the same tests without socket.send_fds and recv_fds,
+    as on python versions before 3.9
+    """
+    def setUp(self):
+        self.removed = {}
+        for name in ('send_fds', 'recv_fds'):
+            if hasattr(socket, name):
+                self.removed[name] = getattr(socket, name)
+                delattr(socket, name)
+        super(LegacySocketServerTest, self).setUp()
+
+    def tearDown(self):
+        super(LegacySocketServerTest, self).tearDown()
+        for name, value in self.removed.items():
+            setattr(socket, name, value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+tests for cirrus.utils
+"""
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cirrus.utils import chdir, update_file
+
+
+class UpdateFileTest(unittest.TestCase):
+    """
+    test coverage for update_file
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'HISTORY.md')
+        self.content = 'Header\r\nREPLACEME\n\nOld release\nREPLACEME\n'
+        with open(self.filename, 'w', newline='') as handle:
+            handle.write(self.content)
+        os.chmod(self.filename, 0o640)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self):
+        with open(self.filename, 'r', newline='') as handle:
+            return handle.read()
+
+    def test_update_file(self):
+        """text is added after the first sentinel"""
+        update_file(self.filename, 'REPLACEME', 'new text')
+        self.assertEqual(
+            self.read(),
+            'Header\r\nREPLACEME\n\nnew text\n\nOld release\nREPLACEME\n'
+        )
+        self.assertEqual(stat.S_IMODE(os.stat(self.filename).st_mode), 0o640)
+        self.assertEqual(os.listdir(self.dir), ['HISTORY.md'])
+
+    def test_update_file_chunks(self):
+        """sentinels split across chunks are found, text can be chunks"""
+        for size in range(1, 12):
+            with open(self.filename, 'w', newline='') as handle:
+                handle.write(self.content)
+            with mock.patch('cirrus.utils.COPY_CHUNK_SIZE', size):
+                update_file(self.filename, 'REPLACEME', iter(['new', ' text']))
+            self.assertEqual(
+                self.read(),
+                'Header\r\nREPLACEME\n\nnew text\n\nOld release\nREPLACEME\n'
+            )
+
+    def test_missing_sentinel(self):
+        """the file is unchanged if the sentinel isnt there"""
+        update_file(self.filename, 'WOMP', 'new text')
+        self.assertEqual(self.read(), self.content)
+        self.assertEqual(os.listdir(self.dir), ['HISTORY.md'])
+
+    def test_failure(self):
+        """the original file is kept if the text cant be produced"""
+        def text():
+            yield 'new'
+            raise RuntimeError('womp')
+        self.assertRaises(
+            RuntimeError, update_file, self.filename, 'REPLACEME', text()
+        )
+        self.assertEqual(self.read(), self.content)
+        self.assertEqual(os.listdir(self.dir), ['HISTORY.md'])
+
+
+class ChdirTest(unittest.TestCase):
+    """
+    test coverage for chdir
+    """
+    def test_chdir(self):
+        cwd = os.getcwd()
+        dirname = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, dirname)
+        with self.assertRaises(ValueError):
+            with chdir(dirname):
+                self.assertEqual(os.getcwd(), dirname)
+                raise ValueError('womp')
+        self.assertEqual(os.getcwd(), cwd)
+        with chdir():
+            self.assertEqual(os.getcwd(), cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+tests for the worktree helpers
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from cirrus.worktrees import (
+    check_branches_free,
+    list_worktrees,
+    worktree,
+    worktree_path
+)
+
+from .harnesses import init_repo, run_git
+
+
+class WorktreesTest(unittest.TestCase):
+    """
+    worktrees of a real repo
+    """
+    def setUp(self):
+        self.dir = os.path.realpath(tempfile.mkdtemp())
+        init_repo(self.dir)
+        run_git(self.dir, 'commit', '-q', '--allow-empty', '-m', 'first')
+        run_git(self.dir, 'branch', 'develop')
+        run_git(self.dir, 'commit', '-q', '--allow-empty', '-m', 'second')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_worktree(self):
+        """worktrees are added, reused while unchanged and detached"""
+        expected = os.path.join(
+            self.dir, '.git', 'cirrus-worktrees', 'release-my-package'
+        )
+        self.assertEqual(
+            worktree_path(self.dir, 'release/my package'), expected
+        )
+        with worktree(self.dir, 'release/my package', 'develop') as path:
+            self.assertEqual(path, expected)
+            self.assertEqual(
+                run_git(path, 'rev-parse', '--abbrev-ref', 'HEAD'),
+                'develop'
+            )
+            self.assertEqual(
+                list_worktrees(self.dir)[path]['branch'], 'develop'
+            )
+            # the main checkout is untouched
+            self.assertEqual(
+                run_git(self.dir, 'rev-parse', '--abbrev-ref', 'HEAD'),
+                'master'
+            )
+            with open(os.path.join(path, 'marker'), 'w') as handle:
+                handle.write('womp')
+            run_git(path, 'add', 'marker')
+            run_git(path, 'commit', '-q', '-m', 'marker')
+
+        self.assertIsNone(list_worktrees(self.dir)[expected]['branch'])
+        self.assertIn(
+            'marker', run_git(self.dir, 'log', '--format=%s', 'develop')
+        )
+
+        # unchanged worktrees are reused
+        first = run_git(self.dir, 'rev-parse', 'master~1')
+        with worktree(self.dir, 'release/my package', first) as path:
+            self.assertEqual(run_git(path, 'rev-parse', 'HEAD'), first)
+            self.assertTrue(os.path.exists(os.path.join(path, '.git')))
+            self.assertFalse(os.path.exists(os.path.join(path, 'marker')))
+            with open(os.path.join(path, 'untracked'), 'w') as handle:
+                handle.write('womp')
+
+        # changed ones are recreated
+        with worktree(self.dir, 'release/my package', 'develop') as path:
+            self.assertFalse(os.path.exists(os.path.join(path, 'untracked')))
+            self.assertTrue(os.path.exists(os.path.join(path, 'marker')))
+
+    def test_check_branches_free(self):
+        """branches checked out elsewhere cant be used"""
+        path = worktree_path(self.dir, 'womp')
+        check_branches_free(self.dir, ['develop'])
+        self.assertRaises(
+            RuntimeError, check_branches_free, self.dir, ['develop', 'master']
+        )
+        with worktree(self.dir, 'womp', 'develop'):
+            check_branches_free(self.dir, ['develop'], path=path)
+            self.assertRaises(
+                RuntimeError, check_branches_free, self.dir, ['develop']
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()